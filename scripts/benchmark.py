@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Benchmarks of the parsing and querying hot paths.
+
+Times are divided by the time of a fixed pure python loop measured in the
+same run, so results from different machines can be compared with the
+committed baseline in benchmark_baseline.json.
+
+    python -m scripts.benchmark            # Run and compare with the baseline.
+    python -m scripts.benchmark -k Sleep   # Only benchmarks matching Sleep.
+    python -m scripts.benchmark --save     # Replace the baseline.
+"""
+import argparse
+from functools import partial
+from itertools import cycle
+import json
+from os import path
+import platform
+import sys
+import timeit
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from typing_extensions import Final
+from withings_api import synthetic
+from withings_api.codec import CODECS
+from withings_api.common import (
+    ArrowType,
+    HeartGetResponse,
+    HeartListResponse,
+    MeasureGetActivityResponse,
+    MeasureGetMeasResponse,
+    MeasureType,
+    NotifyListResponse,
+    SleepGetResponse,
+    SleepGetSummaryResponse,
+    TimeZone,
+    UserGetDeviceResponse,
+    get_measure_value,
+    query_measure_groups,
+    response_body_or_raise,
+)
+from withings_api.ecg import analyze_ecg
+from withings_api.fast import decode_measure_get_meas, decode_sleep_get
+
+BASELINE_FILE: Final = path.join(
+    path.dirname(path.abspath(__file__)), "benchmark_baseline.json"
+)
+
+BenchmarkType = Callable[[], Any]
+
+
+def calibration() -> int:
+    """Do a fixed amount of pure python work."""
+    total = 0
+    for index in range(10000):
+        total += index % 7
+    return total
+
+
+def benchmarks() -> Dict[str, BenchmarkType]:
+    """Build every benchmark with its payload."""
+    meas: Final = synthetic.measure_get_meas_body(count=1000)
+    meas_response: Final = MeasureGetMeasResponse(**meas)
+    wrapped_meas: Final = synthetic.response(meas)
+    activity: Final = synthetic.measure_get_activity_body(count=365)
+    summary: Final = synthetic.sleep_get_summary_body(count=365)
+    sleep: Final = synthetic.sleep_get_body(count=100, samples=60)
+    heart_list: Final = synthetic.heart_list_body(count=100)
+    heart: Final = synthetic.heart_get_body(samples=30000)
+    heart_response: Final = HeartGetResponse(**heart)
+    devices: Final = synthetic.user_get_device_body(count=10)
+    profiles: Final = synthetic.notify_list_body(count=10)
+    # Five minutes apart over a year, more than the timestamp caches hold.
+    epochs: Final = range(1577836800, 1577836800 + 365 * 86400, 300)
+    next_epoch: Final = cycle(epochs).__next__
+    next_digits: Final = cycle(str(epoch) for epoch in epochs).__next__
+
+    codec_benchmarks: Final[Dict[str, BenchmarkType]] = {}
+    for codec in CODECS.values():
+        for payload_name, payload in (
+            ("getmeas[1000]", codec.dumps(synthetic.response(meas))),
+            ("sleep get[100x60]", codec.dumps(synthetic.response(sleep))),
+        ):
+            codec_benchmarks["%s.loads %s" % (codec.name, payload_name)] = partial(
+                codec.loads, payload
+            )
+        codec_benchmarks["%s.dumps getmeas[1000]" % codec.name] = partial(
+            codec.dumps, wrapped_meas
+        )
+
+    return {
+        **codec_benchmarks,
+        "response_body_or_raise": lambda: response_body_or_raise(wrapped_meas),
+        "MeasureGetMeasResponse[1000]": lambda: MeasureGetMeasResponse(**meas),
+        "MeasureGetActivityResponse[365]": lambda: MeasureGetActivityResponse(
+            **activity
+        ),
+        "SleepGetSummaryResponse[365]": lambda: SleepGetSummaryResponse(**summary),
+        "SleepGetResponse[100x60]": lambda: SleepGetResponse(**sleep),
+        "HeartListResponse[100]": lambda: HeartListResponse(**heart_list),
+        "HeartGetResponse[30000]": lambda: HeartGetResponse(**heart),
+        "analyze_ecg[30000]": lambda: analyze_ecg(heart_response),
+        "UserGetDeviceResponse[10]": lambda: UserGetDeviceResponse(**devices),
+        "NotifyListResponse[10]": lambda: NotifyListResponse(**profiles),
+        "decode_measure_get_meas[1000]": lambda: decode_measure_get_meas(meas),
+        "decode_sleep_get[100x60]": lambda: decode_sleep_get(sleep),
+        "decode_sleep_get[100x60] lazy": lambda: decode_sleep_get(
+            sleep, lazy_timestamps=True
+        ),
+        "query_measure_groups[1000]": lambda: query_measure_groups(
+            meas_response, MeasureType.WEIGHT
+        ),
+        "get_measure_value[1000]": lambda: get_measure_value(
+            meas_response, MeasureType.WEIGHT
+        ),
+        "ArrowType.validate(int)": lambda: ArrowType.validate(next_epoch()),
+        "ArrowType.validate(int) cached": lambda: ArrowType.validate(1577836800),
+        "ArrowType.validate(digits)": lambda: ArrowType.validate(next_digits()),
+        "ArrowType.validate(date)": lambda: ArrowType.validate("2020-01-01"),
+        "TimeZone.validate": lambda: TimeZone.validate("Europe/London"),
+    }
+
+
+def measure(function: BenchmarkType, repeat: int) -> float:
+    """Get the best time of a call, in seconds."""
+    timer: Final = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def load_baseline() -> Optional[Dict[str, Any]]:
+    """Load the committed baseline, if any."""
+    if not path.isfile(BASELINE_FILE):
+        return None
+
+    with open(BASELINE_FILE, encoding="utf-8") as file_handle:
+        return dict(json.load(file_handle))
+
+
+def save_baseline(results: Dict[str, float]) -> None:
+    """Replace the committed baseline."""
+    with open(BASELINE_FILE, "w", encoding="utf-8") as file_handle:
+        json.dump(
+            {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "results": results,
+            },
+            file_handle,
+            indent=2,
+            sort_keys=True,
+        )
+        file_handle.write("\n")
+
+
+def main() -> None:
+    """Run main function."""
+    parser: Final = argparse.ArgumentParser(description="Run the benchmarks.")
+    parser.add_argument(
+        "-k", dest="keyword", default="", help="Only run benchmarks matching this."
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="Timings taken per benchmark."
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1.3,
+        help="Ratio to the baseline reported as a regression.",
+    )
+    parser.add_argument(
+        "--save", action="store_true", help="Save the results as the baseline."
+    )
+    args: Final = parser.parse_args()
+
+    unit: Final = measure(calibration, args.repeat)
+    baseline: Final = load_baseline()
+    baseline_results: Final[Dict[str, float]] = (
+        baseline["results"] if baseline else {}
+    )
+    results: Final[Dict[str, float]] = {}
+    regressions: Final[List[Tuple[str, float]]] = []
+
+    print("%-36s %12s %10s %10s" % ("benchmark", "usec", "relative", "baseline"))
+    for name, function in benchmarks().items():
+        if args.keyword not in name:
+            continue
+
+        seconds = measure(function, args.repeat)
+        relative = seconds / unit
+        results[name] = float("%.4g" % relative)
+        expected = baseline_results.get(name)
+        ratio = relative / expected if expected else None
+        print(
+            "%-36s %12.2f %10.4f %10s"
+            % (
+                name,
+                seconds * 1e6,
+                relative,
+                "-" if ratio is None else "%.2fx" % ratio,
+            )
+        )
+        if ratio is not None and ratio > args.tolerance:
+            regressions.append((name, ratio))
+
+    if args.save:
+        save_baseline({**baseline_results, **results})
+        print("Saved baseline in:", BASELINE_FILE)
+        return
+
+    for name, ratio in regressions:
+        print("Regression: %s is %.2fx the baseline." % (name, ratio))
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
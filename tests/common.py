@@ -1,11 +1,90 @@
 """Common test code."""
 from datetime import tzinfo
-from typing import cast
+import json
+import re
+import time
+from typing import Any, Dict, List, Tuple, cast
+from urllib import parse
 
 from dateutil import tz
+import responses
 from typing_extensions import Final
+from withings_api.common import Credentials2
 
 TIMEZONE_STR0: Final = "Europe/London"
 TIMEZONE_STR1: Final = "America/Los_Angeles"
 TIMEZONE0: Final = cast(tzinfo, tz.gettz(TIMEZONE_STR0))
 TIMEZONE1: Final = cast(tzinfo, tz.gettz(TIMEZONE_STR1))
+
+
+def new_credentials(
+    userid: int = 1, expires_in: int = 10000, **kwargs: Any
+) -> Credentials2:
+    """Create test credentials, kwargs override their other fields."""
+    return Credentials2(
+        **{
+            "access_token": "my_access_token",
+            "expires_in": expires_in,
+            "token_type": "Bearer",
+            "refresh_token": "my_refresh_token",
+            "userid": userid,
+            "client_id": "my_client_id",
+            "consumer_secret": "my_consumer_secret",
+            **kwargs,
+        }
+    )
+
+
+class FakeClock:
+    """A clock which only moves when told to."""
+
+    def __init__(self, now: float = 1000.0) -> None:
+        """Initialize new object."""
+        self.now = now
+        self.sleeps: List[float] = []
+
+    def __call__(self) -> float:
+        """Get the current time."""
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        """Record and advance time."""
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def add_slow_refresh(delay: float = 0.05) -> List[str]:
+    """
+    Answer token refreshes after delay seconds.
+
+    Gets the refresh tokens used, in order. The delay keeps a refresh running
+    while other threads find the token expired.
+    """
+    refresh_tokens: Final[List[str]] = []
+
+    def callback(request: Any) -> Tuple[int, Dict[str, str], str]:
+        refresh_tokens.append(dict(parse.parse_qsl(request.body))["refresh_token"])
+        time.sleep(delay)
+        return (
+            200,
+            {},
+            json.dumps(
+                {
+                    "status": 0,
+                    "body": {
+                        "access_token": "my_access_token_refreshed",
+                        "expires_in": 10800,
+                        "token_type": "Bearer",
+                        "refresh_token": "my_refresh_token_refreshed",
+                        "userid": 1,
+                    },
+                }
+            ),
+        )
+
+    responses.add_callback(
+        method=responses.POST,
+        url=re.compile("https://wbsapi.withings.net/v2/oauth2.*"),
+        callback=callback,
+    )
+    return refresh_tokens
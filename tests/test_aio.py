@@ -0,0 +1,310 @@
+"""Tests for the asyncio API."""
+import asyncio
+from typing import Any, Callable, Coroutine, Dict, List, Tuple, TypeVar
+from unittest.mock import MagicMock
+from urllib import parse
+
+import httpx
+import pytest
+from typing_extensions import Final
+from withings_api.aio import AsyncWithingsApi
+from withings_api.common import (
+    AuthFailedException,
+    GetSleepField,
+    GetSleepSummaryField,
+    HeartWearPosition,
+    MeasureType,
+    NotifyAppli,
+    SleepModel,
+    TooManyRequestsException,
+)
+
+from .common import TIMEZONE_STR0, new_credentials
+
+_T = TypeVar("_T")
+_USERID: Final = 12345
+_BODIES: Final[Dict[str, Dict[str, Any]]] = {
+    "/v2/user:getdevice": {"devices": ()},
+    "/v2/measure:getactivity": {"activities": (), "more": False, "offset": 0},
+    "/measure:getmeas": {
+        "measuregrps": (),
+        "more": False,
+        "offset": 0,
+        "timezone": TIMEZONE_STR0,
+        "updatetime": 1409596058,
+    },
+    "/v2/sleep:get": {"model": SleepModel.TRACKER.real, "series": ()},
+    "/v2/sleep:getsummary": {"more": False, "offset": 0, "series": ()},
+    "/v2/heart:get": {
+        "signal": [1, 2, 3],
+        "sampling_frequency": 500,
+        "wearposition": HeartWearPosition.LEFT_ARM.real,
+    },
+    "/v2/heart:list": {"more": False, "offset": 0, "series": ()},
+    "/notify:get": {
+        "appli": NotifyAppli.WEIGHT.real,
+        "callbackurl": "http://localhost/callback",
+    },
+    "/notify:list": {"profiles": ()},
+    "/notify:revoke": {},
+    "/notify:subscribe": {},
+    "/notify:update": {},
+}
+
+
+def run(coro: Coroutine[Any, Any, _T]) -> _T:
+    """Run a coroutine to completion."""
+    return asyncio.run(coro)
+
+
+def new_client(
+    requests: List[httpx.Request], token_status: int = 0, status: int = 0
+) -> httpx.AsyncClient:
+    """Create a client which serves canned withings responses."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if request.url.path == "/v2/oauth2":
+            return httpx.Response(
+                200,
+                json={
+                    "status": token_status,
+                    "body": {
+                        "access_token": "my_access_token_refreshed",
+                        "expires_in": 11,
+                        "token_type": "Bearer",
+                        "refresh_token": "my_refresh_token_refreshed",
+                        "userid": _USERID,
+                    },
+                },
+            )
+
+        key: Final = "%s:%s" % (request.url.path, request.url.params["action"])
+        return httpx.Response(200, json={"status": status, "body": _BODIES[key]})
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+def call_all(api: AsyncWithingsApi) -> List[Callable[[], Coroutine]]:
+    """Return a call for every endpoint."""
+    return [
+        api.user_get_device,
+        api.measure_get_activity,
+        lambda: api.measure_get_meas(meastype=MeasureType.WEIGHT),
+        lambda: api.sleep_get(data_fields=(GetSleepField.HR,)),
+        lambda: api.sleep_get_summary(data_fields=(GetSleepSummaryField.HR_AVERAGE,)),
+        lambda: api.heart_get(signalid=1234),
+        api.heart_list,
+        lambda: api.notify_get(callbackurl="http://localhost/callback"),
+        api.notify_list,
+        api.notify_revoke,
+        lambda: api.notify_subscribe(callbackurl="http://localhost/callback"),
+        lambda: api.notify_update(
+            callbackurl="http://localhost/callback",
+            appli=NotifyAppli.WEIGHT,
+            new_callbackurl="http://localhost/callback2",
+        ),
+    ]
+
+
+def test_endpoints() -> None:
+    """Test function."""
+    requests: Final[List[httpx.Request]] = []
+    api: Final = AsyncWithingsApi(new_credentials(_USERID), client=new_client(requests))
+
+    async def fetch() -> List[Any]:
+        return list(await asyncio.gather(*(call() for call in call_all(api))))
+
+    results: Final = run(fetch())
+
+    assert len(results) == 12
+    assert results[2].measuregrps == ()
+    assert results[5].signal == (1, 2, 3)
+    assert results[9] is None
+    for request in requests:
+        query = dict(parse.parse_qsl(request.url.query.decode()))
+        assert query["access_token"] == "my_access_token"
+    assert dict(parse.parse_qsl(requests[2].url.query.decode()))["meastype"] == "1"
+
+
+def test_status_raises() -> None:
+    """Test function."""
+    api: Final = AsyncWithingsApi(
+        new_credentials(_USERID), client=new_client([], status=601)
+    )
+
+    with pytest.raises(TooManyRequestsException):
+        run(api.heart_list())
+
+
+def test_auto_refresh_token() -> None:
+    """Test function."""
+    requests: Final[List[httpx.Request]] = []
+    refresh_cb: Final = MagicMock()
+    api: Final = AsyncWithingsApi(
+        new_credentials(_USERID, expires_in=-1), refresh_cb, client=new_client(requests)
+    )
+
+    async def fetch() -> None:
+        await asyncio.gather(api.heart_list(), api.heart_list(), api.notify_list())
+
+    run(fetch())
+
+    assert [request.url.path for request in requests].count("/v2/oauth2") == 1
+    token_request: Final = dict(parse.parse_qsl(requests[0].content.decode()))
+    assert token_request["grant_type"] == "refresh_token"
+    assert token_request["refresh_token"] == "my_refresh_token"
+    refresh_cb.assert_called_once_with(api.get_credentials())
+    assert api.get_credentials().access_token == "my_access_token_refreshed"
+    for request in requests[1:]:
+        query = dict(parse.parse_qsl(request.url.query.decode()))
+        assert query["access_token"] == "my_access_token_refreshed"
+
+
+def test_refresh_token() -> None:
+    """Test function."""
+    api: Final = AsyncWithingsApi(new_credentials(_USERID), client=new_client([]))
+
+    run(api.refresh_token())
+
+    assert api.get_credentials().access_token == "my_access_token_refreshed"
+    assert api.get_credentials().refresh_token == "my_refresh_token_refreshed"
+    assert api.get_credentials().userid == _USERID
+
+
+def test_refresh_token_failed() -> None:
+    """Test function."""
+    api: Final = AsyncWithingsApi(
+        new_credentials(_USERID), client=new_client([], token_status=401)
+    )
+
+    with pytest.raises(AuthFailedException):
+        run(api.refresh_token())
+    assert api.get_credentials().access_token == "my_access_token"
+
+
+def new_paged_client(
+    requests: List[httpx.Request], items_key: str, pages: Tuple[List[Any], ...]
+) -> httpx.AsyncClient:
+    """Create a client which serves pages where the offset is the page index."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        index: Final = int(request.url.params.get("offset", 0))
+        body: Final = {
+            **_BODIES["%s:%s" % (request.url.path, request.url.params["action"])],
+            items_key: pages[index],
+            "more": index + 1 < len(pages),
+            "offset": index + 1,
+        }
+        return httpx.Response(200, json={"status": 0, "body": body})
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+@pytest.mark.parametrize("prefetch", (False, True))
+def test_iter_heart_series(prefetch: bool) -> None:
+    """Test function."""
+    requests: Final[List[httpx.Request]] = []
+    pages: Final = tuple(
+        [
+            {
+                "model": 93,
+                "ecg": {"signalid": signalid, "afib": 0},
+                "heart_rate": 60,
+                "timestamp": 1594911107,
+            }
+            for signalid in range(start, start + 2)
+        ]
+        for start in (0, 2, 4)
+    )
+    api: Final = AsyncWithingsApi(
+        new_credentials(_USERID), client=new_paged_client(requests, "series", pages)
+    )
+
+    async def collect() -> List[int]:
+        return [
+            serie.ecg.signalid
+            async for serie in api.iter_heart_series(prefetch=prefetch)
+        ]
+
+    assert run(collect()) == [0, 1, 2, 3, 4, 5]
+    assert [request.url.params.get("offset") for request in requests] == [
+        None,
+        "1",
+        "2",
+    ]
+
+
+def test_iter_pages_stop_early() -> None:
+    """Test function."""
+    serie: Final = {
+        "id": 1,
+        "timezone": TIMEZONE_STR0,
+        "model": SleepModel.SLEEP_MONITOR.real,
+        "startdate": 1548979200,
+        "enddate": 1548979200,
+        "date": "2019-02-01",
+        "modified": 12345,
+        "data": {},
+    }
+    requests: Final[List[httpx.Request]] = []
+    api: Final = AsyncWithingsApi(
+        new_credentials(_USERID),
+        client=new_paged_client(requests, "series", ([serie], [serie], [serie])),
+    )
+
+    async def first() -> None:
+        series = api.iter_sleep_summary_series(
+            data_fields=(GetSleepSummaryField.HR_AVERAGE,), prefetch=True
+        )
+        assert (await series.__anext__()).id == 1
+        await series.aclose()
+
+        groups = api.iter_measure_groups()
+        with pytest.raises(StopAsyncIteration):
+            await groups.__anext__()
+
+    run(first())
+
+    actions: Final = [request.url.params.get("action") for request in requests]
+    assert actions == ["getsummary", "getmeas", "getmeas", "getmeas"]
+
+
+def test_iter_activities() -> None:
+    """Test function."""
+    activity: Final = {
+        "date": "2019-01-01",
+        "timezone": TIMEZONE_STR0,
+        "is_tracker": True,
+        "brand": 18,
+        "totalcalories": 1.5,
+    }
+    requests: Final[List[httpx.Request]] = []
+    api: Final = AsyncWithingsApi(
+        new_credentials(_USERID),
+        client=new_paged_client(requests, "activities", ([activity], [activity])),
+    )
+
+    async def collect() -> List[Any]:
+        return [activity async for activity in api.iter_activities()]
+
+    assert len(run(collect())) == 2
+
+
+def test_client_lifecycle() -> None:
+    """Test function."""
+    shared_client: Final = new_client([])
+
+    async def use() -> None:
+        async with AsyncWithingsApi(
+            new_credentials(_USERID), client=shared_client
+        ) as api:
+            await api.notify_list()
+        assert not shared_client.is_closed
+
+        async with AsyncWithingsApi(new_credentials(_USERID)) as owned_api:
+            assert not owned_api._client.is_closed  # pylint: disable=protected-access
+        assert owned_api._client.is_closed  # pylint: disable=protected-access
+
+    run(use())
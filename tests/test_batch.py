@@ -0,0 +1,212 @@
+"""Tests for batch fetching."""
+import asyncio
+import json
+import re
+from typing import Any, Dict, List, Tuple, cast
+from unittest.mock import MagicMock
+from urllib import parse
+
+import httpx
+import pytest
+import responses
+from typing_extensions import Final
+from withings_api import batch
+from withings_api.batch import BatchResult, afetch_batch, fetch_batch
+from withings_api.common import (
+    AuthFailedException,
+    Credentials,
+    Credentials2,
+    TooManyRequestsException,
+)
+
+from .common import new_credentials
+
+_STATUS_BY_TOKEN: Final = {"token_601": 601, "token_401": 401}
+_REFRESH_RESPONSE: Final = {
+    "status": 0,
+    "body": {
+        "access_token": "token_refreshed",
+        "expires_in": 11,
+        "token_type": "Bearer",
+        "refresh_token": "refresh_refreshed",
+    },
+}
+
+
+def user_credentials(userid: int, access_token: str = "") -> Credentials2:
+    """Create test credentials with a token of their own."""
+    return new_credentials(
+        userid,
+        access_token=access_token or "token_%s" % userid,
+        refresh_token="refresh_%s" % userid,
+    )
+
+
+def response_for_token(access_token: str) -> Dict[str, Any]:
+    """Get the response a user gets for a notify list call."""
+    return {
+        "status": _STATUS_BY_TOKEN.get(access_token, 0),
+        "body": {
+            "profiles": [
+                {"appli": 1, "callbackurl": access_token, "expires": 1, "comment": ""}
+            ]
+        },
+    }
+
+
+def assert_refreshed(results: List[BatchResult]) -> None:
+    """Assert the expired user got a result with their refreshed credentials."""
+    assert len(results) == 23
+    refreshed: Final = next(result for result in results if result.userid == 200)
+    assert refreshed.ok
+    assert refreshed.credentials.access_token == "token_refreshed"
+    assert refreshed.credentials.refresh_token == "refresh_refreshed"
+
+
+def all_credentials() -> List[Credentials2]:
+    """Get a batch of users with a few failing ones."""
+    return [user_credentials(userid) for userid in range(20)] + [
+        user_credentials(100, "token_601"),
+        user_credentials(101, "token_401"),
+    ]
+
+
+def malformed_credentials() -> Credentials:
+    """Create legacy credentials without a token expiry."""
+    return Credentials(
+        access_token="token_300",
+        token_expiry=cast(int, None),
+        token_type="Bearer",
+        refresh_token="refresh_300",
+        userid=300,
+        client_id="my_client_id",
+        consumer_secret="my_consumer_secret",
+    )
+
+
+def assert_results(results: List[BatchResult]) -> None:
+    """Assert each user got their own result."""
+    by_user: Final = {result.userid: result for result in results}
+    assert len(results) == 22
+    assert len(by_user) == 22
+    for userid in range(20):
+        result = by_user[userid].result
+        assert by_user[userid].ok
+        assert result is not None
+        assert result.profiles[0].callbackurl == "token_%s" % userid
+    assert isinstance(by_user[100].error, TooManyRequestsException)
+    assert isinstance(by_user[101].error, AuthFailedException)
+    assert not by_user[101].ok
+    assert by_user[101].result is None
+
+
+@responses.activate
+def test_fetch_batch() -> None:
+    """Test function."""
+
+    def callback(request: Any) -> Tuple[int, Dict[str, str], str]:
+        params: Final = dict(parse.parse_qsl(parse.urlsplit(request.url).query))
+        return 200, {}, json.dumps(response_for_token(params["access_token"]))
+
+    responses.add_callback(
+        method=responses.GET,
+        url=re.compile("https://wbsapi.withings.net/notify?.*action=list(&.*)?"),
+        callback=callback,
+        content_type="application/json",
+    )
+    responses.add(
+        method=responses.POST,
+        url=re.compile("https://wbsapi.withings.net/v2/oauth2.*"),
+        status=200,
+        json=_REFRESH_RESPONSE,
+    )
+    expired: Final = user_credentials(200).copy(update={"expires_in": -1})
+
+    results: Final = list(
+        fetch_batch(
+            all_credentials() + [expired], lambda api: api.notify_list(), max_workers=3,
+        )
+    )
+
+    assert_results([result for result in results if result.userid != 200])
+    assert_refreshed(results)
+
+
+def test_afetch_batch() -> None:
+    """Test function."""
+    in_flight: Final = [0, 0]
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/v2/oauth2":
+            return httpx.Response(200, json=_REFRESH_RESPONSE)
+
+        in_flight[0] += 1
+        in_flight[1] = max(in_flight)
+        await asyncio.sleep(0)
+        in_flight[0] -= 1
+        access_token: Final = request.url.params["access_token"]
+        return httpx.Response(200, json=response_for_token(access_token))
+
+    expired: Final = user_credentials(200).copy(update={"expires_in": -1})
+    refresh_cb: Final = MagicMock()
+
+    async def collect() -> List[BatchResult]:
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        return [
+            result
+            async for result in afetch_batch(
+                all_credentials() + [expired],
+                lambda api: api.notify_list(),
+                max_concurrency=4,
+                refresh_cb=refresh_cb,
+                client=client,
+            )
+        ]
+
+    results: Final = asyncio.run(collect())
+
+    assert_results([result for result in results if result.userid != 200])
+    assert_refreshed(results)
+    assert in_flight[1] <= 4
+    refresh_cb.assert_called_once()
+    assert refresh_cb.call_args[0][0].userid == 200
+    assert refresh_cb.call_args[0][0].access_token == "token_refreshed"
+
+
+def test_batch_malformed_credentials() -> None:
+    """Test function."""
+    fetch: Final = MagicMock()
+
+    async def collect() -> List[BatchResult]:
+        return [
+            result async for result in afetch_batch([malformed_credentials()], fetch)
+        ]
+
+    for result in [
+        *fetch_batch([malformed_credentials()], fetch),
+        *asyncio.run(collect()),
+    ]:
+        assert result.userid == 300
+        assert isinstance(result.error, TypeError)
+        assert result.credentials == malformed_credentials()
+    fetch.assert_not_called()
+
+
+def test_afetch_batch_empty() -> None:
+    """Test function."""
+
+    async def collect() -> List[BatchResult]:
+        return [result async for result in afetch_batch([], MagicMock())]
+
+    assert asyncio.run(collect()) == []
+
+
+def test_afetch_batch_without_httpx(monkeypatch: Any) -> None:
+    """Test function."""
+    monkeypatch.setattr(batch, "httpx", None)
+
+    async def collect() -> List[BatchResult]:
+        return [result async for result in afetch_batch([], MagicMock())]
+
+    with pytest.raises(ImportError, match=r"withings-api\[async\]"):
+        asyncio.run(collect())
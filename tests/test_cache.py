@@ -0,0 +1,209 @@
+"""Tests for response caching."""
+import asyncio
+import re
+import sqlite3
+from typing import List
+
+import httpx
+import responses
+from typing_extensions import Final
+from withings_api import WithingsApi
+from withings_api.aio import AsyncWithingsApi
+from withings_api.cache import MemoryCache, ResponseCache, SQLiteCache
+from withings_api.common import HeartGetResponse, NotifyAppli
+from withings_api.ratelimit import RateLimiter
+
+from .common import FakeClock, new_credentials
+
+_HEART_GET_BODY: Final = {
+    "signal": [-20, 0, 20],
+    "sampling_frequency": 500,
+    "wearposition": 0,
+}
+
+
+def test_memory_cache() -> None:
+    """Test function."""
+    clock: Final = FakeClock()
+    cache: Final = MemoryCache(maxsize=2, clock=clock)
+
+    assert cache.get("a") is None
+    cache.set("a", {"value": 1}, 10)
+    cache.set("b", {"value": 2}, None)
+    assert cache.get("a") == {"value": 1}
+
+    cache.set("c", {"value": 3}, None)
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == {"value": 1}
+
+    clock.now += 10
+    assert cache.get("a") is None
+    assert cache.get("c") == {"value": 3}
+    assert len(cache) == 1
+
+    # Neither the stored nor the returned body is shared with callers.
+    body: Final = {"value": [4]}
+    cache.set("d", body, None)
+    body["value"].append(5)
+    cache.get("d")["value"].append(6)  # type: ignore
+    assert cache.get("d") == {"value": [4]}
+
+
+def test_sqlite_cache(tmp_path: str) -> None:
+    """Test function."""
+    path: Final = "%s/cache.db" % tmp_path
+    clock: Final = FakeClock()
+    cache = SQLiteCache(path, clock=clock)
+
+    assert cache.get("a") is None
+    cache.set("a", {"value": 1}, 10)
+    cache.set("b", {"value": [2]}, None)
+    cache.close()
+
+    cache = SQLiteCache(path, clock=clock, purge_interval=100)
+    assert cache.get("a") == {"value": 1}
+    clock.now += 10
+    assert cache.get("a") is None
+    assert count_rows(path) == 1
+    cache.purge()
+    assert cache.get("b") == {"value": [2]}
+
+    # Expired entries that are never read again are purged when storing.
+    cache.set("c", {"value": 3}, 10)
+    cache.set("d", {"value": 4}, 200)
+    clock.now += 50
+    cache.set("e", {"value": 5}, 10)
+    assert count_rows(path) == 4
+    clock.now += 50
+    cache.set("f", {"value": 6}, 10)
+    assert count_rows(path) == 3
+    cache.close()
+
+
+def count_rows(path: str) -> int:
+    """Count the entries of a SQLite cache, expired ones included."""
+    connection: Final = sqlite3.connect(path)
+    try:
+        return int(
+            connection.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+        )
+    finally:
+        connection.close()
+
+
+def test_response_cache_keys() -> None:
+    """Test function."""
+    cache: Final = ResponseCache(ttls={("v2/heart", "get"): None})
+
+    assert cache.key(1, "v2/heart", {"action": "get", "signalid": 5}) == (
+        "1/v2/heart?action=get&signalid=5"
+    )
+    assert cache.key(1, "v2/heart", {"signalid": 5, "action": "get"}) == cache.key(
+        1, "v2/heart", {"action": "get", "signalid": 5}
+    )
+    assert cache.key(2, "v2/heart", {"action": "get"}) != cache.key(
+        1, "v2/heart", {"action": "get"}
+    )
+    assert cache.key(1, "v2/heart", {"action": "list"}) is None
+    assert cache.key(1, "notify", {"action": "get"}) is None
+    assert cache.key(None, "v2/heart", {"action": "get"}) is None
+    assert ResponseCache().key(1, "v2/heart", {"action": "list"}) is not None
+
+
+def test_response_cache_keys_now() -> None:
+    """Test function."""
+    clock: Final = FakeClock()
+    cache: Final = ResponseCache(
+        ttls={("measure", "getmeas"): 300, ("v2/heart", "get"): None}, clock=clock
+    )
+
+    # An end date within the ttl stands for the time of the call.
+    assert cache.key(1, "measure", {"action": "getmeas", "enddate": 1000}) == (
+        "1/measure?action=getmeas&enddate=now"
+    )
+    clock.now += 200
+    assert cache.key(1, "measure", {"action": "getmeas", "enddate": 1200}) == (
+        cache.key(1, "measure", {"action": "getmeas", "enddate": 950})
+    )
+    assert cache.key(1, "measure", {"action": "getmeas", "enddate": 850}) == (
+        "1/measure?action=getmeas&enddate=850"
+    )
+    assert cache.key(1, "v2/heart", {"action": "get", "enddate": 1200}) == (
+        "1/v2/heart?action=get&enddate=1200"
+    )
+
+    # So do the start and last update dates that default to it.
+    assert cache.key(
+        1, "measure", {"action": "getmeas", "lastupdate": 1200, "startdate": 1199}
+    ) == ("1/measure?action=getmeas&lastupdate=now&startdate=now")
+    assert cache.key(
+        1, "measure", {"action": "getmeas", "meastype": 1200, "startdate": 850}
+    ) == ("1/measure?action=getmeas&meastype=1200&startdate=850")
+
+
+@responses.activate
+def test_api_cache() -> None:
+    """Test function."""
+    responses.add(
+        method=responses.GET,
+        url=re.compile("https://wbsapi.withings.net/v2/heart?.*action=get(&.*)?"),
+        status=200,
+        json={"status": 0, "body": _HEART_GET_BODY},
+    )
+    responses.add(
+        method=responses.GET,
+        url=re.compile("https://wbsapi.withings.net/notify?.*action=get(&.*)?"),
+        status=200,
+        json={
+            "status": 0,
+            "body": {"appli": 1, "callbackurl": "url", "comment": "comment"},
+        },
+    )
+    cache: Final = ResponseCache(MemoryCache())
+    api: Final = WithingsApi(new_credentials(), cache=cache, rate_limiter=RateLimiter())
+
+    assert api.heart_get(1) == HeartGetResponse(**_HEART_GET_BODY)
+    assert api.heart_get(1) == HeartGetResponse(**_HEART_GET_BODY)
+    assert len(responses.calls) == 1
+
+    WithingsApi(new_credentials(), cache=cache).heart_get(2)
+    WithingsApi(new_credentials(userid=2), cache=cache).heart_get(1)
+    assert len(responses.calls) == 3
+
+    api.notify_get("url", NotifyAppli.WEIGHT)
+    api.notify_get("url", NotifyAppli.WEIGHT)
+    assert len(responses.calls) == 5
+
+
+def test_async_api_cache() -> None:
+    """Test function."""
+    paths: Final[List[str]] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        paths.append(request.url.path)
+        if request.url.path == "/v2/heart":
+            return httpx.Response(200, json={"status": 0, "body": _HEART_GET_BODY})
+        return httpx.Response(
+            200,
+            json={
+                "status": 0,
+                "body": {"appli": 1, "callbackurl": "url", "comment": "comment"},
+            },
+        )
+
+    api: Final = AsyncWithingsApi(
+        new_credentials(),
+        client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+        cache=ResponseCache(),
+    )
+
+    async def fetch() -> None:
+        assert await api.heart_get(1) == HeartGetResponse(**_HEART_GET_BODY)
+        assert await api.heart_get(1) == HeartGetResponse(**_HEART_GET_BODY)
+        await api.notify_get("url", NotifyAppli.WEIGHT)
+        await api.notify_get("url", NotifyAppli.WEIGHT)
+        await api.aclose()
+
+    asyncio.run(fetch())
+    assert paths == ["/v2/heart", "/notify", "/notify"]
@@ -0,0 +1,86 @@
+"""Tests for json codecs."""
+from os import path
+import re
+from typing import Iterator
+
+import pytest
+import responses
+from typing_extensions import Final
+from withings_api import WithingsApi
+from withings_api.cache import SQLiteCache
+from withings_api.codec import available_codecs, get_codec, set_codec
+from withings_api.common import Credentials2
+from withings_api.synthetic import measure_get_meas_body, response
+
+_BODY: Final = measure_get_meas_body(count=3)
+
+
+@pytest.fixture(name="codec", params=available_codecs())
+def codec_fixture(request: pytest.FixtureRequest) -> Iterator[str]:
+    """Use each available codec in turn."""
+    set_codec(request.param)
+    yield request.param
+    set_codec("json")
+
+
+def test_available_codecs() -> None:
+    """Test function."""
+    assert available_codecs()[0] == "json"
+    assert get_codec().name == "json"
+    with pytest.raises(ValueError):
+        set_codec("unknown")
+    assert get_codec().name == "json"
+
+
+def test_round_trip(codec: str) -> None:
+    """Test function."""
+    assert get_codec().name == codec
+    encoded: Final = get_codec().dumps(_BODY)
+    assert isinstance(encoded, bytes)
+    assert get_codec().loads(encoded) == _BODY
+    assert get_codec().loads(encoded.decode("utf-8")) == _BODY
+
+
+@responses.activate
+def test_api_uses_codec(codec: str, tmp_path: str) -> None:
+    """Test function."""
+    responses.add(
+        method=responses.GET,
+        url=re.compile("https://wbsapi.withings.net/measure.*"),
+        status=200,
+        json=response(_BODY),
+    )
+    responses.add(
+        method=responses.POST,
+        url=re.compile("https://wbsapi.withings.net/v2/oauth2.*"),
+        status=200,
+        json=response(
+            {
+                "access_token": "my_access_token_refreshed",
+                "expires_in": 10800,
+                "token_type": "Bearer",
+                "refresh_token": "my_refresh_token_refreshed",
+                "userid": 1,
+            }
+        ),
+    )
+    api: Final = WithingsApi(
+        Credentials2(
+            access_token="my_access_token",
+            expires_in=10000,
+            token_type="Bearer",
+            refresh_token="my_refresh_token",
+            userid=1,
+            client_id="my_client_id",
+            consumer_secret="my_consumer_secret",
+        )
+    )
+
+    assert len(api.measure_get_meas(lastupdate=0).measuregrps) == 3
+    api.refresh_token()
+    assert api.get_credentials().access_token == "my_access_token_refreshed"
+
+    cache: Final = SQLiteCache(path.join(str(tmp_path), "cache.db"))
+    cache.set("key", _BODY, None)
+    assert cache.get("key") == _BODY
+    cache.close()
@@ -0,0 +1,138 @@
+"""Tests for columnar sleep series."""
+import asyncio
+import re
+from typing import Any
+
+import arrow
+import httpx
+import pytest
+import responses
+from typing_extensions import Final
+from withings_api import WithingsApi, columnar
+from withings_api.aio import AsyncWithingsApi
+from withings_api.columnar import (
+    ColumnarSleepGetResponse,
+    TimestampValueSeries,
+    decode_sleep_get_columnar,
+    to_columnar,
+)
+from withings_api.common import (
+    GetSleepField,
+    SleepGetResponse,
+    SleepGetTimestampValue,
+    SleepModel,
+    SleepState,
+)
+
+from .common import new_credentials
+
+_SLEEP_GET_BODY: Final = {
+    "model": SleepModel.SLEEP_MONITOR.real,
+    "series": [
+        {"startdate": 1387235398, "state": SleepState.AWAKE, "enddate": 1387235758},
+        {
+            "startdate": 1387243618,
+            "state": SleepState.LIGHT,
+            "enddate": 1387244518,
+            "hr": {"1387243618": 12, "1387243700": 34},
+            "rr": {"1387243618": 45, "1387243700": 67},
+            "snoring": {"1387243618": 78, "1387243700": 90},
+            "sdnn_1": {"1387243618": 11, "1387243700": "12"},
+            "rmssd": {"1387243618": 13, "1387243700": 14},
+        },
+        {"startdate": "1387235398", "state": 1234567, "enddate": 1387235758},
+    ],
+}
+
+
+def test_timestamp_value_series() -> None:
+    """Test function."""
+    series: Final = TimestampValueSeries.from_dict({"10": 1, "20": "2", "30": 3})
+
+    assert len(series) == 3
+    assert series.timestamps.tolist() == [10, 20, 30]
+    assert series.values.tolist() == [1, 2, 3]
+    assert series.nbytes == 3 * 8 + 3 * 4
+    assert series.mean() == 2
+    assert series[1] == SleepGetTimestampValue(timestamp=arrow.get(20), value=2)
+    assert series[-1].timestamp == arrow.get(30)
+    assert series[1:] == TimestampValueSeries([20, 30], [2, 3])
+    assert series.to_objects() == tuple(series)
+    assert TimestampValueSeries.from_objects(series.to_objects()) == series
+    assert series != TimestampValueSeries([10, 20, 30], [1, 2, 4])
+    assert series != "series"
+    assert repr(series[:1]) == "TimestampValueSeries([10], [1])"
+
+    empty: Final = TimestampValueSeries.from_dict(None)
+    assert len(empty) == 0
+    assert empty.mean() is None
+    assert empty.to_objects() == ()
+
+    with pytest.raises(ValueError):
+        TimestampValueSeries([1, 2], [1])
+
+
+def test_to_numpy(monkeypatch: Any) -> None:
+    """Test function."""
+    series: Final = TimestampValueSeries([10, 20], [1, 2])
+
+    timestamps, values = series.to_numpy()
+    assert timestamps.tolist() == [10, 20]
+    assert values.sum() == 3
+
+    # The arrays share the memory of the series.
+    values[0] = 5
+    assert series.values[0] == 5
+
+    monkeypatch.setattr(columnar, "numpy", None)
+    with pytest.raises(ImportError):
+        series.to_numpy()
+
+
+def test_decode_sleep_get_columnar() -> None:
+    """Test function."""
+    response: Final = decode_sleep_get_columnar(_SLEEP_GET_BODY)
+    model: Final = SleepGetResponse(**_SLEEP_GET_BODY)
+
+    assert response.model == model.model
+    assert len(response.series) == len(model.series)
+    for serie, model_serie in zip(response.series, model.series):
+        assert serie.to_model() == model_serie
+        assert to_columnar(model_serie) == serie
+
+    assert response.series[2].state == SleepState.UNKNOWN
+    assert response.series[1].sdnn_1.values.tolist() == [11, 12]
+
+
+@responses.activate
+def test_api_sleep_get_columnar() -> None:
+    """Test function."""
+    responses.add(
+        method=responses.GET,
+        url=re.compile("https://wbsapi.withings.net/v2/sleep?.*action=get(&.+)?"),
+        status=200,
+        json={"status": 0, "body": _SLEEP_GET_BODY},
+    )
+    api: Final = WithingsApi(new_credentials())
+
+    assert api.sleep_get_columnar(
+        data_fields=(GetSleepField.HR,)
+    ) == decode_sleep_get_columnar(_SLEEP_GET_BODY)
+
+
+def test_async_api_sleep_get_columnar() -> None:
+    """Test function."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.url.path == "/v2/sleep"
+        return httpx.Response(200, json={"status": 0, "body": _SLEEP_GET_BODY})
+
+    api: Final = AsyncWithingsApi(
+        new_credentials(),
+        client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+    )
+
+    async def fetch() -> ColumnarSleepGetResponse:
+        return await api.sleep_get_columnar(data_fields=(GetSleepField.HR,))
+
+    assert asyncio.run(fetch()) == decode_sleep_get_columnar(_SLEEP_GET_BODY)
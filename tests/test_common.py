@@ -1,16 +1,24 @@
 """Tests for common code."""
-from typing import Any, Dict
+from array import array
+import copy
+import json
+import pickle
+from typing import Any, Dict, cast
 
 import arrow
 import pytest
 from typing_extensions import Final
+from withings_api import common
 from withings_api.common import (
     ArrowType,
     AuthFailedException,
     BadStateException,
     Credentials,
     Credentials2,
+    EcgSignal,
     ErrorOccurredException,
+    HeartGetResponse,
+    HeartWearPosition,
     InvalidParamsException,
     MeasureGetMeasGroup,
     MeasureGetMeasGroupAttrib,
@@ -26,10 +34,15 @@ from withings_api.common import (
     UnauthorizedException,
     UnexpectedTypeException,
     UnknownStatusException,
+    arrow_from_timestamp,
     get_measure_value,
+    get_timezone,
     maybe_upgrade_credentials,
     query_measure_groups,
     response_body_or_raise,
+    set_timezone_backend,
+    timezone_name,
+    to_timezone,
 )
 from withings_api.const import (
     STATUS_AUTH_FAILED,
@@ -41,6 +54,7 @@ from withings_api.const import (
     STATUS_TOO_MANY_REQUESTS,
     STATUS_UNAUTHORIZED,
 )
+from withings_api.synthetic import heart_get_body
 
 from .common import TIMEZONE0, TIMEZONE_STR0
 
@@ -54,6 +68,37 @@ def test_time_zone_validate() -> None:
     assert TimeZone.validate(TIMEZONE_STR0) == TIMEZONE0
 
 
+def test_get_timezone() -> None:
+    """Test function."""
+    assert get_timezone(TIMEZONE_STR0) is get_timezone(TIMEZONE_STR0)
+    assert get_timezone(TIMEZONE_STR0) is TimeZone.validate(TIMEZONE_STR0)
+    assert timezone_name(get_timezone(TIMEZONE_STR0)) == TIMEZONE_STR0
+    with pytest.raises(ValueError):
+        timezone_name(arrow.get(0).tzinfo)
+
+    with pytest.raises(ValueError):
+        set_timezone_backend("pytz")
+
+    zoneinfo: Final = pytest.importorskip("zoneinfo")
+    set_timezone_backend("zoneinfo")
+    try:
+        timezone = get_timezone(TIMEZONE_STR0)
+        assert isinstance(timezone, zoneinfo.ZoneInfo)
+        assert timezone is TimeZone.validate(TIMEZONE_STR0)
+        assert arrow.get(1577836800).to(timezone).utcoffset() == (
+            arrow.get(1577836800).to(TIMEZONE0).utcoffset()
+        )
+        for name in ("NOT_A_TIMEZONE", "../etc"):
+            with pytest.raises(ValueError):
+                get_timezone(name)
+    finally:
+        set_timezone_backend("dateutil")
+
+    assert get_timezone(TIMEZONE_STR0) == TIMEZONE0
+    # No longer in the registry, named by its key.
+    assert timezone_name(timezone) == TIMEZONE_STR0
+
+
 def test_arrow_type_validate() -> None:
     """Test ArrowType conversation."""
     with pytest.raises(TypeError):
@@ -66,6 +111,35 @@ def test_arrow_type_validate() -> None:
     assert ArrowType.validate(arrow_obj) == arrow_obj
 
 
+def test_arrow_from_timestamp(monkeypatch: Any) -> None:
+    """Test function."""
+    for value in (0, -86401, 1234567, 1577836800, 4102444800):
+        converted = arrow_from_timestamp(value)
+        assert converted == arrow.get(value)
+        assert converted.tzinfo == arrow.get(value).tzinfo
+        assert converted.isoformat() == arrow.get(value).isoformat()
+
+    assert arrow_from_timestamp(1234567) is arrow_from_timestamp(1234567)
+    monkeypatch.setattr(common, "TIMESTAMP_CACHE_SIZE", 1)
+    first: Final = arrow_from_timestamp(1)
+    arrow_from_timestamp(2)
+    assert arrow_from_timestamp(1) is not first
+
+
+def test_to_timezone(monkeypatch: Any) -> None:
+    """Test function."""
+    arrow_obj: Final = arrow.get(1234567)
+    converted: Final = to_timezone(arrow_obj, TIMEZONE0)
+    assert converted == arrow_obj
+    assert converted.tzinfo is TIMEZONE0
+    assert converted.isoformat() == arrow_obj.to(TIMEZONE0).isoformat()
+    assert to_timezone(arrow.get(1234567), TIMEZONE0) is converted
+
+    monkeypatch.setattr(common, "TIMESTAMP_CACHE_SIZE", 1)
+    to_timezone(arrow.get(1), TIMEZONE0)
+    assert to_timezone(arrow_obj, TIMEZONE0) is not converted
+
+
 def test_maybe_update_credentials() -> None:
     """Test upgrade credentials objects."""
 
@@ -346,3 +420,95 @@ def test_response_body_or_raise() -> None:
 
     with pytest.raises(UnknownStatusException):
         response_body_or_raise(response_status_factory(100000))
+
+    with pytest.raises(UnknownStatusException):
+        response_body_or_raise(response_status_factory([601]))
+
+
+def test_status_exception_details() -> None:
+    """Test function."""
+    params: Final = {"action": "getmeas"}
+    with pytest.raises(TooManyRequestsException) as exc_info:
+        response_body_or_raise(response_status_factory(601), "measure", params)
+
+    assert exc_info.value.status == 601
+    assert exc_info.value.path == "measure"
+    assert exc_info.value.params == params
+    assert exc_info.value.retryable
+    assert str(exc_info.value) == "Error code 601"
+
+    assert TimeoutException(522).retryable
+    assert ErrorOccurredException(2554).retryable
+    assert not AuthFailedException(100).retryable
+    assert not InvalidParamsException(503).retryable
+    assert UnknownStatusException(100000).path is None
+
+
+def test_ecg_signal() -> None:
+    """Test function."""
+    body: Final = heart_get_body(samples=1000, sampling_frequency=500)
+    response: Final = HeartGetResponse(**body)
+    signal: Final = response.signal
+
+    assert isinstance(signal, EcgSignal)
+    assert signal.samples.format == "h"
+    assert signal == body["signal"]
+    assert signal == tuple(body["signal"])
+    assert list(signal) == body["signal"]
+    assert signal != "signal"
+    assert response.duration == 2.0
+    assert response.timestamps()[:3].tolist() == [0.0, 0.002, 0.004]
+    assert response.timestamps(start=10.0)[-1] == 10.0 + 999 / 500
+
+    # Slices share the samples.
+    window: Final = signal[100:200:2]
+    assert window.samples.obj is signal.samples.obj
+    assert window == body["signal"][100:200:2]
+    assert window[0] == body["signal"][100]
+    assert window[-1] == body["signal"][198]
+    assert len(window) == 50
+    assert EcgSignal(window.samples).samples is window.samples
+    samples: Final = cast(array, signal.samples.obj)
+    assert EcgSignal(samples).samples.obj is samples
+
+    assert pickle.loads(pickle.dumps(response)) == response
+    assert copy.deepcopy(response) == response
+    assert HeartGetResponse(**{**body, "signal": signal}).signal is signal
+    assert repr(EcgSignal([1, -2])) == "EcgSignal([1, -2])"
+
+
+def test_ecg_signal_json() -> None:
+    """Test function."""
+    body: Final = heart_get_body(samples=100, sampling_frequency=500)
+    response: Final = HeartGetResponse(**body)
+
+    assert json.loads(response.json())["signal"] == body["signal"]
+    assert HeartGetResponse.parse_raw(response.json()) == response
+    assert HeartGetResponse.schema()["properties"]["signal"] == {
+        "title": "Signal",
+        "type": "array",
+        "items": {"type": "integer"},
+    }
+
+
+def test_ecg_signal_validate() -> None:
+    """Test function."""
+    wide: Final = EcgSignal([0, 40000, -40000])
+    assert wide.samples.format == "i"
+    assert wide == EcgSignal(array("i", [0, 40000, -40000]))
+    assert EcgSignal(array("b", [1, 2])).samples.format == "h"
+    assert EcgSignal() == ()
+    assert EcgSignal.validate((1, 2)) == [1, 2]
+
+    with pytest.raises(TypeError):
+        EcgSignal.validate("123")
+    with pytest.raises(TypeError):
+        EcgSignal([1.5])  # type: ignore
+    with pytest.raises(ValueError):
+        EcgSignal([0, 2 ** 31])
+    with pytest.raises(ValueError):
+        HeartGetResponse(
+            signal=["1"],
+            sampling_frequency=500,
+            wearposition=HeartWearPosition.LEFT_WRIST,
+        )
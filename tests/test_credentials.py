@@ -0,0 +1,218 @@
+"""Tests for credential stores and coordinated refresh."""
+import itertools
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+import arrow
+import pytest
+import responses
+from typing_extensions import Final
+from withings_api import WithingsApi
+from withings_api.common import Credentials2
+from withings_api.credentials import (
+    CredentialStore,
+    FileCredentialStore,
+    MemoryCredentialStore,
+    RefreshCoordinator,
+    SQLiteCredentialStore,
+    credentials_from_dict,
+    credentials_to_dict,
+)
+
+from .common import new_credentials
+
+_CREATED: Final = arrow.get(1000)
+_NOTIFY_GET_BODY: Final = {
+    "status": 0,
+    "body": {"appli": 1, "callbackurl": "url", "comment": "comment"},
+}
+
+
+def stored_credentials(userid: int = 1, expires_in: int = 10000) -> Credentials2:
+    """Create test credentials, created at a fixed time."""
+    return new_credentials(userid, expires_in, created=_CREATED)
+
+
+def add_refresh(delay: float = 0.0) -> List[int]:
+    """Answer refreshes with numbered tokens."""
+    numbers: Final = itertools.count(1)
+    refreshes: Final[List[int]] = []
+
+    def callback(_request: Any) -> Tuple[int, Dict[str, str], str]:
+        number: Final = next(numbers)
+        refreshes.append(number)
+        time.sleep(delay)
+        return (
+            200,
+            {},
+            json.dumps(
+                {
+                    "status": 0,
+                    "body": {
+                        "access_token": "access_token_%s" % number,
+                        "expires_in": 10800,
+                        "token_type": "Bearer",
+                        "refresh_token": "refresh_token_%s" % number,
+                        "userid": 1,
+                    },
+                }
+            ),
+        )
+
+    responses.add_callback(
+        method=responses.POST,
+        url=re.compile("https://wbsapi.withings.net/v2/oauth2.*"),
+        callback=callback,
+    )
+    responses.add(
+        method=responses.GET,
+        url=re.compile("https://wbsapi.withings.net/notify.*"),
+        status=200,
+        json=_NOTIFY_GET_BODY,
+    )
+    return refreshes
+
+
+def notify_get(api: WithingsApi) -> None:
+    """Make any call."""
+    api.notify_get("url")
+
+
+@pytest.mark.parametrize("store_type", ["memory", "file", "sqlite"])
+def test_stores(store_type: str, tmp_path: Any) -> None:
+    """Test function."""
+    store: CredentialStore
+    if store_type == "memory":
+        store = MemoryCredentialStore()
+    elif store_type == "file":
+        store = FileCredentialStore(str(tmp_path / "tokens"))
+    else:
+        store = SQLiteCredentialStore(str(tmp_path / "tokens.db"))
+
+    assert store.get(1) is None
+    store.put(stored_credentials())
+    store.put(stored_credentials(userid=2, expires_in=5))
+    store.put(stored_credentials(userid=2, expires_in=6))
+
+    assert store.get(1) == stored_credentials()
+    assert store.get(2) == stored_credentials(userid=2, expires_in=6)
+    if isinstance(store, SQLiteCredentialStore):
+        store.close()
+
+
+def test_credentials_dict() -> None:
+    """Test function."""
+    credentials: Final = stored_credentials()
+
+    assert (
+        credentials_from_dict(json.loads(json.dumps(credentials_to_dict(credentials))))
+        == credentials
+    )
+
+
+def test_file_store_failed_write(tmp_path: Any, monkeypatch: Any) -> None:
+    """Test function."""
+    store: Final = FileCredentialStore(str(tmp_path))
+    store.put(stored_credentials(expires_in=1))
+
+    def replace(src: str, dst: str) -> None:
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, "replace", replace)
+    with pytest.raises(OSError):
+        store.put(stored_credentials(expires_in=2))
+
+    assert os.listdir(str(tmp_path)) == ["1.json"]
+    assert store.get(1) == stored_credentials(expires_in=1)
+
+
+@responses.activate
+def test_single_flight_refresh() -> None:
+    """Test function."""
+    refreshes: Final = add_refresh(delay=0.1)
+    coordinator: Final = RefreshCoordinator()
+    api: Final = WithingsApi(
+        stored_credentials(expires_in=100), refresh_coordinator=coordinator
+    )
+
+    threads: Final = [
+        threading.Thread(target=notify_get, args=(api,)) for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert refreshes == [1]
+    assert api.get_credentials().access_token == "access_token_1"
+    assert coordinator.store.get(1) == api.get_credentials()
+
+
+@responses.activate
+def test_instances_share_refreshed_credentials() -> None:
+    """Test function."""
+    refreshes: Final = add_refresh()
+    refreshed: Final[List[Credentials2]] = []
+    coordinator: Final = RefreshCoordinator(MemoryCredentialStore())
+    api1: Final = WithingsApi(
+        stored_credentials(expires_in=100),
+        refresh_cb=refreshed.append,
+        refresh_coordinator=coordinator,
+    )
+    api2: Final = WithingsApi(
+        stored_credentials(expires_in=100), refresh_coordinator=coordinator
+    )
+
+    api1.notify_get("url")
+    api2.notify_get("url")
+    assert refreshes == [1]
+    assert api2.get_credentials() == api1.get_credentials() == refreshed[0]
+    assert "access_token=access_token_1" in str(responses.calls[-1].request.url)
+
+    api2.refresh_token()
+    assert refreshes == [1, 2]
+    assert api2.get_credentials().access_token == "access_token_2"
+
+    api1.refresh_token()
+    assert refreshes == [1, 2]
+    assert api1.get_credentials().access_token == "access_token_2"
+
+    api1.notify_get("url")
+    assert refreshes == [1, 2]
+
+
+@responses.activate
+def test_refresh_from_newer_expired_credentials() -> None:
+    """Test function."""
+    refreshes: Final = add_refresh()
+    coordinator: Final = RefreshCoordinator(MemoryCredentialStore())
+    coordinator.store.put(
+        new_credentials(
+            expires_in=100,
+            created=arrow.get(2000),
+            access_token="stored_access_token",
+            refresh_token="stored_refresh_token",
+        )
+    )
+    api: Final = WithingsApi(
+        stored_credentials(expires_in=100), refresh_coordinator=coordinator
+    )
+
+    api.notify_get("url")
+    # Refreshed with the stored refresh token, the one of api is used up.
+    assert refreshes == [1]
+    assert "refresh_token=stored_refresh_token" in str(responses.calls[0].request.body)
+    assert api.get_credentials().access_token == "access_token_1"
+    assert coordinator.store.get(1) == api.get_credentials()
+
+
+def test_needs_refresh() -> None:
+    """Test function."""
+    coordinator: Final = RefreshCoordinator(margin=60, clock=lambda: 1000.0)
+
+    assert coordinator.needs_refresh(stored_credentials(expires_in=60))
+    assert not coordinator.needs_refresh(stored_credentials(expires_in=61))
@@ -0,0 +1,159 @@
+"""Tests for ECG analytics."""
+import random
+from typing import Iterator, List
+
+import pytest
+from typing_extensions import Final
+from withings_api import synthetic
+from withings_api.common import (
+    AfibClassification,
+    EcgSignal,
+    HeartGetResponse,
+    HeartListSerie,
+    HeartWearPosition,
+)
+from withings_api.ecg import (
+    ANALYSIS_BACKENDS,
+    EcgAnalysis,
+    analyze_ecg,
+    analyze_ecgs,
+    detect_r_peaks,
+    set_analysis_backend,
+)
+
+
+@pytest.fixture(name="backend", params=list(ANALYSIS_BACKENDS))
+def backend_fixture(request: pytest.FixtureRequest) -> Iterator[str]:
+    """Use each available backend in turn."""
+    set_analysis_backend(request.param)
+    yield request.param
+    set_analysis_backend("numpy")
+
+
+def spikes(samples: int, peaks: List[int], height: int = 1000) -> List[int]:
+    """Create a flat signal with a spike of height at every peak."""
+    signal: Final = [0] * samples
+    for peak in peaks:
+        signal[peak - 1] = height // 2
+        signal[peak] = height
+        signal[peak + 1] = height // 2
+    return signal
+
+
+def heart_get(signal: List[int], sampling_frequency: int = 100) -> HeartGetResponse:
+    """Create a heart get response of a signal."""
+    return HeartGetResponse(
+        signal=signal,
+        sampling_frequency=sampling_frequency,
+        wearposition=HeartWearPosition.LEFT_WRIST,
+    )
+
+
+@pytest.mark.usefixtures("backend")
+def test_analyze_ecg() -> None:
+    """Test function."""
+    # RR intervals of 1000, 800 and 1200 ms at 100 Hz.
+    analysis: Final = analyze_ecg(
+        heart_get(spikes(1000, [100, 200, 280, 400])), AfibClassification.NEGATIVE
+    )
+
+    assert analysis.afib == AfibClassification.NEGATIVE
+    assert analysis.peaks == (100, 200, 280, 400)
+    assert analysis.rr_intervals == (1000.0, 800.0, 1200.0)
+    assert analysis.heart_rate == pytest.approx(60.0)
+    assert analysis.sdnn == pytest.approx(200.0)
+    assert analysis.rmssd == pytest.approx((0.5 * (200 ** 2 + 400 ** 2)) ** 0.5)
+
+
+@pytest.mark.usefixtures("backend")
+def test_detect_r_peaks() -> None:
+    """Test function."""
+    signal: Final = spikes(1000, [100, 700])
+    # A smaller spike within the refractory period of a peak is dropped.
+    signal[109:112] = [400, 800, 400]
+    # And one below the threshold.
+    signal[299:302] = [200, 400, 200]
+
+    assert detect_r_peaks(EcgSignal(signal), 100) == [100, 700]
+    assert detect_r_peaks(EcgSignal(signal), 100, threshold_ratio=0.3) == [
+        100,
+        300,
+        700,
+    ]
+    assert detect_r_peaks(EcgSignal(signal), 100, refractory_period=0.05) == [
+        100,
+        110,
+        700,
+    ]
+
+    signal[100] = 700
+    assert detect_r_peaks(EcgSignal(signal), 100) == [110, 700]
+
+    # Negative samples, a plateau is one peak at its end.
+    assert detect_r_peaks(EcgSignal([-50, -10, -10, -50, -50]), 100) == [2]
+    assert detect_r_peaks(EcgSignal([0] * 10), 100) == []
+    assert detect_r_peaks(EcgSignal([1, 2]), 100) == []
+
+
+@pytest.mark.usefixtures("backend")
+def test_analyze_ecg_few_peaks() -> None:
+    """Test function."""
+    assert analyze_ecg(heart_get(spikes(10, [5]))) == EcgAnalysis(
+        afib=AfibClassification.UNKNOWN,
+        peaks=(5,),
+        rr_intervals=(),
+        heart_rate=None,
+        sdnn=None,
+        rmssd=None,
+    )
+
+    two_peaks: Final = analyze_ecg(heart_get(spikes(300, [100, 250])))
+    assert two_peaks.heart_rate == pytest.approx(40.0)
+    assert two_peaks.sdnn is None
+    assert two_peaks.rmssd is None
+
+
+@pytest.mark.usefixtures("backend")
+def test_analyze_ecgs() -> None:
+    """Test function."""
+    rng: Final = random.Random(0)
+    recordings: Final = [
+        (
+            HeartListSerie(**synthetic.heart_serie(rng, index, 1577836800)),
+            HeartGetResponse(**synthetic.heart_get_body(seed=index)),
+        )
+        for index in range(5)
+    ]
+    analyses: Final = analyze_ecgs(iter(recordings))
+
+    assert [analysis.afib for analysis in analyses] == [
+        serie.ecg.afib for serie, _ in recordings
+    ]
+    for analysis, (_, response) in zip(analyses, recordings):
+        # Synthetic signals beat at 50 to 100 bpm with 5% of jitter.
+        assert analysis.heart_rate is not None
+        assert 47 < analysis.heart_rate < 105
+        assert len(analysis.peaks) == pytest.approx(
+            response.duration * analysis.heart_rate / 60, abs=1.5
+        )
+        assert analysis.sdnn is not None
+        assert analysis.sdnn < 0.1 * 60000 / analysis.heart_rate
+
+
+def test_backends_agree() -> None:
+    """Test function."""
+    for seed in range(3):
+        response = HeartGetResponse(**synthetic.heart_get_body(seed=seed))
+        set_analysis_backend("python")
+        expected = analyze_ecg(response)
+        set_analysis_backend("numpy")
+        analysis = analyze_ecg(response)
+        assert analysis.peaks == expected.peaks
+        assert analysis.rr_intervals == pytest.approx(expected.rr_intervals)
+        assert analysis[3:] == pytest.approx(expected[3:])
+
+
+def test_set_analysis_backend() -> None:
+    """Test function."""
+    with pytest.raises(ValueError):
+        set_analysis_backend("unknown")
@@ -0,0 +1,199 @@
+"""Tests that fast decoding matches the pydantic models."""
+import asyncio
+import re
+from typing import Any, Dict
+
+import httpx
+import pytest
+import responses
+from typing_extensions import Final
+from withings_api import WithingsApi
+from withings_api.aio import AsyncWithingsApi
+from withings_api.common import (
+    ConfiguredBaseModel,
+    GetSleepField,
+    MeasureGetMeasGroupAttrib,
+    MeasureGetMeasGroupCategory,
+    MeasureGetMeasResponse,
+    MeasureType,
+    SleepGetResponse,
+    SleepModel,
+    SleepState,
+)
+from withings_api.fast import (
+    EpochSleepGetTimestampValue,
+    decode_measure_get_meas,
+    decode_sleep_get,
+    to_arrow,
+)
+
+from .common import TIMEZONE_STR0, TIMEZONE_STR1, new_credentials
+
+_UNKNOWN_INT = 1234567
+_SLEEP_GET_BODY: Final = {
+    "model": SleepModel.SLEEP_MONITOR.real,
+    "series": [
+        {"startdate": 1387235398, "state": SleepState.AWAKE, "enddate": 1387235758},
+        {
+            "startdate": 1387243618,
+            "state": SleepState.LIGHT,
+            "enddate": 1387244518,
+            "hr": {"1387243618": 12, "1387243700": 34},
+            "rr": {"1387243618": 45, "1387243700": 67},
+            "snoring": {"1387243618": 78, "1387243700": 90},
+            "sdnn_1": {"1387243618": 11, "1387243700": "12"},
+            "rmssd": {"1387243618": 13, "1387243700": 14},
+        },
+        {"startdate": "1387235398", "state": _UNKNOWN_INT, "enddate": 1387235758},
+    ],
+}
+_MEASURE_GET_MEAS_BODY: Final = {
+    "more": 1,
+    "offset": "3",
+    "updatetime": 1409596058,
+    "timezone": TIMEZONE_STR1,
+    "measuregrps": [
+        {
+            "attrib": MeasureGetMeasGroupAttrib.MANUAL_USER_DURING_ACCOUNT_CREATION,
+            "category": MeasureGetMeasGroupCategory.REAL,
+            "created": 1111111111,
+            "date": "2019-01-01",
+            "deviceid": "dev1",
+            "grpid": 1,
+            "measures": [
+                {"type": MeasureType.HEIGHT, "unit": 110, "value": 110},
+                {"type": MeasureType.WEIGHT, "unit": -3, "value": 82500},
+            ],
+        },
+        {
+            "attrib": _UNKNOWN_INT,
+            "category": _UNKNOWN_INT,
+            "created": "2222222222",
+            "date": 2222222222,
+            "grpid": 2,
+            "measures": [{"type": _UNKNOWN_INT, "unit": 230, "value": 230}],
+        },
+    ],
+}
+
+
+def assert_equivalent(model: Any, record: Any) -> None:
+    """Assert a record holds the same data as a pydantic model."""
+    if isinstance(model, ConfiguredBaseModel):
+        assert set(model.__fields__) == set(record._fields)
+        for name in model.__fields__:
+            assert_equivalent(getattr(model, name), getattr(record, name))
+        return
+
+    if isinstance(model, tuple):
+        assert len(model) == len(record)
+        for model_item, record_item in zip(model, record):
+            assert_equivalent(model_item, record_item)
+        return
+
+    assert type(model) is type(record)  # pylint: disable=unidiomatic-typecheck
+    assert model == record
+
+
+@pytest.mark.parametrize(
+    "body",
+    (
+        _SLEEP_GET_BODY,
+        {**_SLEEP_GET_BODY, "model": _UNKNOWN_INT},
+        {"model": SleepModel.TRACKER.real, "series": []},
+    ),
+)
+def test_decode_sleep_get(body: Dict[str, Any]) -> None:
+    """Test function."""
+    assert_equivalent(SleepGetResponse(**body), decode_sleep_get(body))
+
+
+def test_decode_sleep_get_lazy() -> None:
+    """Test function."""
+    lazy: Final = decode_sleep_get(_SLEEP_GET_BODY, lazy_timestamps=True)
+    eager: Final = decode_sleep_get(_SLEEP_GET_BODY)
+
+    assert lazy.series[1].hr[1] == EpochSleepGetTimestampValue(1387243700, 34)
+    for lazy_serie, eager_serie in zip(lazy.series, eager.series):
+        for field in ("hr", "rr", "snoring", "sdnn_1", "rmssd"):
+            assert [
+                (item.timestamp, item.value) for item in getattr(lazy_serie, field)
+            ] == [(item.timestamp, item.value) for item in getattr(eager_serie, field)]
+
+
+@pytest.mark.parametrize(
+    "body",
+    (
+        _MEASURE_GET_MEAS_BODY,
+        {**_MEASURE_GET_MEAS_BODY, "more": None, "offset": None},
+        {**_MEASURE_GET_MEAS_BODY, "measuregrps": [], "timezone": TIMEZONE_STR0},
+    ),
+)
+def test_decode_measure_get_meas(body: Dict[str, Any]) -> None:
+    """Test function."""
+    assert_equivalent(MeasureGetMeasResponse(**body), decode_measure_get_meas(body))
+
+
+def test_to_arrow() -> None:
+    """Test function."""
+    assert to_arrow(1409596058).int_timestamp == 1409596058
+    assert to_arrow("1409596058").int_timestamp == 1409596058
+    assert to_arrow("2019-01-01").format("YYYY-MM-DD") == "2019-01-01"
+    with pytest.raises(TypeError):
+        to_arrow(1.5)
+
+
+@responses.activate
+def test_api_fast_methods() -> None:
+    """Test function."""
+    responses.add(
+        method=responses.GET,
+        url=re.compile("https://wbsapi.withings.net/v2/sleep?.*action=get(&.+)?"),
+        status=200,
+        json={"status": 0, "body": _SLEEP_GET_BODY},
+    )
+    responses.add(
+        method=responses.GET,
+        url=re.compile("https://wbsapi.withings.net/measure?.*action=getmeas(&.*)?"),
+        status=200,
+        json={"status": 0, "body": _MEASURE_GET_MEAS_BODY},
+    )
+    api: Final = WithingsApi(new_credentials())
+
+    assert api.sleep_get_fast(data_fields=(GetSleepField.HR,)) == decode_sleep_get(
+        _SLEEP_GET_BODY
+    )
+    assert api.sleep_get_fast(
+        data_fields=(GetSleepField.HR,), lazy_timestamps=True
+    ) == decode_sleep_get(_SLEEP_GET_BODY, lazy_timestamps=True)
+    assert api.measure_get_meas_fast(
+        meastype=MeasureType.WEIGHT
+    ) == decode_measure_get_meas(_MEASURE_GET_MEAS_BODY)
+    assert "meastype=1" in str(responses.calls[2].request.url)
+
+
+def test_async_api_fast_methods() -> None:
+    """Test function."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/v2/sleep":
+            return httpx.Response(200, json={"status": 0, "body": _SLEEP_GET_BODY})
+        return httpx.Response(200, json={"status": 0, "body": _MEASURE_GET_MEAS_BODY})
+
+    api: Final = AsyncWithingsApi(
+        new_credentials(),
+        client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+    )
+
+    async def fetch() -> None:
+        assert await api.sleep_get_fast(
+            data_fields=(GetSleepField.HR,)
+        ) == decode_sleep_get(_SLEEP_GET_BODY)
+        assert await api.sleep_get_fast(
+            data_fields=(GetSleepField.HR,), lazy_timestamps=True
+        ) == decode_sleep_get(_SLEEP_GET_BODY, lazy_timestamps=True)
+        assert await api.measure_get_meas_fast() == decode_measure_get_meas(
+            _MEASURE_GET_MEAS_BODY
+        )
+
+    asyncio.run(fetch())
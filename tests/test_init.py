@@ -1,6 +1,8 @@
 """Tets for main API."""
 import datetime
+import json
 import re
+from typing import Any, Dict, List, Tuple
 from unittest.mock import MagicMock
 from urllib import parse
 
@@ -47,7 +49,14 @@ from withings_api.common import (
     UserGetDeviceResponse,
 )
 
-from .common import TIMEZONE0, TIMEZONE1, TIMEZONE_STR0, TIMEZONE_STR1
+from .common import (
+    TIMEZONE0,
+    TIMEZONE1,
+    TIMEZONE_STR0,
+    TIMEZONE_STR1,
+    add_slow_refresh,
+    new_credentials,
+)
 
 _UNKNOWN_INT = 1234567
 _USERID: Final = 12345
@@ -1238,6 +1247,23 @@ def test_measure_get_meas_params(withings_api: WithingsApi) -> None:
     assert_url_query_equals(responses.calls[0].request.url, {"action": "getmeas"})
 
 
+@responses.activate
+def test_default_dates_at_call_time(
+    withings_api: WithingsApi, monkeypatch: Any
+) -> None:
+    """Test function."""
+    responses_add_measure_get_meas()
+    for now in (1546300800, 1546387200):
+        monkeypatch.setattr(arrow, "utcnow", lambda now=now: arrow.get(now))
+        withings_api.measure_get_meas()
+
+    for call, expected in zip(responses.calls, ("1546300800", "1546387200")):
+        assert_url_query_equals(
+            call.request.url,
+            {"startdate": expected, "enddate": expected, "lastupdate": expected},
+        )
+
+
 @responses.activate
 def test_measure_get_activity_params(withings_api: WithingsApi) -> None:
     """Test function."""
@@ -1347,6 +1373,209 @@ def test_heart_list_params(withings_api: WithingsApi) -> None:
     assert_url_query_equals(responses.calls[0].request.url, {"action": "list"})
 
 
+def responses_add_paged(
+    url: str, items_key: str, pages: Tuple[List[Dict[str, Any]], ...], **extra: Any
+) -> None:
+    """Set up a paged response where the offset is the page index."""
+
+    def callback(request: Any) -> Tuple[int, Dict[str, str], str]:
+        params: Final = dict(parse.parse_qsl(parse.urlsplit(request.url).query))
+        index: Final = int(params.get("offset", 0))
+        body: Final = {
+            **extra,
+            items_key: pages[index],
+            "more": index + 1 < len(pages),
+            "offset": index + 1,
+        }
+        return 200, {}, json.dumps({"status": 0, "body": body})
+
+    responses.add_callback(
+        method=responses.GET,
+        url=re.compile(url),
+        callback=callback,
+        content_type="application/json",
+    )
+
+
+def heart_list_serie_data(signalid: int) -> Dict[str, Any]:
+    """Create the json of a heart list serie."""
+    return {
+        "model": HeartModel.SCANWATCH.real,
+        "ecg": {"signalid": signalid, "afib": AfibClassification.NEGATIVE.real},
+        "heart_rate": 60,
+        "timestamp": 1594911107 + signalid,
+    }
+
+
+@pytest.mark.parametrize("prefetch", (False, True))
+@responses.activate
+def test_iter_heart_series(withings_api: WithingsApi, prefetch: bool) -> None:
+    """Test function."""
+    responses_add_paged(
+        "https://wbsapi.withings.net/v2/heart?.*action=list(&.*)?",
+        "series",
+        (
+            [heart_list_serie_data(1), heart_list_serie_data(2)],
+            [],
+            [heart_list_serie_data(3)],
+        ),
+    )
+
+    series: Final = tuple(
+        withings_api.iter_heart_series(
+            startdate="2020-01-01", enddate="2020-07-23", prefetch=prefetch
+        )
+    )
+
+    assert [serie.ecg.signalid for serie in series] == [1, 2, 3]
+    assert len(responses.calls) == 3
+    assert "offset" not in str(responses.calls[0].request.url)
+    assert_url_query_equals(
+        responses.calls[2].request.url, {"offset": "2", "startdate": "1577836800"}
+    )
+
+
+@pytest.mark.parametrize("prefetch", (False, True))
+@responses.activate
+def test_iter_pages_stop_early(withings_api: WithingsApi, prefetch: bool) -> None:
+    """Test function."""
+    responses_add_paged(
+        "https://wbsapi.withings.net/v2/heart?.*action=list(&.*)?",
+        "series",
+        ([heart_list_serie_data(1)], [heart_list_serie_data(2)], []),
+    )
+
+    series: Final = withings_api.iter_heart_series(prefetch=prefetch)
+    assert next(series).ecg.signalid == 1
+    series.close()
+
+    assert len(responses.calls) == (2 if prefetch else 1)
+
+
+@responses.activate
+def test_iter_pages_prefetch_expired_token() -> None:
+    """Test function."""
+    refreshes: Final = add_slow_refresh()
+    responses_add_heart_get(HeartWearPosition.LEFT_ARM.real)
+    api: Final = WithingsApi(new_credentials())
+    pages: Final = ([heart_list_serie_data(1)], [heart_list_serie_data(2)])
+
+    def callback(request: Any) -> Tuple[int, Dict[str, str], str]:
+        params: Final = dict(parse.parse_qsl(parse.urlsplit(request.url).query))
+        index: Final = int(params.get("offset", 0))
+        if index == 0:
+            # Expire the token before the prefetch and the caller use it.
+            api.use_credentials(new_credentials(expires_in=-1))
+        body: Final = {"series": pages[index], "more": index == 0, "offset": 1}
+        return 200, {}, json.dumps({"status": 0, "body": body})
+
+    responses.add_callback(
+        method=responses.GET,
+        url=re.compile("https://wbsapi.withings.net/v2/heart?.*action=list(&.*)?"),
+        callback=callback,
+    )
+
+    for serie in api.iter_heart_series(prefetch=True):
+        api.heart_get(serie.ecg.signalid)
+
+    # The prefetch thread and the caller share one refresh.
+    assert refreshes == ["my_refresh_token"]
+
+
+@responses.activate
+def test_iter_measure_groups(withings_api: WithingsApi) -> None:
+    """Test function."""
+    responses_add_paged(
+        "https://wbsapi.withings.net/measure?.*action=getmeas(&.*)?",
+        "measuregrps",
+        tuple(
+            [
+                {
+                    "attrib": MeasureGetMeasGroupAttrib.MEASURE_AUTO.real,
+                    "category": MeasureGetMeasGroupCategory.REAL.real,
+                    "created": 1111111111,
+                    "date": 1111111111,
+                    "deviceid": "dev1",
+                    "grpid": grpid,
+                    "measures": [
+                        {"type": MeasureType.WEIGHT.real, "unit": -3, "value": grpid}
+                    ],
+                }
+            ]
+            for grpid in range(3)
+        ),
+        timezone=TIMEZONE_STR0,
+        updatetime=1409596058,
+    )
+
+    groups: Final = tuple(
+        withings_api.iter_measure_groups(meastype=MeasureType.WEIGHT, prefetch=True)
+    )
+
+    assert [group.grpid for group in groups] == [0, 1, 2]
+    assert_url_query_equals(responses.calls[1].request.url, {"meastype": "1"})
+
+
+@responses.activate
+def test_iter_activities(withings_api: WithingsApi) -> None:
+    """Test function."""
+    responses_add_paged(
+        "https://wbsapi.withings.net/v2/measure?.*action=getactivity(&.*)?",
+        "activities",
+        tuple(
+            [
+                {
+                    "date": "2019-01-0%s" % day,
+                    "timezone": TIMEZONE_STR0,
+                    "is_tracker": True,
+                    "brand": 18,
+                    "totalcalories": 1.5,
+                }
+            ]
+            for day in range(1, 3)
+        ),
+    )
+
+    activities: Final = tuple(
+        withings_api.iter_activities(data_fields=(GetActivityField.STEPS,))
+    )
+
+    assert [activity.date.day for activity in activities] == [1, 2]
+    assert_url_query_equals(responses.calls[1].request.url, {"data_fields": "steps"})
+
+
+@responses.activate
+def test_iter_sleep_summary_series(withings_api: WithingsApi) -> None:
+    """Test function."""
+    responses_add_paged(
+        "https://wbsapi.withings.net/v2/sleep?.*action=getsummary(&.*)?",
+        "series",
+        tuple(
+            [
+                {
+                    "id": serie_id,
+                    "timezone": TIMEZONE_STR0,
+                    "model": SleepModel.SLEEP_MONITOR.real,
+                    "startdate": 1548979200,
+                    "enddate": 1548979200,
+                    "date": "2019-02-01",
+                    "modified": 12345,
+                    "data": {},
+                }
+            ]
+            for serie_id in range(2)
+        ),
+    )
+
+    series: Final = tuple(
+        withings_api.iter_sleep_summary_series(
+            data_fields=(GetSleepSummaryField.HR_AVERAGE,)
+        )
+    )
+
+    assert [serie.id for serie in series] == [0, 1]
+
+
 def assert_url_query_equals(url: str, expected: dict) -> None:
     """Assert a url query contains specific params."""
     params: Final = dict(parse.parse_qsl(parse.urlsplit(url).query))
@@ -0,0 +1,247 @@
+"""Tests for the mock server."""
+from typing import Any, Iterator
+
+from oauthlib.oauth2.rfc6749.errors import OAuth2Error
+import pytest
+from typing_extensions import Final
+from withings_api.common import (
+    AuthFailedException,
+    GetSleepField,
+    GetSleepSummaryField,
+    InvalidParamsException,
+    MeasureGetMeasGroupCategory,
+    MeasureType,
+    NotifyAppli,
+    TooManyRequestsException,
+)
+from withings_api.mock_server import (
+    STATUS_AUTH_FAILED,
+    STATUS_INVALID_PARAMS,
+    STATUS_NOT_FOUND,
+    MockWithingsServer,
+)
+from withings_api.synthetic import DAY, START
+
+from .common import FakeClock
+
+
+@pytest.fixture(name="server")
+def server_fixture(monkeypatch: Any) -> Iterator[MockWithingsServer]:
+    """Run a server."""
+    monkeypatch.setenv("OAUTHLIB_INSECURE_TRANSPORT", "1")
+    server: Final = MockWithingsServer(users=3, days=10, page_size=5, ecg_samples=1000)
+    server.start()
+    yield server
+    server.stop()
+
+
+def test_data(server: MockWithingsServer) -> None:
+    """Test function."""
+    api: Final = server.api(2)
+
+    groups: Final = list(api.iter_measure_groups(lastupdate=0))
+    assert len(groups) >= 10
+    assert [group.date for group in groups] == sorted(group.date for group in groups)
+    assert server.calls[("measure", "getmeas")] > 1
+    assert groups != list(server.api(3).iter_measure_groups(lastupdate=0))
+
+    weights: Final = api.measure_get_meas(
+        meastype=MeasureType.WEIGHT,
+        category=MeasureGetMeasGroupCategory.REAL,
+        startdate=START,
+        enddate=START + 10 * DAY,
+        lastupdate=None,
+    )
+    assert all(
+        measure.type == MeasureType.WEIGHT
+        for group in weights.measuregrps
+        for measure in group.measures
+    )
+    assert not api.measure_get_meas(
+        category=MeasureGetMeasGroupCategory.USER_OBJECTIVES, lastupdate=0
+    ).measuregrps
+
+    activities: Final = list(
+        api.iter_activities(
+            startdateymd="2020-01-01", enddateymd="2020-01-10", lastupdate=None
+        )
+    )
+    assert [activity.date.format("YYYY-MM-DD") for activity in activities][:2] == [
+        "2020-01-01",
+        "2020-01-02",
+    ]
+    assert len(activities) == 10
+
+    series: Final = list(
+        api.iter_sleep_summary_series([GetSleepSummaryField.TOTAL_SLEEP], lastupdate=0)
+    )
+    assert len(series) == 10
+    assert series[0].data.total_sleep_time
+    assert series[0].data.deepsleepduration is None
+
+    sleep: Final = api.sleep_get(
+        [GetSleepField.HR], startdate=START, enddate=START + 2 * DAY
+    )
+    assert sleep.series
+    assert all(serie.hr and not serie.rr for serie in sleep.series)
+
+    heart_series: Final = list(
+        api.iter_heart_series(startdate=START, enddate=START + 10 * DAY)
+    )
+    assert len(heart_series) == 4
+    assert len(api.heart_get(heart_series[0].ecg.signalid).signal) == 1000
+    with pytest.raises(InvalidParamsException):
+        api.heart_get(12345)
+
+    assert api.user_get_device().devices
+
+
+def test_notify(server: MockWithingsServer) -> None:
+    """Test function."""
+    api: Final = server.api(1)
+
+    api.notify_subscribe("http://localhost/a", NotifyAppli.WEIGHT, "first")
+    api.notify_subscribe("http://localhost/b", NotifyAppli.SLEEP)
+    assert api.notify_get("http://localhost/a").comment == "first"
+    assert len(api.notify_list().profiles) == 2
+    assert len(api.notify_list(NotifyAppli.SLEEP).profiles) == 1
+    assert not server.api(2).notify_list().profiles
+
+    api.notify_update(
+        "http://localhost/a", NotifyAppli.WEIGHT, "http://localhost/c", comment="new"
+    )
+    assert api.notify_get("http://localhost/c").comment == "new"
+
+    api.notify_revoke("http://localhost/c")
+    with pytest.raises(InvalidParamsException):
+        api.notify_get("http://localhost/c")
+    assert (
+        server.handle(
+            "notify",
+            {
+                "action": "get",
+                "callbackurl": "http://localhost/c",
+                "access_token": api.get_credentials().access_token,
+            },
+        )["status"]
+        == STATUS_NOT_FOUND
+    )
+
+
+def test_tokens(monkeypatch: Any) -> None:
+    """Test function."""
+    monkeypatch.setenv("OAUTHLIB_INSECURE_TRANSPORT", "1")
+    clock: Final = FakeClock(START + 10 * DAY)
+    server: Final = MockWithingsServer(users=2, days=2, clock=clock)
+    server.start()
+    api: Final = server.api(1)
+    old_refresh_token: Final = api.get_credentials().refresh_token
+
+    api.refresh_token()
+    assert api.get_credentials().refresh_token != old_refresh_token
+    assert api.user_get_device().devices
+
+    token_params: Final = {
+        "action": "requesttoken",
+        "client_id": MockWithingsServer.CLIENT_ID,
+        "client_secret": MockWithingsServer.CONSUMER_SECRET,
+    }
+    assert (
+        server.handle(
+            "v2/oauth2",
+            {
+                **token_params,
+                "grant_type": "refresh_token",
+                "refresh_token": old_refresh_token,
+            },
+        )["status"]
+        == STATUS_AUTH_FAILED
+    )
+    assert server.handle(
+        "v2/oauth2",
+        {
+            **token_params,
+            "grant_type": "authorization_code",
+            "code": server.authorization_code(2),
+        },
+    )["body"]["userid"] == (2)
+    for code in ("code-3", "nonsense"):
+        assert (
+            server.handle(
+                "v2/oauth2",
+                {**token_params, "grant_type": "authorization_code", "code": code},
+            )["status"]
+            == STATUS_AUTH_FAILED
+        )
+    assert (
+        server.handle("v2/oauth2", {**token_params, "client_secret": "wrong"})["status"]
+        == STATUS_INVALID_PARAMS
+    )
+
+    clock.now += 10800
+    with pytest.raises(AuthFailedException):
+        api.user_get_device()
+    server.stop()
+    server.stop()
+
+
+def test_faults(monkeypatch: Any) -> None:
+    """Test function."""
+    monkeypatch.setenv("OAUTHLIB_INSECURE_TRANSPORT", "1")
+    clock: Final = FakeClock(START + 10 * DAY)
+    server: Final = MockWithingsServer(users=1, days=2, rate_limit=2, clock=clock)
+    server.start()
+    api: Final = server.api(1)
+
+    server.inject(601, count=2, path="v2/user")
+    for _ in range(2):
+        with pytest.raises(TooManyRequestsException):
+            api.user_get_device()
+    api.user_get_device()
+    api.user_get_device()
+    with pytest.raises(TooManyRequestsException):
+        api.user_get_device()
+    clock.now += 61
+    api.user_get_device()
+
+    server.inject(100, path="v2/oauth2")
+    with pytest.raises(OAuth2Error):
+        api.refresh_token()
+
+    assert server.handle("measure", {"action": "unknown"})["status"] == (
+        STATUS_INVALID_PARAMS
+    )
+    assert server.handle("measure", {"action": "getmeas"})["status"] == (
+        STATUS_AUTH_FAILED
+    )
+    server.stop()
+
+
+def test_add_days(monkeypatch: Any) -> None:
+    """Test function."""
+    monkeypatch.setenv("OAUTHLIB_INSECURE_TRANSPORT", "1")
+    clock: Final = FakeClock(START + 10 * DAY)
+    server: Final = MockWithingsServer(
+        users=1, days=2, token_lifetime=10 * DAY, clock=clock
+    )
+
+    with pytest.raises(RuntimeError):
+        server.api(1)
+
+    server.start()
+    api: Final = server.api(1)
+    first_sync: Final = list(api.iter_measure_groups(lastupdate=0))
+
+    clock.now += DAY
+    server.add_days()
+    assert server.days == 3
+    second_sync: Final = list(api.iter_measure_groups(lastupdate=int(clock.now)))
+    assert second_sync
+    assert all(
+        START + 2 * DAY <= group.date.int_timestamp < START + 3 * DAY
+        for group in second_sync
+    )
+    assert not set(group.grpid for group in first_sync) & set(
+        group.grpid for group in second_sync
+    )
+    server.stop()
@@ -0,0 +1,117 @@
+"""Tests for the client pool."""
+from concurrent.futures import ThreadPoolExecutor
+import re
+
+import pytest
+import responses
+from typing_extensions import Final
+from withings_api.common import Credentials2
+from withings_api.credentials import MemoryCredentialStore, RefreshCoordinator
+from withings_api.pool import WithingsClientPool
+from withings_api.transport import SharedTransport
+
+from .common import new_credentials
+
+
+class CountingStore(MemoryCredentialStore):
+    """A store that counts its writes."""
+
+    def __init__(self) -> None:
+        """Initialize new object."""
+        super().__init__()
+        self.puts = 0
+
+    def put(self, credentials: Credentials2) -> None:
+        """Save credentials, replacing those of the same user."""
+        self.puts += 1
+        super().put(credentials)
+
+
+def new_store() -> CountingStore:
+    """Create a store with users 1 to 3."""
+    store: Final = CountingStore()
+    for userid in (1, 2, 3):
+        store.put(new_credentials(userid))
+    return store
+
+
+def test_get_builds_lazily() -> None:
+    """Test function."""
+    pool: Final = WithingsClientPool(new_store(), transport=SharedTransport())
+
+    assert len(pool) == 0
+    api: Final = pool.get(1)
+    assert api.get_credentials().userid == 1
+    assert pool.get(1) is api
+    assert 1 in pool
+    assert 2 not in pool
+
+    with pytest.raises(KeyError):
+        pool.get(4)
+    assert len(pool) == 1
+
+
+def test_lru_eviction() -> None:
+    """Test function."""
+    pool: Final = WithingsClientPool(new_store(), maxsize=2)
+
+    api1: Final = pool.get(1)
+    pool.get(2)
+    assert pool.get(1) is api1
+    pool.get(3)
+    assert 1 in pool
+    assert 2 not in pool
+    assert len(pool) == 2
+
+    pool.evict(1)
+    pool.evict(5)
+    assert pool.get(1) is not api1
+
+    pool.clear()
+    assert len(pool) == 0
+
+
+def test_concurrent_get() -> None:
+    """Test function."""
+    pool: Final = WithingsClientPool(new_store())
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        apis: Final = list(executor.map(lambda _: pool.get(1), range(32)))
+
+    assert all(api is apis[0] for api in apis)
+
+
+@responses.activate
+def test_refresh_writes_store() -> None:
+    """Test function."""
+    responses.add(
+        method=responses.POST,
+        url=re.compile("https://wbsapi.withings.net/v2/oauth2.*"),
+        status=200,
+        json={
+            "status": 0,
+            "body": {
+                "access_token": "my_access_token_refreshed",
+                "expires_in": 10800,
+                "token_type": "Bearer",
+                "refresh_token": "my_refresh_token_refreshed",
+                "userid": 1,
+            },
+        },
+    )
+    for coordinated in (False, True):
+        store = new_store()
+        pool = WithingsClientPool(
+            store,
+            refresh_coordinator=RefreshCoordinator(store) if coordinated else None,
+        )
+
+        pool.get(1).refresh_token()
+        pool.clear()
+
+        credentials = store.get(1)
+        assert credentials is not None
+        assert credentials.access_token == "my_access_token_refreshed"
+        assert pool.get(1).get_credentials() == credentials
+        # Written once, by the coordinator when it keeps the same store.
+        assert store.puts == 4
@@ -0,0 +1,219 @@
+"""Tests for indexed measure queries."""
+import arrow
+from typing_extensions import Final
+from withings_api.common import (
+    MeasureGetMeasGroup,
+    MeasureGetMeasGroupAttrib,
+    MeasureGetMeasGroupCategory,
+    MeasureGetMeasMeasure,
+    MeasureGetMeasResponse,
+    MeasureGroupAttribs,
+    MeasureType,
+    MeasureTypes,
+    get_measure_value,
+)
+from withings_api.fast import decode_measure_get_meas
+from withings_api.query import MeasureIndex
+
+from .common import TIMEZONE0, TIMEZONE_STR0
+
+
+def new_group(
+    grpid: int,
+    date: int,
+    attrib: MeasureGetMeasGroupAttrib,
+    *measures: MeasureGetMeasMeasure,
+) -> MeasureGetMeasGroup:
+    """Create a measure group."""
+    return MeasureGetMeasGroup(
+        attrib=attrib,
+        category=MeasureGetMeasGroupCategory.REAL,
+        created=arrow.get(date),
+        date=arrow.get(date),
+        deviceid="dev%s" % grpid,
+        grpid=grpid,
+        measures=measures,
+    )
+
+
+RESPONSE: Final = MeasureGetMeasResponse(
+    offset=0,
+    more=False,
+    timezone=TIMEZONE0,
+    updatetime=arrow.get(100000),
+    measuregrps=(
+        new_group(
+            1,
+            300,
+            MeasureGetMeasGroupAttrib.DEVICE_ENTRY_FOR_USER,
+            MeasureGetMeasMeasure(type=MeasureType.WEIGHT, unit=-1, value=805),
+            MeasureGetMeasMeasure(type=MeasureType.FAT_RATIO, unit=0, value=20),
+        ),
+        new_group(
+            2,
+            100,
+            MeasureGetMeasGroupAttrib.MEASURE_USER_CONFIRMED,
+            MeasureGetMeasMeasure(type=MeasureType.WEIGHT, unit=-1, value=810),
+        ),
+        new_group(
+            3,
+            200,
+            MeasureGetMeasGroupAttrib.DEVICE_ENTRY_FOR_USER_AMBIGUOUS,
+            MeasureGetMeasMeasure(type=MeasureType.WEIGHT, unit=0, value=90),
+        ),
+        new_group(
+            4,
+            400,
+            MeasureGetMeasGroupAttrib.MANUAL_USER_ENTRY,
+            MeasureGetMeasMeasure(type=MeasureType.HEIGHT, unit=-2, value=180),
+        ),
+    ),
+)
+
+
+def test_value_matches_get_measure_value() -> None:
+    """Test function."""
+    index: Final = MeasureIndex(RESPONSE)
+
+    for measure_type in (
+        MeasureType.WEIGHT,
+        MeasureType.HEIGHT,
+        MeasureType.FAT_RATIO,
+        MeasureType.BONE_MASS,
+        (MeasureType.HEIGHT, MeasureType.FAT_RATIO),
+    ):
+        for group_attrib in (
+            MeasureGroupAttribs.ANY,
+            MeasureGroupAttribs.UNAMBIGUOUS,
+            MeasureGroupAttribs.AMBIGUOUS,
+            MeasureGetMeasGroupAttrib.MEASURE_USER_CONFIRMED,
+        ):
+            assert index.value(measure_type, group_attrib) == get_measure_value(
+                RESPONSE, measure_type, group_attrib
+            )
+
+    assert index.value(MeasureType.WEIGHT) == 80.5
+    assert get_measure_value(RESPONSE.measuregrps[1], MeasureType.WEIGHT) == 81.0
+    assert get_measure_value(RESPONSE.measuregrps, MeasureType.BONE_MASS) is None
+
+
+def test_groups_and_entries() -> None:
+    """Test function."""
+    index: Final = MeasureIndex(RESPONSE)
+
+    assert len(index) == 4
+    assert index.measure_types == {
+        MeasureType.WEIGHT,
+        MeasureType.FAT_RATIO,
+        MeasureType.HEIGHT,
+    }
+    assert tuple(index.groups()) == RESPONSE.measuregrps
+    assert [group.grpid for group in index.groups(MeasureType.WEIGHT)] == [1, 2, 3]
+    assert [
+        group.grpid
+        for group in index.groups(
+            MeasureType.WEIGHT, MeasureGetMeasGroupAttrib.MEASURE_USER_CONFIRMED
+        )
+    ] == [2]
+    assert [
+        group.grpid
+        for group in index.groups(MeasureTypes.ANY, MeasureGroupAttribs.UNAMBIGUOUS)
+    ] == [1, 2, 4]
+    assert [
+        group.grpid
+        for group in index.groups(
+            MeasureType.HEIGHT, MeasureGetMeasGroupAttrib.MEASURE_USER_CONFIRMED
+        )
+    ] == []
+
+    entries: Final = tuple(index.entries((MeasureType.WEIGHT, MeasureType.HEIGHT)))
+    assert [(entry.group.grpid, entry.type) for entry in entries] == [
+        (1, MeasureType.WEIGHT),
+        (2, MeasureType.WEIGHT),
+        (3, MeasureType.WEIGHT),
+        (4, MeasureType.HEIGHT),
+    ]
+    assert [entry.value for entry in entries] == [80.5, 81.0, 90.0, 1.8]
+    assert tuple(index.entries(MeasureType.BONE_MASS)) == ()
+
+
+def test_date_lookups() -> None:
+    """Test function."""
+    index: Final = MeasureIndex(RESPONSE)
+
+    first: Final = index.first(MeasureType.WEIGHT)
+    assert first is not None
+    assert first.group.grpid == 2
+    assert first.date == arrow.get(100)
+
+    latest: Final = index.latest(MeasureType.WEIGHT)
+    assert latest is not None
+    assert latest.group.grpid == 1
+
+    unambiguous_first: Final = index.first(
+        MeasureType.WEIGHT, MeasureGetMeasGroupAttrib.DEVICE_ENTRY_FOR_USER
+    )
+    assert unambiguous_first is not None
+    assert unambiguous_first.group.grpid == 1
+    assert index.latest(MeasureType.BONE_MASS) is None
+    assert index.first(MeasureType.BONE_MASS) is None
+
+    assert [entry.group.grpid for entry in index.between(MeasureType.WEIGHT)] == [
+        2,
+        3,
+        1,
+    ]
+    assert [
+        entry.group.grpid for entry in index.between(MeasureType.WEIGHT, 200, 300)
+    ] == [3, 1]
+    assert [
+        entry.group.grpid
+        for entry in index.between(
+            MeasureType.WEIGHT,
+            enddate=arrow.get(250),
+            with_group_attrib=MeasureGroupAttribs.UNAMBIGUOUS,
+        )
+    ] == [2]
+    assert index.between(MeasureType.WEIGHT, 301) == ()
+    assert index.between(MeasureType.BONE_MASS) == ()
+
+
+def test_fast_records() -> None:
+    """Test function."""
+    body: Final = {
+        "more": 0,
+        "offset": 0,
+        "updatetime": 100000,
+        "timezone": TIMEZONE_STR0,
+        "measuregrps": [
+            {
+                "attrib": group.attrib.real,
+                "category": group.category.real,
+                "created": group.created.int_timestamp,
+                "date": group.date.int_timestamp,
+                "deviceid": group.deviceid,
+                "grpid": group.grpid,
+                "measures": [
+                    {
+                        "type": measure.type.real,
+                        "unit": measure.unit,
+                        "value": measure.value,
+                    }
+                    for measure in group.measures
+                ],
+            }
+            for group in RESPONSE.measuregrps
+        ],
+    }
+    fast_index: Final = MeasureIndex(decode_measure_get_meas(body))
+    index: Final = MeasureIndex(RESPONSE)
+
+    assert fast_index.value(MeasureType.WEIGHT) == index.value(MeasureType.WEIGHT)
+    assert [entry.value for entry in fast_index.between(MeasureType.WEIGHT)] == [
+        entry.value for entry in index.between(MeasureType.WEIGHT)
+    ]
+    assert MeasureIndex(RESPONSE.measuregrps[0]).measure_types == {
+        MeasureType.WEIGHT,
+        MeasureType.FAT_RATIO,
+    }
+    assert len(MeasureIndex(RESPONSE.measuregrps)) == 4
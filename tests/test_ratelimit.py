@@ -0,0 +1,161 @@
+"""Tests for rate limiting."""
+import asyncio
+import re
+
+import httpx
+import pytest
+import responses
+from typing_extensions import Final
+from withings_api import WithingsApi
+from withings_api.aio import AsyncWithingsApi
+from withings_api.common import TooManyRequestsException
+from withings_api.ratelimit import RateLimiter, TokenBucket
+
+from .common import FakeClock, new_credentials
+
+
+def test_token_bucket() -> None:
+    """Test function."""
+    clock: Final = FakeClock()
+    bucket: Final = TokenBucket(rate=2.0, capacity=2.0, clock=clock)
+
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0.5
+    assert bucket.reserve() == 1.0
+
+    clock.now += 10
+    assert bucket.reserve() == 0
+
+    bucket.set_rate(1.0)
+    assert bucket.rate == 1.0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 1.0
+
+
+def test_client_and_user_rates() -> None:
+    """Test function."""
+    clock: Final = FakeClock()
+    limiter: Final = RateLimiter(
+        client_rate=10.0,
+        client_burst=10.0,
+        user_rate=1.0,
+        user_burst=1.0,
+        clock=clock,
+        sleep=clock.sleep,
+    )
+
+    limiter.acquire("client", 1)
+    limiter.acquire("client", 2)
+    assert clock.sleeps == []
+
+    limiter.acquire("client", 1)
+    assert clock.sleeps == [1.0]
+
+    # Clients are limited independently.
+    assert limiter.reserve("other_client") == 0
+
+
+def test_too_many_requests_backoff() -> None:
+    """Test function."""
+    clock: Final = FakeClock()
+    limiter: Final = RateLimiter(
+        client_rate=4.0,
+        client_burst=100.0,
+        min_client_rate=1.0,
+        backoff_base=1.0,
+        backoff_max=3.0,
+        clock=clock,
+        sleep=clock.sleep,
+    )
+
+    limiter.update("client", 1, 601)
+    assert limiter.reserve("client", 1) == 1.0
+    # pylint: disable=protected-access
+    assert limiter._client_buckets.get("client").rate == 2.0
+
+    # Calls in flight when backing off are ignored.
+    limiter.update("client", 1, 601)
+    limiter.update("client", 2, 601)
+    assert limiter.reserve("client", 1) == 1.0
+    assert limiter._client_buckets.get("client").rate == 2.0
+
+    clock.now += 1
+    limiter.update("client", 1, 601)
+    assert limiter.reserve("client", 2) == 2.0
+    clock.now += 2
+    limiter.update("client", 1, 601)
+    clock.now += 3
+    limiter.update("client", 1, 601)
+    assert limiter.reserve("client") == 3.0
+    assert limiter._client_buckets.get("client").rate == 1.0
+
+    limiter.update("client", 1, 0)
+    assert limiter.reserve("client", 1) == 0
+    assert limiter._client_buckets.get("client").rate == 1.4
+
+
+def test_timeout_backs_off_user() -> None:
+    """Test function."""
+    clock: Final = FakeClock()
+    limiter: Final = RateLimiter(clock=clock, sleep=clock.sleep)
+
+    limiter.update("client", 1, 522)
+    assert limiter.reserve("client", 1) == 1.0
+    assert limiter.reserve("client", 2) == 0
+    assert limiter.reserve("client") == 0
+
+    limiter.update("client", None, 522)
+    limiter.update("client", 1, 0)
+    assert limiter.reserve("client", 1) == 0
+
+
+@responses.activate
+def test_withings_api_rate_limited() -> None:
+    """Test function."""
+    responses.add(
+        method=responses.GET,
+        url=re.compile("https://wbsapi.withings.net/notify?.*action=list(&.*)?"),
+        status=200,
+        json={"status": 601, "body": {}},
+    )
+    clock: Final = FakeClock()
+    limiter: Final = RateLimiter(clock=clock, sleep=clock.sleep)
+    api1: Final = WithingsApi(new_credentials(1), rate_limiter=limiter)
+    api2: Final = WithingsApi(new_credentials(2), rate_limiter=limiter)
+
+    with pytest.raises(TooManyRequestsException):
+        api1.notify_list()
+    with pytest.raises(TooManyRequestsException):
+        api2.notify_list()
+
+    # The second user waits for the backoff caused by the first one.
+    assert clock.sleeps == [1.0]
+
+
+def test_async_withings_api_rate_limited() -> None:
+    """Test function."""
+    clock: Final = FakeClock()
+    limiter: Final = RateLimiter(backoff_base=0.01, clock=clock, sleep=clock.sleep)
+    client: Final = httpx.AsyncClient(
+        transport=httpx.MockTransport(
+            lambda request: httpx.Response(200, json={"status": 601, "body": {}})
+        )
+    )
+    api: Final = AsyncWithingsApi(
+        new_credentials(), client=client, rate_limiter=limiter
+    )
+
+    async def call() -> float:
+        with pytest.raises(TooManyRequestsException):
+            await api.notify_list()
+        return asyncio.get_event_loop().time()
+
+    async def call_twice() -> float:
+        await call()
+        start = asyncio.get_event_loop().time()
+        return await call() - start
+
+    assert asyncio.run(call_twice()) >= 0.01
+    # The event loop is never blocked by the limiter's sleep.
+    assert clock.sleeps == []
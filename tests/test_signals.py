@@ -0,0 +1,252 @@
+"""Tests for signal stores and the heart signal pipeline."""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import json
+from os import path
+import re
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Tuple
+from urllib import parse
+
+import httpx
+import pytest
+import responses
+from typing_extensions import Final
+from withings_api import WithingsApi, synthetic
+from withings_api.aio import AsyncWithingsApi
+from withings_api.common import HeartGetResponse, HeartListSerie, HeartWearPosition
+from withings_api.signals import MemorySignalStore, SignalStore, SQLiteSignalStore
+
+from .common import add_slow_refresh, new_credentials
+
+_SERIES: Final = 6
+
+
+def heart_get_body(signalid: int) -> Any:
+    """Create the body of a signal, its samples start with the signalid."""
+    return {
+        "signal": [signalid, 0, -20000, 40000 if signalid == 2 else 20],
+        "sampling_frequency": 500,
+        "wearposition": HeartWearPosition.LEFT_WRIST.real,
+    }
+
+
+def heart_body(params: Any) -> Any:
+    """Respond to heart list in two pages, and to heart get."""
+    if params["action"] == "get":
+        return heart_get_body(int(params["signalid"]))
+
+    body: Final = synthetic.heart_list_body(count=_SERIES)
+    if "offset" in params:
+        body["series"] = body["series"][_SERIES // 2 :]
+    else:
+        body["series"] = body["series"][: _SERIES // 2]
+        body["more"] = True
+        body["offset"] = _SERIES // 2
+    return body
+
+
+def query(request: Any) -> Dict[str, str]:
+    """Get the query params of a request."""
+    return dict(parse.parse_qsl(parse.urlsplit(request.url).query))
+
+
+def signalids(pairs: List[Tuple[HeartListSerie, HeartGetResponse]]) -> List[int]:
+    """Get the signalids of pairs, checking each serie got its signal."""
+    for serie, response in pairs:
+        assert response.signal[0] == serie.ecg.signalid
+    return [serie.ecg.signalid for serie, _ in pairs]
+
+
+@pytest.fixture(name="store", params=("memory", "sqlite"))
+def store_fixture(request: pytest.FixtureRequest, tmp_path: str) -> Iterator[Any]:
+    """Create each kind of store in turn."""
+    if request.param == "memory":
+        yield MemorySignalStore()
+        return
+
+    store: Final = SQLiteSignalStore(path.join(str(tmp_path), "signals.db"))
+    yield store
+    store.close()
+
+
+def test_store(store: SignalStore) -> None:
+    """Test function."""
+    response: Final = HeartGetResponse(**heart_get_body(2))
+    assert store.get(2) is None
+    assert 2 not in store
+    assert "2" not in store
+
+    store.put(2, response)
+    assert 2 in store
+    assert store.get(2) == response
+    assert store.get(2).signal.samples.format == "i"  # type: ignore
+    store.put(1, HeartGetResponse(**heart_get_body(1)))
+    assert store.get(1).signal.samples.format == "h"  # type: ignore
+
+
+@responses.activate
+def test_iter_heart_signals(store: SignalStore) -> None:
+    """Test function."""
+    running: Final = []
+    lock: Final = threading.Lock()
+
+    def callback(request: Any) -> Tuple[int, dict, str]:
+        params = query(request)
+        with lock:
+            running.append(params.get("signalid"))
+        # Later signals complete first.
+        if params["action"] == "get":
+            time.sleep(0.01 * (_SERIES - int(params["signalid"])))
+        return 200, {}, json.dumps({"status": 0, "body": heart_body(params)})
+
+    responses.add_callback(
+        method=responses.GET,
+        url=re.compile("https://wbsapi.withings.net/v2/heart.*"),
+        callback=callback,
+    )
+    api: Final = WithingsApi(new_credentials())
+    store.put(3, HeartGetResponse(**heart_get_body(3)))
+
+    assert signalids(list(api.iter_heart_signals(store=store, max_workers=3))) == [
+        1,
+        2,
+        4,
+        5,
+        6,
+    ]
+    assert "3" not in running
+    assert all(signalid in store for signalid in range(1, _SERIES + 1))
+
+    running.clear()
+    assert signalids(
+        list(api.iter_heart_signals(store=store, include_stored=True))
+    ) == list(range(1, _SERIES + 1))
+    assert running == [None, None]
+
+    running.clear()
+    assert signalids(list(api.iter_heart_signals(max_workers=0))) == list(
+        range(1, _SERIES + 1)
+    )
+    assert len(running) == _SERIES + 2
+
+
+@responses.activate
+def test_concurrent_expired_token() -> None:
+    """Test function."""
+    refreshes: Final = add_slow_refresh()
+    responses.add_callback(
+        method=responses.GET,
+        url=re.compile("https://wbsapi.withings.net/v2/heart.*"),
+        callback=lambda request: (
+            200,
+            {},
+            json.dumps({"status": 0, "body": heart_body(query(request))}),
+        ),
+    )
+    api: Final = WithingsApi(new_credentials(expires_in=-1))
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        fetched: Final = list(executor.map(api.heart_get, range(1, 5)))
+
+    assert [response.signal[0] for response in fetched] == [1, 2, 3, 4]
+    assert refreshes == ["my_refresh_token"]
+    assert api.get_credentials().access_token == "my_access_token_refreshed"
+
+
+@responses.activate
+def test_iter_heart_signals_stop() -> None:
+    """Test function."""
+    responses.add_callback(
+        method=responses.GET,
+        url=re.compile("https://wbsapi.withings.net/v2/heart.*"),
+        callback=lambda request: (
+            200,
+            {},
+            json.dumps({"status": 0, "body": heart_body(query(request))}),
+        ),
+    )
+    store: Final = MemorySignalStore()
+    pairs: Final = WithingsApi(new_credentials()).iter_heart_signals(
+        store=store, max_workers=2
+    )
+
+    assert signalids([next(pairs)]) == [1]
+    pairs.close()
+    assert 1 in store
+    assert len(store) == 1
+
+
+def test_async_iter_heart_signals(store: SignalStore) -> None:
+    """Test function."""
+    requested: Final = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        params = dict(request.url.params)
+        requested.append(params.get("signalid"))
+        if params["action"] == "get":
+            await asyncio.sleep(0.01 * (_SERIES - int(params["signalid"])))
+        return httpx.Response(200, json={"status": 0, "body": heart_body(params)})
+
+    api: Final = AsyncWithingsApi(
+        new_credentials(),
+        client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+    )
+    store.put(3, HeartGetResponse(**heart_get_body(3)))
+
+    async def collect(**kwargs: Any) -> List[Tuple[HeartListSerie, HeartGetResponse]]:
+        return [pair async for pair in api.iter_heart_signals(**kwargs)]
+
+    async def stop() -> List[Tuple[HeartListSerie, HeartGetResponse]]:
+        pairs = api.iter_heart_signals(max_concurrency=2)
+        first = await pairs.__anext__()
+        await pairs.aclose()
+        return [first]
+
+    assert signalids(asyncio.run(collect(store=store, max_concurrency=3))) == [
+        1,
+        2,
+        4,
+        5,
+        6,
+    ]
+    assert "3" not in requested
+    assert all(signalid in store for signalid in range(1, _SERIES + 1))
+    assert signalids(asyncio.run(collect(store=store, include_stored=True))) == list(
+        range(1, _SERIES + 1)
+    )
+    assert signalids(asyncio.run(stop())) == [1]
+
+
+def test_async_iter_heart_signals_stop_closes_series() -> None:
+    """Test function."""
+    cancelled: Final = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        params = dict(request.url.params)
+        if params["action"] == "list" and "offset" in params:
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(params["offset"])
+                raise
+        return httpx.Response(200, json={"status": 0, "body": heart_body(params)})
+
+    api: Final = AsyncWithingsApi(
+        new_credentials(),
+        client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+    )
+
+    async def stop() -> List[str]:
+        pairs = api.iter_heart_signals(max_concurrency=1)
+        async for serie, _ in pairs:
+            assert serie.ecg.signalid == 1
+            break
+        await pairs.aclose()
+        # The prefetch of the next heart_list page is cancelled by aclose,
+        # not later once the series generator is garbage collected.
+        await asyncio.sleep(0)
+        return list(cancelled)
+
+    assert asyncio.run(stop()) == [str(_SERIES // 2)]
@@ -0,0 +1,250 @@
+"""Tests for streaming parsing."""
+import asyncio
+import json
+import re
+from typing import Any, Dict, List, Tuple
+from urllib import parse
+
+import httpx
+import pytest
+import responses
+from typing_extensions import Final
+from withings_api import AbstractWithingsApi, WithingsApi
+from withings_api.aio import AbstractAsyncWithingsApi, AsyncWithingsApi
+from withings_api.common import (
+    GetSleepField,
+    MeasureGetMeasGroup,
+    SleepGetSerie,
+    TooManyRequestsException,
+)
+from withings_api.ratelimit import RateLimiter
+from withings_api.stream import JsonArrayParser
+from withings_api.synthetic import measure_get_meas_body, response, sleep_get_body
+
+from .common import new_credentials
+
+_DOCUMENT: Final = {
+    "status": 0,
+    "body": {
+        "updatetime": 1,
+        "series": [{"a": "é€𝄞", "b": [1, 2.5, -3e2]}, 1234567, "x", None, [], {}],
+        "more": True,
+        "nested": {"series": [1]},
+    },
+}
+
+
+def parse_chunks(
+    data: bytes, size: int, path: Tuple[str, ...] = ("body", "series")
+) -> Tuple[List[Any], Dict[str, Any]]:
+    """Feed data in chunks of size, get the elements and the document."""
+    parser: Final = JsonArrayParser(path)
+    elements: Final = []
+    for start in range(0, len(data), size):
+        elements.extend(parser.feed(data[start : start + size]))
+    parser.close()
+    return elements, parser.document
+
+
+@pytest.mark.parametrize("size", (1, 2, 3, 7, 1000000))
+def test_parser_chunks(size: int) -> None:
+    """Test function."""
+    data: Final = json.dumps(_DOCUMENT, indent=2, ensure_ascii=False).encode("utf-8")
+    elements, document = parse_chunks(data, size)
+
+    assert elements == _DOCUMENT["body"]["series"]  # type: ignore
+    expected: Final = json.loads(data)
+    del expected["body"]["series"]
+    assert document == expected
+
+
+def test_parser_elements_as_they_arrive() -> None:
+    """Test function."""
+    parser: Final = JsonArrayParser(("series",))
+    assert parser.feed(b'{"series": [{"a": 1}, 12') == [{"a": 1}]
+    # The number may go on in the next chunk.
+    assert parser.feed(b"3") == []
+    assert parser.feed(b" ,") == [123]
+    assert parser.feed(b"4]}") == [4]
+    parser.close()
+    parser.close()
+    assert parser.document == {}
+
+
+def test_parser_empty() -> None:
+    """Test function."""
+    assert parse_chunks(b'{"body": {"series": [ ]}}', 1) == ([], {"body": {}})
+    assert parse_chunks(b'{"body": { }, "status": 0}', 1) == (
+        [],
+        {"body": {}, "status": 0},
+    )
+    assert parse_chunks(b" {} ", 1) == ([], {})
+
+
+@pytest.mark.parametrize(
+    "data",
+    (
+        b"",
+        b'{"body": {"series": [1, 2',
+        b'{"body": {"series": [1, 2]}} {}',
+        b'{"body": {"series": [1 2]}}',
+        b'{"body": {"series": {}}}',
+        b'{"body": {"series": [1, x]}}',
+        b'{1: 2, "body": {}}',
+        b"[]",
+    ),
+)
+def test_parser_errors(data: bytes) -> None:
+    """Test function."""
+    with pytest.raises(ValueError):
+        parse_chunks(data, 3)
+
+
+def test_parser_path() -> None:
+    """Test function."""
+    with pytest.raises(ValueError):
+        JsonArrayParser(())
+
+
+def add_measure_pages() -> None:
+    """Respond to getmeas with two pages of measure groups."""
+
+    def callback(request: Any) -> Tuple[int, dict, str]:
+        offset = dict(parse.parse_qsl(parse.urlsplit(request.url).query)).get("offset")
+        body = measure_get_meas_body(count=3, seed=int(offset or 0))
+        body["more"] = offset is None
+        body["offset"] = 3
+        return 200, {}, json.dumps(response(body))
+
+    responses.add_callback(
+        method=responses.GET,
+        url=re.compile("https://wbsapi.withings.net/measure.*"),
+        callback=callback,
+    )
+
+
+def expected_groups() -> List[MeasureGetMeasGroup]:
+    """Get the groups of the two pages of add_measure_pages."""
+    return [
+        MeasureGetMeasGroup.parse_obj(group)
+        for seed in (0, 3)
+        for group in measure_get_meas_body(count=3, seed=seed)["measuregrps"]
+    ]
+
+
+@responses.activate
+def test_stream_measure_groups() -> None:
+    """Test function."""
+    add_measure_pages()
+    api: Final = WithingsApi(new_credentials())
+
+    assert list(api.stream_measure_groups(lastupdate=0)) == expected_groups()
+    assert len(responses.calls) == 2
+    assert "offset=3" in str(responses.calls[1].request.url)
+
+
+@responses.activate
+def test_stream_sleep_series() -> None:
+    """Test function."""
+    body: Final = sleep_get_body(count=5)
+    responses.add(
+        method=responses.GET,
+        url=re.compile("https://wbsapi.withings.net/v2/sleep.*"),
+        status=200,
+        json=response(body),
+    )
+    api: Final = WithingsApi(new_credentials())
+
+    assert list(api.stream_sleep_series((GetSleepField.HR,))) == [
+        SleepGetSerie.parse_obj(serie) for serie in body["series"]
+    ]
+
+
+@responses.activate
+def test_stream_status() -> None:
+    """Test function."""
+    responses.add(
+        method=responses.GET,
+        url=re.compile("https://wbsapi.withings.net/v2/sleep.*"),
+        status=200,
+        json=response({"series": [{}]}, status=601),
+    )
+    responses.add(
+        method=responses.GET,
+        url=re.compile("https://wbsapi.withings.net/v2/sleep.*"),
+        status=200,
+        json=response({}, status=601),
+    )
+    limiter: Final = RateLimiter(backoff_base=1.0)
+    api: Final = WithingsApi(new_credentials(), rate_limiter=limiter)
+
+    # Nothing is yielded from the body of an error.
+    with pytest.raises(TooManyRequestsException):
+        next(api.stream_sleep_series((GetSleepField.HR,)))
+    with pytest.raises(TooManyRequestsException):
+        next(api.stream_sleep_series((GetSleepField.HR,)))
+    assert limiter.reserve("my_client_id", 1) > 0
+
+
+class BufferedApi(AbstractWithingsApi):
+    """An api that can't stream."""
+
+    def _request(
+        self, path: str, params: Dict[str, Any], method: str = "GET"
+    ) -> Dict[str, Any]:
+        return response(measure_get_meas_body(count=3))
+
+
+class AsyncBufferedApi(AbstractAsyncWithingsApi):
+    """An async api that can't stream."""
+
+    async def _request(
+        self, path: str, params: Dict[str, Any], method: str = "GET"
+    ) -> Dict[str, Any]:
+        return response(sleep_get_body(count=3))
+
+
+def test_stream_buffered() -> None:
+    """Test function."""
+    assert len(list(BufferedApi().stream_measure_groups())) == 3
+
+    async def stream() -> List[SleepGetSerie]:
+        return [
+            serie
+            async for serie in AsyncBufferedApi().stream_sleep_series(
+                (GetSleepField.HR,)
+            )
+        ]
+
+    assert len(asyncio.run(stream())) == 3
+
+
+def test_async_stream() -> None:
+    """Test function."""
+    sleep_body: Final = sleep_get_body(count=5)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.url.params["access_token"] == "my_access_token"
+        if request.url.path == "/v2/sleep":
+            return httpx.Response(200, json=response(sleep_body))
+
+        offset = request.url.params.get("offset")
+        body = measure_get_meas_body(count=3, seed=int(offset or 0))
+        body["more"] = offset is None
+        body["offset"] = 3
+        return httpx.Response(200, json=response(body))
+
+    api: Final = AsyncWithingsApi(
+        new_credentials(),
+        client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+        rate_limiter=RateLimiter(user_rate=20.0, user_burst=1.0),
+    )
+
+    async def stream() -> Tuple[List[MeasureGetMeasGroup], List[SleepGetSerie]]:
+        groups = [group async for group in api.stream_measure_groups(lastupdate=0)]
+        series = [serie async for serie in api.stream_sleep_series((GetSleepField.HR,))]
+        return groups, series
+
+    groups, series = asyncio.run(stream())
+    assert groups == expected_groups()
+    assert series == [SleepGetSerie.parse_obj(serie) for serie in sleep_body["series"]]
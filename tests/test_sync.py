@@ -0,0 +1,288 @@
+"""Tests for incremental sync."""
+import json
+import random
+import re
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib import parse
+
+import arrow
+import pytest
+import responses
+from typing_extensions import Final
+from withings_api import WithingsApi, synthetic
+from withings_api.codec import available_codecs, set_codec
+from withings_api.common import (
+    Credentials2,
+    GetSleepSummarySerie,
+    MeasureGetActivityActivity,
+    MeasureGetMeasGroup,
+)
+from withings_api.sync import (
+    MEASURE_GET_ACTIVITY,
+    MEASURE_GET_MEAS,
+    SLEEP_GET_SUMMARY,
+    MemorySyncStore,
+    SQLiteSyncStore,
+    SyncEngine,
+    SyncResult,
+)
+
+from .common import TIMEZONE_STR0
+
+
+def new_api() -> WithingsApi:
+    """Create an api for user 1."""
+    return WithingsApi(
+        Credentials2(
+            access_token="my_access_token",
+            expires_in=10000,
+            token_type="Bearer",
+            refresh_token="my_refresh_token",
+            userid=1,
+            client_id="my_client_id",
+            consumer_secret="my_consumer_secret",
+        )
+    )
+
+
+def measure_group(grpid: int, value: int) -> Dict[str, Any]:
+    """Create a measure group body."""
+    return {
+        "attrib": 0,
+        "category": 1,
+        "created": 1000,
+        "date": 1000 + grpid,
+        "deviceid": "dev1",
+        "grpid": grpid,
+        "measures": [{"type": 1, "unit": 0, "value": value}],
+    }
+
+
+def sleep_summary_serie(serie_id: Optional[int], modified: int) -> Dict[str, Any]:
+    """Create a sleep summary serie body."""
+    return {
+        "id": serie_id,
+        "timezone": TIMEZONE_STR0,
+        "model": 16,
+        "startdate": 1000,
+        "enddate": 2000,
+        "date": "2019-01-01",
+        "modified": modified,
+        "data": {"hr_average": 60},
+    }
+
+
+def add_pages(
+    path: str, pages: Dict[Tuple[str, Optional[str]], Dict[str, Any]]
+) -> List[Tuple[str, Optional[str]]]:
+    """Answer requests with the page for their lastupdate and offset."""
+    requested: Final[List[Tuple[str, Optional[str]]]] = []
+
+    def callback(request: Any) -> Tuple[int, Dict[str, str], str]:
+        params: Final = dict(parse.parse_qsl(parse.urlsplit(request.url).query))
+        key: Final = (params["lastupdate"], params.get("offset"))
+        assert "startdate" not in params
+        assert "startdateymd" not in params
+        requested.append(key)
+        return 200, {}, json.dumps({"status": 0, "body": pages[key]})
+
+    responses.add_callback(
+        method=responses.GET,
+        url=re.compile("https://wbsapi.withings.net/%s.*" % path),
+        callback=callback,
+    )
+    return requested
+
+
+@responses.activate
+def test_sync_measure_get_meas() -> None:
+    """Test function."""
+    requested: Final = add_pages(
+        "measure",
+        {
+            ("0", None): {
+                "more": 1,
+                "offset": 1,
+                "updatetime": 5000,
+                "timezone": TIMEZONE_STR0,
+                "measuregrps": [measure_group(1, 10)],
+            },
+            ("0", "1"): {
+                "more": 0,
+                "offset": 0,
+                "updatetime": 5000,
+                "timezone": TIMEZONE_STR0,
+                "measuregrps": [measure_group(2, 20)],
+            },
+            ("5000", None): {
+                "updatetime": 6000,
+                "timezone": TIMEZONE_STR0,
+                "measuregrps": [measure_group(1, 11)],
+            },
+        },
+    )
+    store: Final = MemorySyncStore()
+    engine: Final = SyncEngine(store, endpoints=(MEASURE_GET_MEAS,))
+    api: Final = new_api()
+
+    assert engine.sync_all(api) == (SyncResult(1, "measure_get_meas", 2, 5000),)
+    assert engine.sync(api, MEASURE_GET_MEAS) == SyncResult(
+        1, "measure_get_meas", 1, 6000
+    )
+    assert requested == [("0", None), ("0", "1"), ("5000", None)]
+
+    items: Final = store.get_items(1, "measure_get_meas")
+    assert sorted(items) == ["1", "2"]
+    assert isinstance(items["1"], MeasureGetMeasGroup)
+    assert items["1"].measures[0].value == 11
+    assert store.get_cursor(1, "measure_get_meas") == 6000
+    assert store.get_cursor(2, "measure_get_meas") is None
+
+
+@responses.activate
+def test_sync_keeps_cursor_on_failure() -> None:
+    """Test function."""
+    add_pages(
+        "measure",
+        {
+            ("100", None): {
+                "more": 1,
+                "offset": 1,
+                "updatetime": 5000,
+                "timezone": TIMEZONE_STR0,
+                "measuregrps": [measure_group(1, 10)],
+            },
+        },
+    )
+    store: Final = MemorySyncStore()
+    engine: Final = SyncEngine(
+        store, endpoints=(MEASURE_GET_MEAS,), initial_lastupdate=arrow.get(100)
+    )
+
+    with pytest.raises(KeyError):
+        engine.sync_all(new_api())
+
+    assert list(store.get_items(1, "measure_get_meas")) == ["1"]
+    assert store.get_cursor(1, "measure_get_meas") is None
+
+
+@responses.activate
+def test_sync_sleep_summary_and_activity() -> None:
+    """Test function."""
+    add_pages(
+        "v2/sleep",
+        {
+            ("0", None): {
+                "more": False,
+                "offset": 0,
+                "series": [
+                    sleep_summary_serie(7, 3000),
+                    sleep_summary_serie(None, 4000),
+                ],
+            },
+            ("4000", None): {"more": False, "offset": 0, "series": []},
+        },
+    )
+    add_pages(
+        "v2/measure",
+        {
+            ("0", None): {
+                "more": False,
+                "offset": 0,
+                "activities": [
+                    {
+                        "date": "2019-01-01",
+                        "timezone": TIMEZONE_STR0,
+                        "deviceid": "dev1",
+                        "brand": 1,
+                        "is_tracker": True,
+                        "totalcalories": 10.5,
+                        "modified": 1546400000,
+                    },
+                    # Without a modified date, counts as modified on its day.
+                    {
+                        "date": "2019-01-02",
+                        "timezone": TIMEZONE_STR0,
+                        "deviceid": "dev1",
+                        "brand": 1,
+                        "is_tracker": True,
+                        "totalcalories": 10.5,
+                    },
+                ],
+            },
+        },
+    )
+    store: Final = MemorySyncStore()
+    engine: Final = SyncEngine(
+        store, endpoints=(SLEEP_GET_SUMMARY, MEASURE_GET_ACTIVITY)
+    )
+
+    assert engine.sync_all(new_api()) == (
+        SyncResult(1, "sleep_get_summary", 2, 4000),
+        SyncResult(1, "measure_get_activity", 2, 1546400000),
+    )
+    assert sorted(store.get_items(1, "sleep_get_summary")) == ["1000", "7"]
+    assert sorted(store.get_items(1, "measure_get_activity")) == [
+        "2019-01-01:dev1",
+        "2019-01-02:dev1",
+    ]
+
+    assert engine.sync(new_api(), SLEEP_GET_SUMMARY) == SyncResult(
+        1, "sleep_get_summary", 0, 4000
+    )
+
+
+def test_sqlite_sync_store(tmp_path: Any) -> None:
+    """Test function."""
+    path: Final = str(tmp_path / "sync.db")
+    store = SQLiteSyncStore(path)
+
+    assert store.get_cursor(1, "endpoint") is None
+    store.commit(1, "endpoint", {"a": {"value": 1}, "b": (1, 2)}, None)
+    assert store.get_cursor(1, "endpoint") is None
+    store.commit(1, "endpoint", {"a": {"value": 2}}, 100)
+    store.close()
+
+    store = SQLiteSyncStore(path)
+    assert store.get_cursor(1, "endpoint") == 100
+    assert store.get_items(1, "endpoint") == {"a": {"value": 2}, "b": [1, 2]}
+    assert store.get_items(2, "endpoint") == {}
+    store.close()
+
+
+@pytest.fixture(name="codec", params=available_codecs())
+def codec_fixture(request: pytest.FixtureRequest) -> Iterator[str]:
+    """Use each available codec in turn."""
+    set_codec(request.param)
+    yield request.param
+    set_codec("json")
+
+
+@pytest.mark.usefixtures("codec")
+def test_sqlite_sync_store_models(tmp_path: Any) -> None:
+    """Test function."""
+    path: Final = str(tmp_path / "sync.db")
+    rng: Final = random.Random(0)
+    items: Final = {
+        "measure_get_meas": MeasureGetMeasGroup.parse_obj(measure_group(1, 10)),
+        "measure_get_activity": MeasureGetActivityActivity.parse_obj(
+            synthetic.activity(rng, 1546300800)
+        ),
+        "sleep_get_summary": GetSleepSummarySerie.parse_obj(
+            sleep_summary_serie(7, 3000)
+        ),
+    }
+    store = SQLiteSyncStore(path)
+    for endpoint, item in items.items():
+        store.commit(1, endpoint, {"key": item}, None)
+    store.close()
+
+    store = SQLiteSyncStore(path)
+    for endpoint, item in items.items():
+        assert store.get_items(1, endpoint) == {"key": item}
+    store.close()
+
+    # Without the endpoints, items come back as json values.
+    store = SQLiteSyncStore(path, endpoints=())
+    assert store.get_items(1, "measure_get_meas")["key"]["grpid"] == 1
+    store.close()
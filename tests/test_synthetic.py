@@ -0,0 +1,71 @@
+"""Tests for synthetic data."""
+from typing_extensions import Final
+from withings_api import synthetic
+from withings_api.common import (
+    HeartGetResponse,
+    HeartListResponse,
+    MeasureGetActivityResponse,
+    MeasureGetMeasResponse,
+    NotifyListResponse,
+    SleepGetResponse,
+    SleepGetSummaryResponse,
+    UserGetDeviceResponse,
+    response_body_or_raise,
+)
+
+
+def test_bodies_parse() -> None:
+    """Test function."""
+    assert (
+        len(MeasureGetMeasResponse(**synthetic.measure_get_meas_body(20)).measuregrps)
+        == 20
+    )
+    assert (
+        len(
+            MeasureGetActivityResponse(
+                **synthetic.measure_get_activity_body(5)
+            ).activities
+        )
+        == 5
+    )
+    assert (
+        len(SleepGetSummaryResponse(**synthetic.sleep_get_summary_body(5)).series) == 5
+    )
+    sleep: Final = SleepGetResponse(**synthetic.sleep_get_body(5, samples=3))
+    assert len(sleep.series) == 5
+    assert len(sleep.series[0].hr) == 3
+    assert len(HeartListResponse(**synthetic.heart_list_body(5)).series) == 5
+    assert len(HeartGetResponse(**synthetic.heart_get_body(1000)).signal) == 1000
+    assert len(UserGetDeviceResponse(**synthetic.user_get_device_body(2)).devices) == 2
+    assert len(NotifyListResponse(**synthetic.notify_list_body(2)).profiles) == 2
+    assert response_body_or_raise(synthetic.response({"a": 1})) == {"a": 1}
+
+
+def test_deterministic() -> None:
+    """Test function."""
+    assert synthetic.measure_get_meas_body(
+        10, seed=1
+    ) == synthetic.measure_get_meas_body(10, seed=1)
+    assert synthetic.measure_get_meas_body(
+        10, seed=1
+    ) != synthetic.measure_get_meas_body(10, seed=2)
+    assert synthetic.heart_get_body(100, seed=3) == synthetic.heart_get_body(
+        100, seed=3
+    )
+
+
+def test_heart_signal_peaks() -> None:
+    """Test function."""
+    signal: Final = synthetic.heart_get_body(samples=15000, sampling_frequency=500)[
+        "signal"
+    ]
+
+    peaks: Final = [
+        index
+        for index in range(1, len(signal) - 1)
+        if signal[index] > 500
+        and signal[index - 1] < signal[index] >= signal[index + 1]
+    ]
+    # 30 seconds at 50 to 100 bpm.
+    assert 23 <= len(peaks) <= 52
+    assert all(-32768 <= value <= 32767 for value in signal)
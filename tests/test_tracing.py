@@ -0,0 +1,358 @@
+"""Tests for instrumentation."""
+import asyncio
+import logging
+import re
+from typing import Any, Dict, List
+
+import httpx
+from oauthlib.oauth2 import TokenExpiredError
+import pytest
+import responses
+from typing_extensions import Final
+from withings_api import AbstractWithingsApi, WithingsApi
+from withings_api.aio import AbstractAsyncWithingsApi, AsyncWithingsApi
+from withings_api.cache import ResponseCache
+from withings_api.common import AuthFailedException, NotifyAppli, UnknownStatusException
+from withings_api.credentials import RefreshCoordinator
+from withings_api.ratelimit import RateLimiter
+from withings_api.tracing import (
+    CallEvent,
+    LoggingTracer,
+    MetricsTracer,
+    MultiTracer,
+    RefreshEvent,
+    RetryEvent,
+    Tracer,
+)
+
+from .common import new_credentials
+
+_NOTIFY_GET_BODY: Final = {
+    "appli": NotifyAppli.WEIGHT.real,
+    "callbackurl": "http://localhost/callback",
+}
+
+
+class RecordingTracer(Tracer):
+    """Keeps every event."""
+
+    def __init__(self) -> None:
+        """Initialize new object."""
+        self.calls: Final[List[CallEvent]] = []
+        self.refreshes: Final[List[RefreshEvent]] = []
+        self.retries: Final[List[RetryEvent]] = []
+
+    def on_call(self, event: CallEvent) -> None:
+        """Handle a finished call."""
+        self.calls.append(event)
+
+    def on_refresh(self, event: RefreshEvent) -> None:
+        """Handle a finished token refresh."""
+        self.refreshes.append(event)
+
+    def on_retry(self, event: RetryEvent) -> None:
+        """Handle a call about to be sent again."""
+        self.retries.append(event)
+
+
+@responses.activate
+def test_call_events() -> None:
+    """Test function."""
+    responses.add(
+        method=responses.GET,
+        url=re.compile("https://wbsapi.withings.net/notify.*"),
+        status=200,
+        json={"status": 0, "body": _NOTIFY_GET_BODY},
+    )
+    tracer: Final = RecordingTracer()
+    api: Final = WithingsApi(
+        new_credentials(),
+        rate_limiter=RateLimiter(),
+        cache=ResponseCache(ttls={("notify", "get"): 60}),
+        tracer=tracer,
+    )
+
+    assert api.notify_get("http://localhost/callback").appli == NotifyAppli.WEIGHT
+    api.notify_get("http://localhost/callback")
+    api.request("notify", {"action": "list"})
+
+    first, second, third = tracer.calls
+    assert (first.userid, first.path, first.action, first.method) == (
+        1,
+        "notify",
+        "get",
+        "GET",
+    )
+    assert (first.status, first.http_status, first.cached, first.error) == (
+        0,
+        200,
+        False,
+        None,
+    )
+    assert first.size
+    assert first.network > 0
+    assert first.seconds >= first.network + first.decode + first.validate
+
+    assert second.cached
+    assert second.network == second.wait == 0
+    assert second.size is None
+    assert third.action == "list"
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_call_event_error() -> None:
+    """Test function."""
+    responses.add(
+        method=responses.GET,
+        url=re.compile("https://wbsapi.withings.net/notify.*"),
+        status=200,
+        json={"status": 100, "body": {}},
+    )
+    tracer: Final = RecordingTracer()
+    api: Final = WithingsApi(
+        new_credentials(), refresh_coordinator=RefreshCoordinator(), tracer=tracer
+    )
+
+    with pytest.raises(AuthFailedException):
+        api.notify_get("http://localhost/callback")
+
+    assert tracer.calls[0].status == 100
+    assert isinstance(tracer.calls[0].error, AuthFailedException)
+
+
+@responses.activate
+def test_refresh_events() -> None:
+    """Test function."""
+    responses.add(
+        method=responses.POST,
+        url=re.compile("https://wbsapi.withings.net/v2/oauth2.*"),
+        status=200,
+        json={
+            "status": 0,
+            "body": {
+                "access_token": "my_access_token_refreshed",
+                "expires_in": 10800,
+                "token_type": "Bearer",
+                "refresh_token": "my_refresh_token_refreshed",
+                "userid": 1,
+            },
+        },
+    )
+    responses.add(
+        method=responses.POST,
+        url=re.compile("https://wbsapi.withings.net/v2/oauth2.*"),
+        status=500,
+    )
+    tracer: Final = RecordingTracer()
+    api: Final = WithingsApi(new_credentials(), tracer=tracer)
+
+    api.refresh_token()
+    with pytest.raises(Exception):
+        api.refresh_token()
+
+    assert [(event.userid, event.error is None) for event in tracer.refreshes] == [
+        (1, True),
+        (1, False),
+    ]
+
+
+@responses.activate
+def test_expired_token_events() -> None:
+    """Test function."""
+    responses.add(
+        method=responses.POST,
+        url=re.compile("https://wbsapi.withings.net/v2/oauth2.*"),
+        status=200,
+        json={
+            "status": 0,
+            "body": {
+                "access_token": "my_access_token_refreshed",
+                "expires_in": 10800,
+                "token_type": "Bearer",
+                "refresh_token": "my_refresh_token_refreshed",
+                "userid": 1,
+            },
+        },
+    )
+    responses.add(
+        method=responses.GET,
+        url=re.compile("https://wbsapi.withings.net/notify.*"),
+        status=200,
+        json={"status": 0, "body": {"profiles": []}},
+    )
+    tracer: Final = RecordingTracer()
+    api: Final = WithingsApi(new_credentials(expires_in=-1), tracer=tracer)
+
+    api.notify_list()
+    api.notify_list()
+
+    assert [(event.userid, event.error) for event in tracer.refreshes] == [(1, None)]
+    assert [(event.path, event.action) for event in tracer.retries] == [
+        ("notify", "list")
+    ]
+    assert [event.error for event in tracer.calls] == [None, None]
+    assert "access_token=my_access_token_refreshed" in str(
+        responses.calls[1].request.url
+    )
+
+
+def test_abstract_api_events() -> None:
+    """Test function."""
+
+    class DictApi(AbstractWithingsApi):
+        """Api answering from a dict."""
+
+        def _request(
+            self, path: str, params: Dict[str, Any], method: str = "GET"
+        ) -> Dict[str, Any]:
+            return {"status": 0, "body": _NOTIFY_GET_BODY}
+
+    class AsyncDictApi(AbstractAsyncWithingsApi):
+        """Async api answering from a dict."""
+
+        async def _request(
+            self, path: str, params: Dict[str, Any], method: str = "GET"
+        ) -> Dict[str, Any]:
+            return {"status": 0, "body": _NOTIFY_GET_BODY}
+
+    tracer: Final = RecordingTracer()
+    api: Final = DictApi()
+    api.tracer = tracer
+    async_api: Final = AsyncDictApi()
+    async_api.tracer = tracer
+
+    api.notify_get("http://localhost/callback")
+    asyncio.run(async_api.notify_get("http://localhost/callback"))
+
+    assert len(tracer.calls) == 2
+    for event in tracer.calls:
+        assert event.userid is None
+        assert event.http_status is None
+        assert event.decode == 0
+
+
+def test_async_events() -> None:
+    """Test function."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/v2/oauth2":
+            return httpx.Response(200, json={"status": 503, "body": {}})
+        return httpx.Response(200, json={"status": 0, "body": _NOTIFY_GET_BODY})
+
+    tracer: Final = RecordingTracer()
+    api: Final = AsyncWithingsApi(
+        new_credentials(),
+        client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+        rate_limiter=RateLimiter(),
+        cache=ResponseCache(ttls={("notify", "get"): 60}),
+        tracer=tracer,
+    )
+
+    async def calls() -> None:
+        await api.notify_get("http://localhost/callback")
+        await api.notify_get("http://localhost/callback")
+        await api.request("notify", {"action": "list"})
+        with pytest.raises(AuthFailedException):
+            await api.refresh_token()
+
+    asyncio.run(calls())
+
+    assert [(event.action, event.cached) for event in tracer.calls] == [
+        ("get", False),
+        ("get", True),
+        ("list", False),
+    ]
+    assert tracer.calls[0].http_status == 200
+    assert tracer.calls[0].size
+    assert isinstance(tracer.refreshes[0].error, AuthFailedException)
+
+
+def new_event(**kwargs: Any) -> CallEvent:
+    """Create a call event."""
+    return CallEvent(
+        **{
+            "userid": 1,
+            "path": "measure",
+            "action": "getmeas",
+            "method": "GET",
+            "status": 0,
+            "http_status": 200,
+            "size": 100,
+            "cached": False,
+            "wait": 0.0,
+            "network": 0.25,
+            "decode": 0.125,
+            "check": 0.0,
+            "validate": 0.5,
+            "error": None,
+            **kwargs,
+        }
+    )
+
+
+def test_metrics_tracer() -> None:
+    """Test function."""
+    metrics: Final = MetricsTracer()
+    recording: Final = RecordingTracer()
+    tracer: Final = MultiTracer(metrics, recording)
+
+    tracer.on_call(new_event())
+    tracer.on_call(new_event(userid=2, cached=True, size=None))
+    tracer.on_call(new_event(status=601, error=UnknownStatusException(601)))
+    tracer.on_refresh(RefreshEvent(1, 0.5, None))
+    tracer.on_retry(RetryEvent(1, "notify", "list", TokenExpiredError()))
+
+    assert len(recording.calls) == 3
+    assert recording.refreshes == [RefreshEvent(1, 0.5, None)]
+    assert len(recording.retries) == 1
+    assert metrics.users.most_common() == [(1, 2), (2, 1)]
+    assert (
+        metrics.value("calls_total", path="measure", action="getmeas", status="0") == 2
+    )
+    assert (
+        metrics.value(
+            "call_seconds_total", path="measure", action="getmeas", phase="network"
+        )
+        == 0.75
+    )
+    assert metrics.value("response_bytes_total", path="measure", action="getmeas") == (
+        200
+    )
+    assert metrics.value("refreshes_total", outcome="ok") == 1
+    assert (
+        metrics.value(
+            "retries_total", path="notify", action="list", error="TokenExpiredError"
+        )
+        == 1
+    )
+    assert metrics.value("unknown_total") == 0
+
+    text: Final = metrics.render()
+    assert "# TYPE withings_calls_total counter\n" in text
+    assert (
+        'withings_calls_total{action="getmeas",path="measure",'
+        'status="UnknownStatusException"} 1.0\n'
+    ) in text
+    assert 'withings_cache_hits_total{action="getmeas",path="measure"} 1.0\n' in text
+
+
+def test_logging_tracer(caplog: Any) -> None:
+    """Test function."""
+    tracer: Final = LoggingTracer(level=logging.INFO)
+
+    with caplog.at_level(logging.INFO):
+        tracer.on_call(new_event())
+        tracer.on_call(new_event(error=UnknownStatusException(601)))
+        tracer.on_refresh(RefreshEvent(1, 0.5, None))
+        tracer.on_retry(RetryEvent(1, "notify", "list", TokenExpiredError()))
+
+    assert [record.levelno for record in caplog.records] == [
+        logging.INFO,
+        logging.WARNING,
+        logging.INFO,
+        logging.INFO,
+    ]
+    assert "retry notify action=list userid=1" in caplog.records[3].getMessage()
+    assert "GET measure action=getmeas userid=1" in caplog.records[0].getMessage()
+    assert "seconds=0.8750" in caplog.records[0].getMessage()
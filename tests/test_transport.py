@@ -0,0 +1,96 @@
+"""Tests for shared transports."""
+import asyncio
+import re
+from unittest.mock import patch
+
+import responses
+from typing_extensions import Final
+from withings_api import WithingsApi
+from withings_api.aio import AsyncWithingsApi
+from withings_api.transport import SharedTransport
+
+from .common import new_credentials
+
+
+@responses.activate
+def test_shared_adapter() -> None:
+    """Test function."""
+    responses.add(
+        method=responses.GET,
+        url=re.compile("https://wbsapi.withings.net/notify?.*action=list(&.*)?"),
+        status=200,
+        json={"status": 0, "body": {"profiles": []}},
+    )
+    transport: Final = SharedTransport(pool_maxsize=4, timeout=(1.0, 2.0))
+    api1: Final = WithingsApi(
+        new_credentials(1, access_token="access_token_1"), transport=transport
+    )
+    api2: Final = WithingsApi(
+        new_credentials(2, access_token="access_token_2"), transport=transport
+    )
+    url: Final = WithingsApi.URL
+
+    # pylint: disable=protected-access
+    assert api1._client.get_adapter(url) is transport.adapter
+    assert api2._client.get_adapter(url) is transport.adapter
+    assert api1._client.get_adapter(url) is not WithingsApi(
+        new_credentials(3)
+    )._client.get_adapter(url)
+
+    api1.notify_list()
+    api2.notify_list()
+
+    assert "access_token_1" in str(responses.calls[0].request.url)
+    assert "access_token_2" in str(responses.calls[1].request.url)
+    transport.close()
+
+
+@responses.activate
+def test_refresh_token_timeout() -> None:
+    """Test function."""
+    responses.add(
+        method=responses.POST,
+        url=re.compile("https://wbsapi.withings.net/v2/oauth2.*"),
+        status=200,
+        json={
+            "body": {
+                "access_token": "access_token_refreshed",
+                "expires_in": 11,
+                "token_type": "Bearer",
+                "refresh_token": "refresh_token_refreshed",
+                "userid": 1,
+            },
+        },
+    )
+    api: Final = WithingsApi(new_credentials(1), transport=SharedTransport(timeout=3.0))
+    # pylint: disable=protected-access
+    client: Final = api._client
+
+    with patch.object(
+        client, "refresh_token", wraps=client.refresh_token
+    ) as refresh_token:
+        api.refresh_token()
+
+    assert refresh_token.call_args[1]["timeout"] == 3.0
+    assert api.get_credentials().access_token == "access_token_refreshed"
+
+
+def test_async_client() -> None:
+    """Test function."""
+    transport: Final = SharedTransport(pool_maxsize=7, timeout=(1.0, 2.0))
+    client: Final = transport.async_client()
+
+    assert transport.async_client() is client
+    assert client.timeout.connect == 1.0
+    assert client.timeout.read == 2.0
+
+    api1: Final = AsyncWithingsApi(new_credentials(1), client=client)
+    api2: Final = AsyncWithingsApi(new_credentials(2), client=client)
+    # pylint: disable=protected-access
+    assert api1._client is api2._client
+
+    asyncio.run(transport.aclose())
+    assert client.is_closed
+    assert transport.async_client() is not client
+    assert SharedTransport(timeout=4.0).async_client().timeout.read == 4.0
+    asyncio.run(SharedTransport().aclose())
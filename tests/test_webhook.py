@@ -0,0 +1,207 @@
+"""Tests for the webhook receiver."""
+import asyncio
+import io
+from typing import Any, Dict, Iterator, List, Tuple
+
+import arrow
+import pytest
+from typing_extensions import Final
+from withings_api.common import GetActivityField, GetSleepSummaryField, NotifyAppli
+from withings_api.webhook import (
+    FetchTask,
+    Notification,
+    WebhookReceiver,
+    fetch_task,
+    parse_notification,
+    parse_notification_body,
+)
+
+from .common import FakeClock
+
+
+def test_parse_notification() -> None:
+    """Test function."""
+    assert parse_notification(
+        {"userid": "1", "appli": "1", "startdate": "200", "enddate": "100"}
+    ) == Notification(1, NotifyAppli.WEIGHT, arrow.get(100), arrow.get(200))
+    assert parse_notification(
+        {"userid": "1", "appli": "50", "startdate": "100"}
+    ) == Notification(1, NotifyAppli.BED_IN, arrow.get(100), arrow.get(100))
+    assert parse_notification_body(
+        b"userid=2&appli=16&date=2019-01-02"
+    ) == Notification(
+        2, NotifyAppli.ACTIVITY, arrow.get("2019-01-02"), arrow.get("2019-01-02")
+    )
+    assert (
+        parse_notification({"userid": "1", "appli": "12345", "startdate": "100"}).appli
+        == NotifyAppli.UNKNOWN
+    )
+
+    for data in (
+        {"appli": "1", "startdate": "100"},
+        {"userid": "1", "appli": "1"},
+        {"userid": "1", "appli": "1", "startdate": "abc"},
+        {"userid": "1", "appli": "16", "date": "tomorrow"},
+    ):
+        with pytest.raises(ValueError):
+            parse_notification(data)
+
+
+def test_fetch_task() -> None:
+    """Test function."""
+    start: Final = arrow.get("2019-01-02T10:00:00")
+    end: Final = arrow.get("2019-01-02T11:00:00")
+
+    assert fetch_task(Notification(1, NotifyAppli.CIRCULATORY, start, end)) == (
+        FetchTask(
+            1,
+            NotifyAppli.CIRCULATORY,
+            "iter_measure_groups",
+            {"startdate": start, "enddate": end, "lastupdate": None},
+        )
+    )
+    assert fetch_task(Notification(1, NotifyAppli.ACTIVITY, start, end)) == (
+        FetchTask(
+            1,
+            NotifyAppli.ACTIVITY,
+            "iter_activities",
+            {
+                "data_fields": tuple(GetActivityField),
+                "startdateymd": arrow.get("2019-01-01T10:00:00"),
+                "enddateymd": arrow.get("2019-01-03T11:00:00"),
+                "lastupdate": None,
+            },
+        )
+    )
+    sleep_task: Final = fetch_task(Notification(1, NotifyAppli.SLEEP, start, end))
+    assert sleep_task is not None
+    assert sleep_task.method == "iter_sleep_summary_series"
+    assert sleep_task.kwargs["data_fields"] == tuple(GetSleepSummaryField)
+    assert fetch_task(Notification(1, NotifyAppli.BED_OUT, start, end)) is None
+
+
+def test_fetch_task_run() -> None:
+    """Test function."""
+
+    class FakeApi:
+        """Api returning its arguments."""
+
+        def iter_measure_groups(self, **kwargs: Any) -> Iterator[Any]:
+            """Yield the arguments."""
+            yield from sorted(kwargs.items())
+
+    task: Final = FetchTask(
+        1, NotifyAppli.WEIGHT, "iter_measure_groups", {"enddate": 2, "startdate": 1}
+    )
+    assert task.run(FakeApi()) == (("enddate", 2), ("startdate", 1))  # type: ignore
+
+
+def test_receiver_coalesces() -> None:
+    """Test function."""
+    tasks: Final[List[FetchTask]] = []
+    clock: Final = FakeClock()
+    receiver: Final = WebhookReceiver(tasks.append, delay=10, clock=clock)
+
+    receiver.handle({"userid": "1", "appli": "1", "startdate": "100", "enddate": "200"})
+    receiver.handle({"userid": "1", "appli": "1", "startdate": "100", "enddate": "200"})
+    receiver.handle({"userid": "1", "appli": "1", "startdate": "50", "enddate": "60"})
+    receiver.handle({"userid": "2", "appli": "1", "startdate": "100", "enddate": "200"})
+    receiver.handle({"userid": "1", "appli": "51", "startdate": "100"})
+    assert tasks == []
+
+    clock.now += 5
+    receiver.handle(
+        {"userid": "1", "appli": "44", "startdate": "100", "enddate": "300"}
+    )
+    assert receiver.flush() == 0
+
+    clock.now += 5
+    assert receiver.flush() == 3
+    assert [(task.userid, task.appli) for task in tasks] == [
+        (1, NotifyAppli.WEIGHT),
+        (2, NotifyAppli.WEIGHT),
+    ]
+    assert tasks[0].kwargs["startdate"] == arrow.get(50)
+    assert tasks[0].kwargs["enddate"] == arrow.get(200)
+
+    assert receiver.flush(force=True) == 1
+    assert tasks[2].appli == NotifyAppli.SLEEP
+    assert receiver.flush(force=True) == 0
+
+
+def call_wsgi(
+    receiver: WebhookReceiver, method: str, body: bytes = b""
+) -> Tuple[str, bytes]:
+    """Call the WSGI app."""
+    statuses: Final[List[str]] = []
+    environ: Final = {
+        "REQUEST_METHOD": method,
+        "CONTENT_LENGTH": str(len(body)) if body else "",
+        "wsgi.input": io.BytesIO(body),
+    }
+
+    content: Final = b"".join(
+        receiver.wsgi(environ, lambda status, headers: statuses.append(status))
+    )
+    return statuses[0], content
+
+
+def test_wsgi() -> None:
+    """Test function."""
+    tasks: Final[List[FetchTask]] = []
+    receiver: Final = WebhookReceiver(tasks.append)
+
+    assert call_wsgi(receiver, "HEAD") == ("200 OK", b"")
+    assert call_wsgi(receiver, "PUT") == ("405 Method Not Allowed", b"")
+    assert call_wsgi(receiver, "POST") == ("400 Bad Request", b"")
+    assert call_wsgi(receiver, "POST", b"\xff") == ("400 Bad Request", b"")
+    assert call_wsgi(receiver, "POST", b"userid=1&appli=1&startdate=100") == (
+        "200 OK",
+        b"",
+    )
+    assert [task.method for task in tasks] == ["iter_measure_groups"]
+
+
+def test_asgi() -> None:
+    """Test function."""
+    tasks: Final[List[FetchTask]] = []
+    receiver: Final = WebhookReceiver(tasks.append)
+
+    async def call(
+        scope: Dict[str, Any], messages: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        sent: Final[List[Dict[str, Any]]] = []
+
+        async def receive() -> Dict[str, Any]:
+            return messages.pop(0)
+
+        async def send(message: Dict[str, Any]) -> None:
+            sent.append(message)
+
+        await receiver.asgi(scope, receive, send)
+        return sent
+
+    sent: Final = asyncio.run(
+        call(
+            {"type": "http", "method": "POST"},
+            [
+                {
+                    "type": "http.request",
+                    "body": b"userid=1&appli=16",
+                    "more_body": True,
+                },
+                {"type": "http.request", "body": b"&date=2019-01-02"},
+            ],
+        )
+    )
+    assert sent[0]["status"] == 200
+    assert sent[1] == {"type": "http.response.body", "body": b""}
+    assert [task.method for task in tasks] == ["iter_activities"]
+
+    assert asyncio.run(call({"type": "lifespan"}, [])) == []
+    assert (
+        asyncio.run(
+            call({"type": "http", "method": "POST"}, [{"type": "http.request"}])
+        )[0]["status"]
+        == 400
+    )
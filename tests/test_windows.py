@@ -0,0 +1,180 @@
+"""Tests for date windows."""
+import asyncio
+import json
+import re
+import threading
+from typing import Any, List, Tuple
+from urllib import parse
+
+import arrow
+from arrow import Arrow
+import httpx
+import pytest
+import responses
+from typing_extensions import Final
+from withings_api import WithingsApi
+from withings_api.aio import AsyncWithingsApi
+from withings_api.common import GetSleepField, SleepGetResponse, SleepModel
+from withings_api.params import NOW
+from withings_api.windows import (
+    SLEEP_GET_MAX_SPAN,
+    async_fetch_windows,
+    fetch_windows,
+    merge_sleep_get,
+    plan_windows,
+)
+
+from .common import add_slow_refresh, new_credentials
+
+_START: Final = 1577836800
+_DAY: Final = SLEEP_GET_MAX_SPAN
+
+
+def timestamps(windows: List[Tuple[Arrow, Arrow]]) -> List[Tuple[int, int]]:
+    """Get the windows as epoch seconds."""
+    return [(start.int_timestamp, end.int_timestamp) for start, end in windows]
+
+
+def test_plan_windows() -> None:
+    """Test function."""
+    assert timestamps(plan_windows(_START, _START + 2 * _DAY + 10, _DAY)) == [
+        (_START, _START + _DAY),
+        (_START + _DAY, _START + 2 * _DAY),
+        (_START + 2 * _DAY, _START + 2 * _DAY + 10),
+    ]
+    assert timestamps(plan_windows("2020-01-01", "2020-01-02", _DAY)) == [
+        (_START, _START + _DAY)
+    ]
+    assert timestamps(plan_windows(_START, _START, _DAY)) == [(_START, _START)]
+    assert not plan_windows(_START + 1, _START, _DAY)
+    assert len(plan_windows(arrow.utcnow().shift(days=-3), NOW, _DAY)) == 4
+    assert repr(NOW) == "NOW"
+
+    with pytest.raises(ValueError):
+        plan_windows(_START, _START + _DAY, 0)
+
+
+def test_fetch_windows() -> None:
+    """Test function."""
+    threads: Final = set()
+
+    def fetch(start: Arrow, end: Arrow) -> int:
+        threads.add(threading.get_ident())
+        return end.int_timestamp - start.int_timestamp
+
+    assert fetch_windows(fetch, _START, _START + 10 * _DAY - 1, _DAY) == [_DAY] * 9 + [
+        _DAY - 1
+    ]
+    assert threading.get_ident() not in threads
+
+    threads.clear()
+    assert fetch_windows(fetch, _START, _START + 2 * _DAY, _DAY, max_workers=1) == [
+        _DAY,
+        _DAY,
+    ]
+    assert threads == {threading.get_ident()}
+
+    async def async_fetch(start: Arrow, end: Arrow) -> int:
+        await asyncio.sleep(0)
+        return start.int_timestamp
+
+    assert asyncio.run(
+        async_fetch_windows(async_fetch, _START, _START + 3 * _DAY, _DAY, 2)
+    ) == [_START, _START + _DAY, _START + 2 * _DAY]
+
+
+def sleep_get_body(startdate: int) -> Any:
+    """Create the body of a sleep get window, with a state crossing its end."""
+    return {
+        "model": SleepModel.SLEEP_MONITOR.real,
+        "series": [
+            {"startdate": startdate - 60, "enddate": startdate + 60, "state": 1},
+            {"startdate": startdate + 600, "enddate": startdate + 900, "state": 2},
+            {
+                "startdate": startdate + _DAY - 60,
+                "enddate": startdate + _DAY + 60,
+                "state": 1,
+            },
+        ],
+    }
+
+
+def check_merged(response: SleepGetResponse) -> None:
+    """Check the merged series of two windows."""
+    assert response.model == SleepModel.SLEEP_MONITOR
+    assert [serie.startdate.int_timestamp for serie in response.series] == [
+        _START - 60,
+        _START + 600,
+        _START + _DAY - 60,
+        _START + _DAY + 600,
+        _START + 2 * _DAY - 60,
+    ]
+
+
+@responses.activate
+def test_sleep_get_range() -> None:
+    """Test function."""
+
+    def callback(request: Any) -> Tuple[int, dict, str]:
+        startdate = int(
+            dict(parse.parse_qsl(parse.urlsplit(request.url).query))["startdate"]
+        )
+        return 200, {}, json.dumps({"status": 0, "body": sleep_get_body(startdate)})
+
+    responses.add_callback(
+        method=responses.GET,
+        url=re.compile("https://wbsapi.withings.net/v2/sleep.*"),
+        callback=callback,
+    )
+
+    check_merged(
+        WithingsApi(new_credentials()).sleep_get_range(
+            (GetSleepField.HR,), _START, _START + 2 * _DAY
+        )
+    )
+    assert len(responses.calls) == 2
+    assert merge_sleep_get([]).series == ()
+
+
+@responses.activate
+def test_sleep_get_range_expired_token() -> None:
+    """Test function."""
+    refreshes: Final = add_slow_refresh()
+    responses.add(
+        method=responses.GET,
+        url=re.compile("https://wbsapi.withings.net/v2/sleep.*"),
+        body=json.dumps({"status": 0, "body": sleep_get_body(_START)}),
+    )
+
+    WithingsApi(new_credentials(expires_in=-1)).sleep_get_range(
+        (GetSleepField.HR,), _START, _START + 4 * _DAY
+    )
+    # The windows fetched in parallel share one refresh.
+    assert refreshes == ["my_refresh_token"]
+    assert len(responses.calls) == 5
+
+
+def test_async_sleep_get_range() -> None:
+    """Test function."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(
+            200,
+            json={
+                "status": 0,
+                "body": sleep_get_body(int(request.url.params["startdate"])),
+            },
+        )
+
+    api: Final = AsyncWithingsApi(
+        new_credentials(),
+        client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+    )
+
+    check_merged(
+        asyncio.run(
+            api.sleep_get_range(
+                (GetSleepField.HR,), _START, _START + 2 * _DAY, max_concurrency=1
+            )
+        )
+    )
@@ -5,18 +5,33 @@ Withings Health API
 <https://developer.health.withings.com/api>
 """
 from abc import abstractmethod
-import datetime
-import json
-from types import LambdaType
-from typing import Any, Callable, Dict, Iterable, Optional, Union, cast
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import threading
+from time import perf_counter
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Generator,
+    Iterable,
+    Iterator,
+    Optional,
+    Tuple,
+    Union,
+    cast,
+)
 
 import arrow
-from oauthlib.common import to_unicode
-from oauthlib.oauth2 import WebApplicationClient
+from oauthlib.oauth2 import TokenExpiredError, WebApplicationClient
 from requests import Response
 from requests_oauthlib import OAuth2Session
 from typing_extensions import Final
 
+from .cache import ResponseCache
+from .codec import get_codec
+from .columnar import ColumnarSleepGetResponse, decode_sleep_get_columnar
 from .common import (
     AuthScope,
     Credentials2,
@@ -24,37 +39,89 @@ from .common import (
     GetActivityField,
     GetSleepField,
     GetSleepSummaryField,
+    GetSleepSummarySerie,
     HeartGetResponse,
     HeartListResponse,
+    HeartListSerie,
+    MeasureGetActivityActivity,
     MeasureGetActivityResponse,
+    MeasureGetMeasGroup,
     MeasureGetMeasGroupCategory,
     MeasureGetMeasResponse,
     MeasureType,
     NotifyAppli,
     NotifyGetResponse,
     NotifyListResponse,
+    PageType,
+    ResponseType,
     SleepGetResponse,
+    SleepGetSerie,
     SleepGetSummaryResponse,
     UserGetDeviceResponse,
+    adjust_withings_token_body,
+    as_body,
     maybe_upgrade_credentials,
+    refreshed_credentials,
     response_body_or_raise,
 )
+from .credentials import RefreshCoordinator
+from .fast import (
+    FastMeasureGetMeasResponse,
+    FastSleepGetResponse,
+    decode_measure_get_meas,
+    decode_sleep_get,
+)
+from .params import (  # noqa: F401 pylint: disable=unused-import
+    NOW,
+    DateType,
+    ParamsType,
+    heart_get_params,
+    heart_list_params,
+    measure_get_activity_params,
+    measure_get_meas_params,
+    notify_get_params,
+    notify_list_params,
+    notify_revoke_params,
+    notify_subscribe_params,
+    notify_update_params,
+    sleep_get_params,
+    sleep_get_summary_params,
+    update_params,
+    user_get_device_params,
+)
+from .ratelimit import RateLimiter
+from .signals import SignalStore
+from .stream import STREAM_CHUNK_SIZE, JsonArrayParser
+from .tracing import CallTrace, RetryEvent, Tracer, trace_refresh
+from .transport import SharedTransport
+from .windows import SLEEP_GET_MAX_SPAN, fetch_windows, merge_sleep_get
 
-DateType = Union[arrow.Arrow, datetime.date, datetime.datetime, int, str]
-ParamsType = Dict[str, Union[str, int, bool]]
 
+def iter_pages(
+    fetch_page: Callable[[Optional[int]], PageType], prefetch: bool = False
+) -> Generator[PageType, None, None]:
+    """
+    Follow the offset of a paged endpoint until there are no more pages.
 
-def update_params(
-    params: ParamsType, name: str, current_value: Any, new_value: Any = None
-) -> None:
-    """Add a conditional param to a params dict."""
-    if current_value is None:
+    fetch_page is called with the offset to fetch, None for the first page.
+    When prefetch is set, the next page is requested on a background thread
+    while the caller consumes the current one.
+    """
+    page = fetch_page(None)
+    if not prefetch:
+        yield page
+        while page.more:
+            page = fetch_page(page.offset)
+            yield page
         return
 
-    if isinstance(new_value, LambdaType):
-        params[name] = new_value(current_value)
-    else:
-        params[name] = new_value or current_value
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        while True:
+            future = executor.submit(fetch_page, page.offset) if page.more else None
+            yield page
+            if future is None:
+                return
+            page = future.result()
 
 
 def adjust_withings_token(response: Response) -> Response:
@@ -73,25 +140,18 @@ def adjust_withings_token(response: Response) -> Response:
         }
     """
     try:
-        token = json.loads(response.text)
+        token = get_codec().loads(response.content)
     except Exception:  # pylint: disable=broad-except
         # If there was exception, just return unmodified response
         return response
-    status = token.pop("status", 0)
-    if status:
-        # Set the error to the status
-        token["error"] = 0
-    body = token.pop("body", None)
-    if body:
-        # Put body content at root level
-        token.update(body)
+    adjust_withings_token_body(token)
     # pylint: disable=protected-access
-    response._content = to_unicode(json.dumps(token)).encode("UTF-8")
+    response._content = get_codec().dumps(token)
 
     return response
 
 
-class AbstractWithingsApi:
+class AbstractWithingsApi:  # pylint: disable=too-many-public-methods
     """Abstract class for customizing which requests module you want."""
 
     URL: Final = "https://wbsapi.withings.net"
@@ -102,19 +162,142 @@ class AbstractWithingsApi:
     PATH_NOTIFY: Final = "notify"
     PATH_V2_HEART: Final = "v2/heart"
 
+    rate_limiter: Optional[RateLimiter] = None
+    cache: Optional[ResponseCache] = None
+    tracer: Optional[Tracer] = None
+
     @abstractmethod
     def _request(
         self, path: str, params: Dict[str, Any], method: str = "GET"
     ) -> Dict[str, Any]:
         """Fetch data from the Withings API."""
 
+    def _request_stream(
+        self, path: str, params: Dict[str, Any], method: str = "GET"
+    ) -> Iterator[bytes]:
+        """
+        Fetch data from the Withings API as chunks of the raw response.
+
+        Override to stream, this default fetches the whole response at once.
+        """
+        yield get_codec().dumps(self._request(path=path, params=params, method=method))
+
+    def _rate_limit_scope(self) -> Tuple[str, Optional[int]]:
+        """Get the client id and user id calls are rate limited under."""
+        return "", None
+
     def request(
         self, path: str, params: Dict[str, Any], method: str = "GET"
     ) -> Dict[str, Any]:
         """Request a specific service."""
-        return response_body_or_raise(
+        return self._call(path=path, params=params, parse=as_body, method=method)
+
+    def _call(
+        self,
+        path: str,
+        params: Dict[str, Any],
+        parse: Callable[[Dict[str, Any]], ResponseType],
+        method: str = "GET",
+    ) -> ResponseType:
+        """Request a specific service and parse the response body."""
+        if self.tracer is None:
+            return parse(self._cached_request(path=path, params=params, method=method))
+
+        with CallTrace(
+            self.tracer, self._rate_limit_scope()[1], path, params, method
+        ) as trace:
+            body: Final = self._cached_request(
+                path=path, params=params, method=method, trace=trace
+            )
+            start: Final = perf_counter()
+            response: Final = parse(body)
+            trace.validate = perf_counter() - start
+            return response
+
+    def _cached_request(
+        self,
+        path: str,
+        params: Dict[str, Any],
+        method: str,
+        trace: Optional[CallTrace] = None,
+    ) -> Dict[str, Any]:
+        if self.cache is None or method != "GET":
+            return self._request_body(path, params, method, trace)
+
+        key: Final = self.cache.key(self._rate_limit_scope()[1], path, params)
+        if key is None:
+            return self._request_body(path, params, method, trace)
+
+        cached: Final = self.cache.get(key)
+        if cached is not None:
+            if trace is not None:
+                trace.cached = True
+            return cached
+
+        body: Final = self._request_body(path, params, method, trace)
+        self.cache.set(key, path, params, body)
+        return body
+
+    def _request_traced(
+        self, path: str, params: Dict[str, Any], method: str, trace: CallTrace
+    ) -> Dict[str, Any]:
+        """Fetch data, recording the phases of the call in the trace."""
+        start: Final = perf_counter()
+        data: Final = self._request(method=method, path=path, params=params)
+        trace.network = perf_counter() - start
+        return data
+
+    def _request_body(
+        self,
+        path: str,
+        params: Dict[str, Any],
+        method: str,
+        trace: Optional[CallTrace] = None,
+    ) -> Dict[str, Any]:
+        client_id, userid = self._rate_limit_scope()
+        if self.rate_limiter is not None:
+            start = perf_counter()
+            self.rate_limiter.acquire(client_id, userid)
+            if trace is not None:
+                trace.wait = perf_counter() - start
+
+        data: Final = (
             self._request(method=method, path=path, params=params)
+            if trace is None
+            else self._request_traced(path, params, method, trace)
         )
+        status: Final = data.get("status") if isinstance(data, dict) else None
+        if self.rate_limiter is not None:
+            self.rate_limiter.update(client_id, userid, status)
+
+        if trace is None:
+            return response_body_or_raise(data, path, params)
+
+        return trace.check_body(data, path, params)
+
+    def _stream_array(
+        self, path: str, params: Dict[str, Any], parser: JsonArrayParser
+    ) -> Generator[Any, None, None]:
+        """
+        Request a service, yielding the elements of an array as they are parsed.
+
+        The rest of the response is left in parser.document. Streamed
+        responses are neither cached nor traced.
+        """
+        client_id, userid = self._rate_limit_scope()
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(client_id, userid)
+
+        for chunk in self._request_stream(path, params):
+            elements = parser.feed(chunk)
+            if elements and "status" in parser.document:
+                response_body_or_raise(parser.document, path, params)
+            yield from elements
+        parser.close()
+
+        if self.rate_limiter is not None:
+            self.rate_limiter.update(client_id, userid, parser.document.get("status"))
+        response_body_or_raise(parser.document, path, params)
 
     def user_get_device(self) -> UserGetDeviceResponse:
         """
@@ -122,171 +305,351 @@ class AbstractWithingsApi:
 
         Some data related to user profile are available through those services.
         """
-        return UserGetDeviceResponse(
-            **self.request(path=self.PATH_V2_USER, params={"action": "getdevice"})
+        return self._call(
+            path=self.PATH_V2_USER,
+            params=user_get_device_params(),
+            parse=UserGetDeviceResponse.parse_obj,
         )
 
     def measure_get_activity(
         self,
         data_fields: Iterable[GetActivityField] = GetActivityField,
-        startdateymd: Optional[DateType] = arrow.utcnow(),
-        enddateymd: Optional[DateType] = arrow.utcnow(),
+        startdateymd: Optional[DateType] = NOW,
+        enddateymd: Optional[DateType] = NOW,
         offset: Optional[int] = None,
-        lastupdate: Optional[DateType] = arrow.utcnow(),
+        lastupdate: Optional[DateType] = NOW,
     ) -> MeasureGetActivityResponse:
         """Get user created activities."""
-        params: Final[ParamsType] = {}
-
-        update_params(
-            params,
-            "startdateymd",
-            startdateymd,
-            lambda val: arrow.get(val).format("YYYY-MM-DD"),
-        )
-        update_params(
-            params,
-            "enddateymd",
-            enddateymd,
-            lambda val: arrow.get(val).format("YYYY-MM-DD"),
-        )
-        update_params(params, "offset", offset)
-        update_params(
-            params,
-            "data_fields",
-            data_fields,
-            lambda fields: ",".join([field.value for field in fields]),
-        )
-        update_params(
-            params, "lastupdate", lastupdate, lambda val: arrow.get(val).int_timestamp
+        params: Final = measure_get_activity_params(
+            data_fields, startdateymd, enddateymd, offset, lastupdate
         )
-        update_params(params, "action", "getactivity")
 
-        return MeasureGetActivityResponse(
-            **self.request(path=self.PATH_V2_MEASURE, params=params)
+        return self._call(
+            path=self.PATH_V2_MEASURE,
+            params=params,
+            parse=MeasureGetActivityResponse.parse_obj,
         )
 
     def measure_get_meas(
         self,
         meastype: Optional[MeasureType] = None,
         category: Optional[MeasureGetMeasGroupCategory] = None,
-        startdate: Optional[DateType] = arrow.utcnow(),
-        enddate: Optional[DateType] = arrow.utcnow(),
+        startdate: Optional[DateType] = NOW,
+        enddate: Optional[DateType] = NOW,
         offset: Optional[int] = None,
-        lastupdate: Optional[DateType] = arrow.utcnow(),
+        lastupdate: Optional[DateType] = NOW,
     ) -> MeasureGetMeasResponse:
         """Get measures."""
-        params: Final[ParamsType] = {}
-
-        update_params(params, "meastype", meastype, lambda val: val.value)
-        update_params(params, "category", category, lambda val: val.value)
-        update_params(
-            params, "startdate", startdate, lambda val: arrow.get(val).int_timestamp
+        params: Final = measure_get_meas_params(
+            meastype, category, startdate, enddate, offset, lastupdate
         )
-        update_params(
-            params, "enddate", enddate, lambda val: arrow.get(val).int_timestamp
+
+        return self._call(
+            path=self.PATH_MEASURE,
+            params=params,
+            parse=MeasureGetMeasResponse.parse_obj,
         )
-        update_params(params, "offset", offset)
-        update_params(
-            params, "lastupdate", lastupdate, lambda val: arrow.get(val).int_timestamp
+
+    def measure_get_meas_fast(
+        self,
+        meastype: Optional[MeasureType] = None,
+        category: Optional[MeasureGetMeasGroupCategory] = None,
+        startdate: Optional[DateType] = NOW,
+        enddate: Optional[DateType] = NOW,
+        offset: Optional[int] = None,
+        lastupdate: Optional[DateType] = NOW,
+    ) -> FastMeasureGetMeasResponse:
+        """Get measures, decoded into records without pydantic validation."""
+        params: Final = measure_get_meas_params(
+            meastype, category, startdate, enddate, offset, lastupdate
         )
-        update_params(params, "action", "getmeas")
 
-        return MeasureGetMeasResponse(
-            **self.request(path=self.PATH_MEASURE, params=params)
+        return self._call(
+            path=self.PATH_MEASURE, params=params, parse=decode_measure_get_meas
         )
 
     def sleep_get(
         self,
         data_fields: Iterable[GetSleepField],
-        startdate: Optional[DateType] = arrow.utcnow(),
-        enddate: Optional[DateType] = arrow.utcnow(),
+        startdate: Optional[DateType] = NOW,
+        enddate: Optional[DateType] = NOW,
     ) -> SleepGetResponse:
         """Get sleep data."""
-        params: Final[ParamsType] = {}
+        params: Final = sleep_get_params(data_fields, startdate, enddate)
 
-        update_params(
-            params, "startdate", startdate, lambda val: arrow.get(val).int_timestamp
+        return self._call(
+            path=self.PATH_V2_SLEEP, params=params, parse=SleepGetResponse.parse_obj
         )
-        update_params(
-            params, "enddate", enddate, lambda val: arrow.get(val).int_timestamp
+
+    def sleep_get_range(
+        self,
+        data_fields: Iterable[GetSleepField],
+        startdate: DateType,
+        enddate: DateType = NOW,
+        max_workers: int = 4,
+    ) -> SleepGetResponse:
+        """
+        Get sleep data of a range longer than sleep_get allows.
+
+        The range is split in windows of 24 hours fetched concurrently, at most
+        max_workers at a time, and merged into one response.
+        """
+        return merge_sleep_get(
+            fetch_windows(
+                lambda window_start, window_end: self.sleep_get(
+                    data_fields, window_start, window_end
+                ),
+                startdate,
+                enddate,
+                SLEEP_GET_MAX_SPAN,
+                max_workers,
+            )
         )
-        update_params(
-            params,
-            "data_fields",
-            data_fields,
-            lambda fields: ",".join([field.value for field in fields]),
+
+    def sleep_get_fast(
+        self,
+        data_fields: Iterable[GetSleepField],
+        startdate: Optional[DateType] = NOW,
+        enddate: Optional[DateType] = NOW,
+        lazy_timestamps: bool = False,
+    ) -> FastSleepGetResponse:
+        """
+        Get sleep data, decoded into records without pydantic validation.
+
+        See decode_sleep_get for lazy_timestamps.
+        """
+        params: Final = sleep_get_params(data_fields, startdate, enddate)
+
+        return self._call(
+            path=self.PATH_V2_SLEEP,
+            params=params,
+            parse=lambda body: decode_sleep_get(body, lazy_timestamps),
         )
-        update_params(params, "action", "get")
 
-        return SleepGetResponse(**self.request(path=self.PATH_V2_SLEEP, params=params))
+    def sleep_get_columnar(
+        self,
+        data_fields: Iterable[GetSleepField],
+        startdate: Optional[DateType] = NOW,
+        enddate: Optional[DateType] = NOW,
+    ) -> ColumnarSleepGetResponse:
+        """Get sleep data, with the time series decoded into arrays."""
+        params: Final = sleep_get_params(data_fields, startdate, enddate)
+
+        return self._call(
+            path=self.PATH_V2_SLEEP, params=params, parse=decode_sleep_get_columnar
+        )
 
     def sleep_get_summary(
         self,
         data_fields: Iterable[GetSleepSummaryField],
-        startdateymd: Optional[DateType] = arrow.utcnow(),
-        enddateymd: Optional[DateType] = arrow.utcnow(),
+        startdateymd: Optional[DateType] = NOW,
+        enddateymd: Optional[DateType] = NOW,
         offset: Optional[int] = None,
-        lastupdate: Optional[DateType] = arrow.utcnow(),
+        lastupdate: Optional[DateType] = NOW,
     ) -> SleepGetSummaryResponse:
         """Get sleep summary."""
-        params: Final[ParamsType] = {}
-
-        update_params(
-            params,
-            "startdateymd",
-            startdateymd,
-            lambda val: arrow.get(val).format("YYYY-MM-DD"),
-        )
-        update_params(
-            params,
-            "enddateymd",
-            enddateymd,
-            lambda val: arrow.get(val).format("YYYY-MM-DD"),
+        params: Final = sleep_get_summary_params(
+            data_fields, startdateymd, enddateymd, offset, lastupdate
         )
-        update_params(
-            params,
-            "data_fields",
-            data_fields,
-            lambda fields: ",".join([field.value for field in fields]),
-        )
-        update_params(params, "offset", offset)
-        update_params(
-            params, "lastupdate", lastupdate, lambda val: arrow.get(val).int_timestamp
-        )
-        update_params(params, "action", "getsummary")
 
-        return SleepGetSummaryResponse(
-            **self.request(path=self.PATH_V2_SLEEP, params=params)
+        return self._call(
+            path=self.PATH_V2_SLEEP,
+            params=params,
+            parse=SleepGetSummaryResponse.parse_obj,
         )
 
     def heart_get(self, signalid: int) -> HeartGetResponse:
         """Get ECG recording."""
-        params: Final[ParamsType] = {}
+        params: Final = heart_get_params(signalid)
 
-        update_params(params, "signalid", signalid)
-        update_params(params, "action", "get")
-
-        return HeartGetResponse(**self.request(path=self.PATH_V2_HEART, params=params))
+        return self._call(
+            path=self.PATH_V2_HEART, params=params, parse=HeartGetResponse.parse_obj
+        )
 
     def heart_list(
         self,
-        startdate: Optional[DateType] = arrow.utcnow(),
-        enddate: Optional[DateType] = arrow.utcnow(),
+        startdate: Optional[DateType] = NOW,
+        enddate: Optional[DateType] = NOW,
         offset: Optional[int] = None,
     ) -> HeartListResponse:
         """Get heart list."""
-        params: Final[ParamsType] = {}
+        params: Final = heart_list_params(startdate, enddate, offset)
 
-        update_params(
-            params, "startdate", startdate, lambda val: arrow.get(val).int_timestamp,
+        return self._call(
+            path=self.PATH_V2_HEART, params=params, parse=HeartListResponse.parse_obj
         )
-        update_params(
-            params, "enddate", enddate, lambda val: arrow.get(val).int_timestamp,
-        )
-        update_params(params, "offset", offset)
-        update_params(params, "action", "list")
 
-        return HeartListResponse(**self.request(path=self.PATH_V2_HEART, params=params))
+    def iter_activities(
+        self,
+        data_fields: Iterable[GetActivityField] = GetActivityField,
+        startdateymd: Optional[DateType] = NOW,
+        enddateymd: Optional[DateType] = NOW,
+        lastupdate: Optional[DateType] = NOW,
+        prefetch: bool = False,
+    ) -> Generator[MeasureGetActivityActivity, None, None]:
+        """Iterate activities from every page of measure_get_activity."""
+        for page in iter_pages(
+            lambda offset: self.measure_get_activity(
+                data_fields, startdateymd, enddateymd, offset, lastupdate
+            ),
+            prefetch,
+        ):
+            yield from page.activities
+
+    def iter_measure_groups(
+        self,
+        meastype: Optional[MeasureType] = None,
+        category: Optional[MeasureGetMeasGroupCategory] = None,
+        startdate: Optional[DateType] = NOW,
+        enddate: Optional[DateType] = NOW,
+        lastupdate: Optional[DateType] = NOW,
+        prefetch: bool = False,
+    ) -> Generator[MeasureGetMeasGroup, None, None]:
+        """Iterate measure groups from every page of measure_get_meas."""
+        for page in iter_pages(
+            lambda offset: self.measure_get_meas(
+                meastype, category, startdate, enddate, offset, lastupdate
+            ),
+            prefetch,
+        ):
+            yield from page.measuregrps
+
+    def stream_measure_groups(
+        self,
+        meastype: Optional[MeasureType] = None,
+        category: Optional[MeasureGetMeasGroupCategory] = None,
+        startdate: Optional[DateType] = NOW,
+        enddate: Optional[DateType] = NOW,
+        lastupdate: Optional[DateType] = NOW,
+    ) -> Generator[MeasureGetMeasGroup, None, None]:
+        """
+        Iterate measure groups from every page of measure_get_meas.
+
+        Each response is parsed while it is received, only the group being
+        parsed is held in memory.
+        """
+        offset: Optional[int] = None
+        while True:
+            parser = JsonArrayParser(("body", "measuregrps"))
+            for group in self._stream_array(
+                self.PATH_MEASURE,
+                measure_get_meas_params(
+                    meastype, category, startdate, enddate, offset, lastupdate
+                ),
+                parser,
+            ):
+                yield MeasureGetMeasGroup.parse_obj(group)
+
+            body = parser.document.get("body") or {}
+            if not body.get("more"):
+                return
+            offset = body.get("offset")
+
+    def stream_sleep_series(
+        self,
+        data_fields: Iterable[GetSleepField],
+        startdate: Optional[DateType] = NOW,
+        enddate: Optional[DateType] = NOW,
+    ) -> Generator[SleepGetSerie, None, None]:
+        """
+        Iterate the series of sleep_get.
+
+        The response is parsed while it is received, only the serie being
+        parsed is held in memory.
+        """
+        for serie in self._stream_array(
+            self.PATH_V2_SLEEP,
+            sleep_get_params(data_fields, startdate, enddate),
+            JsonArrayParser(("body", "series")),
+        ):
+            yield SleepGetSerie.parse_obj(serie)
+
+    def iter_sleep_summary_series(
+        self,
+        data_fields: Iterable[GetSleepSummaryField],
+        startdateymd: Optional[DateType] = NOW,
+        enddateymd: Optional[DateType] = NOW,
+        lastupdate: Optional[DateType] = NOW,
+        prefetch: bool = False,
+    ) -> Generator[GetSleepSummarySerie, None, None]:
+        """Iterate series from every page of sleep_get_summary."""
+        for page in iter_pages(
+            lambda offset: self.sleep_get_summary(
+                data_fields, startdateymd, enddateymd, offset, lastupdate
+            ),
+            prefetch,
+        ):
+            yield from page.series
+
+    def iter_heart_series(
+        self,
+        startdate: Optional[DateType] = NOW,
+        enddate: Optional[DateType] = NOW,
+        prefetch: bool = False,
+    ) -> Generator[HeartListSerie, None, None]:
+        """Iterate series from every page of heart_list."""
+        for page in iter_pages(
+            lambda offset: self.heart_list(startdate, enddate, offset), prefetch
+        ):
+            yield from page.series
+
+    def iter_heart_signals(
+        self,
+        startdate: Optional[DateType] = NOW,
+        enddate: Optional[DateType] = NOW,
+        store: Optional[SignalStore] = None,
+        max_workers: int = 4,
+        include_stored: bool = False,
+    ) -> Generator[Tuple[HeartListSerie, HeartGetResponse], None, None]:
+        """
+        Iterate series of heart_list with their heart_get signals, in order.
+
+        Signals are fetched on a pool of max_workers threads, no more than
+        max_workers ahead of the caller, while the next page of heart_list
+        is prefetched. Signals found in store are not fetched, and only
+        yielded when include_stored is set. Fetched signals are saved to it.
+        """
+        pending: Final[
+            Deque[
+                Tuple[
+                    HeartListSerie, Union[HeartGetResponse, "Future[HeartGetResponse]"]
+                ]
+            ]
+        ] = deque()
+
+        def next_pair() -> Tuple[HeartListSerie, HeartGetResponse]:
+            serie, fetched = pending.popleft()
+            if isinstance(fetched, HeartGetResponse):
+                return serie, fetched
+
+            response: Final = fetched.result()
+            if store is not None:
+                store.put(serie.ecg.signalid, response)
+            return serie, response
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            try:
+                for serie in self.iter_heart_series(startdate, enddate, True):
+                    signalid = serie.ecg.signalid
+                    stored = store is not None and signalid in store
+                    if stored and not include_stored:
+                        continue
+
+                    while len(pending) >= max(1, max_workers):
+                        yield next_pair()
+                    pending.append(
+                        (serie, cast(HeartGetResponse, store.get(signalid)))
+                        if store is not None and stored
+                        else (serie, executor.submit(self.heart_get, signalid))
+                    )
+
+                while pending:
+                    yield next_pair()
+            finally:
+                # The caller may stop early, don't fetch what it won't get.
+                for _, fetched in pending:
+                    if not isinstance(fetched, HeartGetResponse):
+                        fetched.cancel()
 
     def notify_get(
         self, callbackurl: str, appli: Optional[NotifyAppli] = None
@@ -297,22 +660,19 @@ class AbstractWithingsApi:
         Return the last notification service that a user was subscribed to,
         and its expiry date.
         """
-        params: Final[ParamsType] = {}
-
-        update_params(params, "callbackurl", callbackurl)
-        update_params(params, "appli", appli, lambda appli: appli.value)
-        update_params(params, "action", "get")
+        params: Final = notify_get_params(callbackurl, appli)
 
-        return NotifyGetResponse(**self.request(path=self.PATH_NOTIFY, params=params))
+        return self._call(
+            path=self.PATH_NOTIFY, params=params, parse=NotifyGetResponse.parse_obj
+        )
 
     def notify_list(self, appli: Optional[NotifyAppli] = None) -> NotifyListResponse:
         """List notification configuration for this user."""
-        params: Final[ParamsType] = {}
-
-        update_params(params, "appli", appli, lambda appli: appli.value)
-        update_params(params, "action", "list")
+        params: Final = notify_list_params(appli)
 
-        return NotifyListResponse(**self.request(path=self.PATH_NOTIFY, params=params))
+        return self._call(
+            path=self.PATH_NOTIFY, params=params, parse=NotifyListResponse.parse_obj
+        )
 
     def notify_revoke(
         self, callbackurl: Optional[str] = None, appli: Optional[NotifyAppli] = None
@@ -323,11 +683,7 @@ class AbstractWithingsApi:
         This service disables the notification between the API and the
         specified applications for the user.
         """
-        params: Final[ParamsType] = {}
-
-        update_params(params, "callbackurl", callbackurl)
-        update_params(params, "appli", appli, lambda appli: appli.value)
-        update_params(params, "action", "revoke")
+        params: Final = notify_revoke_params(callbackurl, appli)
 
         self.request(path=self.PATH_NOTIFY, params=params)
 
@@ -338,12 +694,7 @@ class AbstractWithingsApi:
         comment: Optional[str] = None,
     ) -> None:
         """Subscribe to receive notifications when new data is available."""
-        params: Final[ParamsType] = {}
-
-        update_params(params, "callbackurl", callbackurl)
-        update_params(params, "appli", appli, lambda appli: appli.value)
-        update_params(params, "comment", comment)
-        update_params(params, "action", "subscribe")
+        params: Final = notify_subscribe_params(callbackurl, appli, comment)
 
         self.request(path=self.PATH_NOTIFY, params=params)
 
@@ -356,14 +707,9 @@ class AbstractWithingsApi:
         comment: Optional[str] = None,
     ) -> None:
         """Update the callbackurl and or appli of a created notification."""
-        params: Final[ParamsType] = {}
-
-        update_params(params, "callbackurl", callbackurl)
-        update_params(params, "appli", appli, lambda appli: appli.value)
-        update_params(params, "new_callbackurl", new_callbackurl)
-        update_params(params, "new_appli", new_appli, lambda new_appli: new_appli.value)
-        update_params(params, "comment", comment)
-        update_params(params, "action", "update")
+        params: Final = notify_update_params(
+            callbackurl, appli, new_callbackurl, new_appli, comment
+        )
 
         self.request(path=self.PATH_NOTIFY, params=params)
 
@@ -434,7 +780,7 @@ class WithingsAuth:
         )
 
 
-class WithingsApi(AbstractWithingsApi):
+class WithingsApi(AbstractWithingsApi):  # pylint: disable=too-many-instance-attributes
     """
     Provides entrypoint for calling the withings api.
 
@@ -459,10 +805,21 @@ class WithingsApi(AbstractWithingsApi):
         self,
         credentials: CredentialsType,
         refresh_cb: Optional[Callable[[Credentials2], None]] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        cache: Optional[ResponseCache] = None,
+        transport: Optional[SharedTransport] = None,
+        refresh_coordinator: Optional[RefreshCoordinator] = None,
+        tracer: Optional[Tracer] = None,
     ):
         """Initialize new object."""
         self._credentials = maybe_upgrade_credentials(credentials)
         self._refresh_cb: Final = refresh_cb or self._blank_refresh_cb
+        self.rate_limiter = rate_limiter
+        self.cache = cache
+        self.tracer = tracer
+        self.refresh_coordinator: Final = refresh_coordinator
+        self._refresh_lock: Final = threading.Lock()
+        self._timeout: Final = transport.timeout if transport else None
         token: Final = {
             "access_token": self._credentials.access_token,
             "refresh_token": self._credentials.refresh_token,
@@ -478,13 +835,13 @@ class WithingsApi(AbstractWithingsApi):
                 token=token,
                 default_token_placement="query",
             ),
-            auto_refresh_url="%s/%s" % (self.URL, WithingsAuth.PATH_V2_OAUTH2),
+            # Expired tokens are refreshed by _send, not by the session, so
+            # the refresh goes through the coordinator and the tracer.
             auto_refresh_kwargs={
                 "action": "requesttoken",
                 "client_id": self._credentials.client_id,
                 "client_secret": self._credentials.consumer_secret,
             },
-            token_updater=self._update_token,
         )
         self._client.register_compliance_hook(
             "access_token_response", adjust_withings_token
@@ -492,6 +849,8 @@ class WithingsApi(AbstractWithingsApi):
         self._client.register_compliance_hook(
             "refresh_token_response", adjust_withings_token
         )
+        if transport:
+            transport.mount(self._client)
 
     def _blank_refresh_cb(self, creds: Credentials2) -> None:
         """The default callback which does nothing."""
@@ -500,35 +859,105 @@ class WithingsApi(AbstractWithingsApi):
         """Get the current oauth credentials."""
         return self._credentials
 
+    def _rate_limit_scope(self) -> Tuple[str, Optional[int]]:
+        return self._credentials.client_id, self._credentials.userid
+
+    def use_credentials(self, credentials: Credentials2) -> None:
+        """Switch to credentials refreshed elsewhere, without calling refresh_cb."""
+        self._credentials = credentials
+        self._client.token = {
+            "access_token": credentials.access_token,
+            "refresh_token": credentials.refresh_token,
+            "token_type": credentials.token_type,
+            "expires_in": credentials.token_expiry - arrow.utcnow().int_timestamp,
+        }
+
     def refresh_token(self) -> None:
         """Manually refresh the token."""
-        token_dict: Final = self._client.refresh_token(
-            token_url=self._client.auto_refresh_url
-        )
-        self._update_token(token=token_dict)
+        if self.refresh_coordinator is None:
+            self._refresh_token()
+        else:
+            self.refresh_coordinator.refresh(self, force=True)
+
+    def _refresh_token(self) -> None:
+        with trace_refresh(self.tracer, self._credentials.userid):
+            token_dict: Final = self._client.refresh_token(
+                token_url="%s/%s" % (self.URL, WithingsAuth.PATH_V2_OAUTH2),
+                timeout=self._timeout,
+            )
+            self._update_token(token=token_dict)
 
     def _update_token(self, token: Dict[str, Union[str, int]]) -> None:
         """Set the oauth token."""
-        self._credentials = Credentials2(
-            access_token=token["access_token"],
-            expires_in=token["expires_in"],
-            token_type=self._credentials.token_type,
-            refresh_token=token["refresh_token"],
-            userid=self._credentials.userid,
-            client_id=self._credentials.client_id,
-            consumer_secret=self._credentials.consumer_secret,
-        )
+        self._credentials = refreshed_credentials(self._credentials, token)
 
+        if self.refresh_coordinator is not None:
+            self.refresh_coordinator.store.put(self._credentials)
         self._refresh_cb(self._credentials)
 
-    def _request(
-        self, path: str, params: Dict[str, Any], method: str = "GET"
-    ) -> Dict[str, Any]:
+    def _send(
+        self, path: str, params: Dict[str, Any], method: str, stream: bool = False
+    ) -> Response:
+        """Send a request, refreshing the token and sending again if expired."""
+        access_token: Final = self._credentials.access_token
+        try:
+            return self._send_once(path, params, method, stream)
+        except TokenExpiredError as error:
+            with self._refresh_lock:
+                # Another thread may have refreshed while we were waiting.
+                if self._credentials.access_token == access_token:
+                    self.refresh_token()
+            if self.tracer is not None:
+                self.tracer.on_retry(
+                    RetryEvent(
+                        self._credentials.userid, path, params.get("action"), error
+                    )
+                )
+
+        return self._send_once(path, params, method, stream)
+
+    def _send_once(
+        self, path: str, params: Dict[str, Any], method: str, stream: bool
+    ) -> Response:
         return cast(
-            Dict[str, Any],
+            Response,
             self._client.request(
                 method=method,
                 url="%s/%s" % (self.URL.strip("/"), path.strip("/")),
                 params=params,
-            ).json(),
+                timeout=self._timeout,
+                stream=stream,
+            ),
+        )
+
+    def _request(
+        self, path: str, params: Dict[str, Any], method: str = "GET"
+    ) -> Dict[str, Any]:
+        if self.refresh_coordinator is not None:
+            self.refresh_coordinator.refresh(self)
+
+        return cast(
+            Dict[str, Any], get_codec().loads(self._send(path, params, method).content)
         )
+
+    def _request_stream(
+        self, path: str, params: Dict[str, Any], method: str = "GET"
+    ) -> Iterator[bytes]:
+        if self.refresh_coordinator is not None:
+            self.refresh_coordinator.refresh(self)
+
+        response: Final = self._send(path, params, method, stream=True)
+        try:
+            yield from response.iter_content(STREAM_CHUNK_SIZE)
+        finally:
+            response.close()
+
+    def _request_traced(
+        self, path: str, params: Dict[str, Any], method: str, trace: CallTrace
+    ) -> Dict[str, Any]:
+        if self.refresh_coordinator is not None:
+            self.refresh_coordinator.refresh(self)
+
+        sent: Final = perf_counter()
+        response: Final = self._send(path, params, method)
+        return trace.decode_response(sent, response.status_code, response.content)
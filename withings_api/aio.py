@@ -0,0 +1,855 @@
+"""
+Asyncio support for the Withings Health API.
+
+Requires the optional ``httpx`` dependency (``pip install withings-api[async]``)
+for the bundled ``AsyncWithingsApi`` transport.
+"""
+from abc import abstractmethod
+import asyncio
+from collections import deque
+from time import perf_counter
+from typing import (
+    Any,
+    AsyncGenerator,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+    cast,
+)
+
+import arrow
+from typing_extensions import Final
+
+from . import AbstractWithingsApi, WithingsAuth
+from .cache import ResponseCache
+from .codec import get_codec
+from .columnar import ColumnarSleepGetResponse, decode_sleep_get_columnar
+from .common import (
+    AuthFailedException,
+    Credentials2,
+    CredentialsType,
+    GetActivityField,
+    GetSleepField,
+    GetSleepSummaryField,
+    GetSleepSummarySerie,
+    HeartGetResponse,
+    HeartListResponse,
+    HeartListSerie,
+    MeasureGetActivityActivity,
+    MeasureGetActivityResponse,
+    MeasureGetMeasGroup,
+    MeasureGetMeasGroupCategory,
+    MeasureGetMeasResponse,
+    MeasureType,
+    NotifyAppli,
+    NotifyGetResponse,
+    NotifyListResponse,
+    PageType,
+    ResponseType,
+    SleepGetResponse,
+    SleepGetSerie,
+    SleepGetSummaryResponse,
+    UserGetDeviceResponse,
+    adjust_withings_token_body,
+    as_body,
+    maybe_upgrade_credentials,
+    refreshed_credentials,
+    response_body_or_raise,
+)
+from .fast import (
+    FastMeasureGetMeasResponse,
+    FastSleepGetResponse,
+    decode_measure_get_meas,
+    decode_sleep_get,
+)
+from .params import (
+    NOW,
+    DateType,
+    heart_get_params,
+    heart_list_params,
+    measure_get_activity_params,
+    measure_get_meas_params,
+    notify_get_params,
+    notify_list_params,
+    notify_revoke_params,
+    notify_subscribe_params,
+    notify_update_params,
+    sleep_get_params,
+    sleep_get_summary_params,
+    user_get_device_params,
+)
+from .ratelimit import RateLimiter
+from .signals import SignalStore
+from .stream import STREAM_CHUNK_SIZE, JsonArrayParser
+from .tracing import CallTrace, Tracer, trace_refresh
+from .windows import SLEEP_GET_MAX_SPAN, async_fetch_windows, merge_sleep_get
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover
+    httpx = None  # type: ignore
+
+_ItemType = TypeVar("_ItemType")
+
+
+async def aiter_items(
+    fetch_page: Callable[[Optional[int]], Awaitable[PageType]],
+    get_items: Callable[[PageType], Iterable[_ItemType]],
+    prefetch: bool = False,
+) -> AsyncGenerator[_ItemType, None]:
+    """
+    Follow the offset of a paged endpoint and yield the items of every page.
+
+    Async counterpart of withings_api.iter_pages. When prefetch is set, the
+    next page is requested in a task while the caller consumes the current one.
+    """
+    page = await fetch_page(None)
+    while True:
+        next_page = (
+            asyncio.ensure_future(fetch_page(page.offset))
+            if page.more and prefetch
+            else None
+        )
+        try:
+            for item in get_items(page):
+                yield item
+        except GeneratorExit:
+            # The caller stopped early, don't leave the request dangling.
+            if next_page is not None:
+                next_page.cancel()
+            raise
+
+        if not page.more:
+            return
+        page = await (next_page or fetch_page(page.offset))
+
+
+class AbstractAsyncWithingsApi:  # pylint: disable=too-many-public-methods
+    """Abstract class for customizing which async http module you want."""
+
+    URL: Final = AbstractWithingsApi.URL
+    PATH_V2_USER: Final = AbstractWithingsApi.PATH_V2_USER
+    PATH_V2_MEASURE: Final = AbstractWithingsApi.PATH_V2_MEASURE
+    PATH_MEASURE: Final = AbstractWithingsApi.PATH_MEASURE
+    PATH_V2_SLEEP: Final = AbstractWithingsApi.PATH_V2_SLEEP
+    PATH_NOTIFY: Final = AbstractWithingsApi.PATH_NOTIFY
+    PATH_V2_HEART: Final = AbstractWithingsApi.PATH_V2_HEART
+
+    rate_limiter: Optional[RateLimiter] = None
+    cache: Optional[ResponseCache] = None
+    tracer: Optional[Tracer] = None
+
+    @abstractmethod
+    async def _request(
+        self, path: str, params: Dict[str, Any], method: str = "GET"
+    ) -> Dict[str, Any]:
+        """Fetch data from the Withings API."""
+
+    async def _request_stream(
+        self, path: str, params: Dict[str, Any], method: str = "GET"
+    ) -> AsyncGenerator[bytes, None]:
+        """
+        Fetch data from the Withings API as chunks of the raw response.
+
+        Override to stream, this default fetches the whole response at once.
+        """
+        yield get_codec().dumps(
+            await self._request(path=path, params=params, method=method)
+        )
+
+    def _rate_limit_scope(self) -> Tuple[str, Optional[int]]:
+        """Get the client id and user id calls are rate limited under."""
+        return "", None
+
+    async def request(
+        self, path: str, params: Dict[str, Any], method: str = "GET"
+    ) -> Dict[str, Any]:
+        """Request a specific service."""
+        return await self._call(path=path, params=params, parse=as_body, method=method)
+
+    async def _call(
+        self,
+        path: str,
+        params: Dict[str, Any],
+        parse: Callable[[Dict[str, Any]], ResponseType],
+        method: str = "GET",
+    ) -> ResponseType:
+        """Request a specific service and parse the response body."""
+        if self.tracer is None:
+            return parse(
+                await self._cached_request(path=path, params=params, method=method)
+            )
+
+        with CallTrace(
+            self.tracer, self._rate_limit_scope()[1], path, params, method
+        ) as trace:
+            body: Final = await self._cached_request(
+                path=path, params=params, method=method, trace=trace
+            )
+            start: Final = perf_counter()
+            response: Final = parse(body)
+            trace.validate = perf_counter() - start
+            return response
+
+    async def _cached_request(
+        self,
+        path: str,
+        params: Dict[str, Any],
+        method: str,
+        trace: Optional[CallTrace] = None,
+    ) -> Dict[str, Any]:
+        if self.cache is None or method != "GET":
+            return await self._request_body(path, params, method, trace)
+
+        key: Final = self.cache.key(self._rate_limit_scope()[1], path, params)
+        if key is None:
+            return await self._request_body(path, params, method, trace)
+
+        cached: Final = self.cache.get(key)
+        if cached is not None:
+            if trace is not None:
+                trace.cached = True
+            return cached
+
+        body: Final = await self._request_body(path, params, method, trace)
+        self.cache.set(key, path, params, body)
+        return body
+
+    async def _request_traced(
+        self, path: str, params: Dict[str, Any], method: str, trace: CallTrace
+    ) -> Dict[str, Any]:
+        """Fetch data, recording the phases of the call in the trace."""
+        start: Final = perf_counter()
+        data: Final = await self._request(method=method, path=path, params=params)
+        trace.network = perf_counter() - start
+        return data
+
+    async def _request_body(
+        self,
+        path: str,
+        params: Dict[str, Any],
+        method: str,
+        trace: Optional[CallTrace] = None,
+    ) -> Dict[str, Any]:
+        client_id, userid = self._rate_limit_scope()
+        if self.rate_limiter is not None:
+            wait: Final = self.rate_limiter.reserve(client_id, userid)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            if trace is not None:
+                trace.wait = wait
+
+        data: Final = (
+            await self._request(method=method, path=path, params=params)
+            if trace is None
+            else await self._request_traced(path, params, method, trace)
+        )
+        status: Final = data.get("status") if isinstance(data, dict) else None
+        if self.rate_limiter is not None:
+            self.rate_limiter.update(client_id, userid, status)
+
+        if trace is None:
+            return response_body_or_raise(data, path, params)
+
+        return trace.check_body(data, path, params)
+
+    async def _stream_array(
+        self, path: str, params: Dict[str, Any], parser: JsonArrayParser
+    ) -> AsyncGenerator[Any, None]:
+        """
+        Request a service, yielding the elements of an array as they are parsed.
+
+        The rest of the response is left in parser.document. Streamed
+        responses are neither cached nor traced.
+        """
+        client_id, userid = self._rate_limit_scope()
+        if self.rate_limiter is not None:
+            wait: Final = self.rate_limiter.reserve(client_id, userid)
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+        async for chunk in self._request_stream(path, params):
+            elements = parser.feed(chunk)
+            if elements and "status" in parser.document:
+                response_body_or_raise(parser.document, path, params)
+            for element in elements:
+                yield element
+        parser.close()
+
+        if self.rate_limiter is not None:
+            self.rate_limiter.update(client_id, userid, parser.document.get("status"))
+        response_body_or_raise(parser.document, path, params)
+
+    async def user_get_device(self) -> UserGetDeviceResponse:
+        """
+        Get user device.
+
+        Some data related to user profile are available through those services.
+        """
+        return await self._call(
+            path=self.PATH_V2_USER,
+            params=user_get_device_params(),
+            parse=UserGetDeviceResponse.parse_obj,
+        )
+
+    async def measure_get_activity(
+        self,
+        data_fields: Iterable[GetActivityField] = GetActivityField,
+        startdateymd: Optional[DateType] = NOW,
+        enddateymd: Optional[DateType] = NOW,
+        offset: Optional[int] = None,
+        lastupdate: Optional[DateType] = NOW,
+    ) -> MeasureGetActivityResponse:
+        """Get user created activities."""
+        params: Final = measure_get_activity_params(
+            data_fields, startdateymd, enddateymd, offset, lastupdate
+        )
+
+        return await self._call(
+            path=self.PATH_V2_MEASURE,
+            params=params,
+            parse=MeasureGetActivityResponse.parse_obj,
+        )
+
+    async def measure_get_meas(
+        self,
+        meastype: Optional[MeasureType] = None,
+        category: Optional[MeasureGetMeasGroupCategory] = None,
+        startdate: Optional[DateType] = NOW,
+        enddate: Optional[DateType] = NOW,
+        offset: Optional[int] = None,
+        lastupdate: Optional[DateType] = NOW,
+    ) -> MeasureGetMeasResponse:
+        """Get measures."""
+        params: Final = measure_get_meas_params(
+            meastype, category, startdate, enddate, offset, lastupdate
+        )
+
+        return await self._call(
+            path=self.PATH_MEASURE,
+            params=params,
+            parse=MeasureGetMeasResponse.parse_obj,
+        )
+
+    async def measure_get_meas_fast(
+        self,
+        meastype: Optional[MeasureType] = None,
+        category: Optional[MeasureGetMeasGroupCategory] = None,
+        startdate: Optional[DateType] = NOW,
+        enddate: Optional[DateType] = NOW,
+        offset: Optional[int] = None,
+        lastupdate: Optional[DateType] = NOW,
+    ) -> FastMeasureGetMeasResponse:
+        """Get measures, decoded into records without pydantic validation."""
+        params: Final = measure_get_meas_params(
+            meastype, category, startdate, enddate, offset, lastupdate
+        )
+
+        return await self._call(
+            path=self.PATH_MEASURE, params=params, parse=decode_measure_get_meas
+        )
+
+    async def sleep_get(
+        self,
+        data_fields: Iterable[GetSleepField],
+        startdate: Optional[DateType] = NOW,
+        enddate: Optional[DateType] = NOW,
+    ) -> SleepGetResponse:
+        """Get sleep data."""
+        params: Final = sleep_get_params(data_fields, startdate, enddate)
+
+        return await self._call(
+            path=self.PATH_V2_SLEEP, params=params, parse=SleepGetResponse.parse_obj
+        )
+
+    async def sleep_get_range(
+        self,
+        data_fields: Iterable[GetSleepField],
+        startdate: DateType,
+        enddate: DateType = NOW,
+        max_concurrency: int = 4,
+    ) -> SleepGetResponse:
+        """
+        Get sleep data of a range longer than sleep_get allows.
+
+        The range is split in windows of 24 hours fetched concurrently, at most
+        max_concurrency at a time, and merged into one response.
+        """
+        return merge_sleep_get(
+            await async_fetch_windows(
+                lambda window_start, window_end: self.sleep_get(
+                    data_fields, window_start, window_end
+                ),
+                startdate,
+                enddate,
+                SLEEP_GET_MAX_SPAN,
+                max_concurrency,
+            )
+        )
+
+    async def sleep_get_fast(
+        self,
+        data_fields: Iterable[GetSleepField],
+        startdate: Optional[DateType] = NOW,
+        enddate: Optional[DateType] = NOW,
+        lazy_timestamps: bool = False,
+    ) -> FastSleepGetResponse:
+        """
+        Get sleep data, decoded into records without pydantic validation.
+
+        See decode_sleep_get for lazy_timestamps.
+        """
+        params: Final = sleep_get_params(data_fields, startdate, enddate)
+
+        return await self._call(
+            path=self.PATH_V2_SLEEP,
+            params=params,
+            parse=lambda body: decode_sleep_get(body, lazy_timestamps),
+        )
+
+    async def sleep_get_columnar(
+        self,
+        data_fields: Iterable[GetSleepField],
+        startdate: Optional[DateType] = NOW,
+        enddate: Optional[DateType] = NOW,
+    ) -> ColumnarSleepGetResponse:
+        """Get sleep data, with the time series decoded into arrays."""
+        params: Final = sleep_get_params(data_fields, startdate, enddate)
+
+        return await self._call(
+            path=self.PATH_V2_SLEEP, params=params, parse=decode_sleep_get_columnar
+        )
+
+    async def sleep_get_summary(
+        self,
+        data_fields: Iterable[GetSleepSummaryField],
+        startdateymd: Optional[DateType] = NOW,
+        enddateymd: Optional[DateType] = NOW,
+        offset: Optional[int] = None,
+        lastupdate: Optional[DateType] = NOW,
+    ) -> SleepGetSummaryResponse:
+        """Get sleep summary."""
+        params: Final = sleep_get_summary_params(
+            data_fields, startdateymd, enddateymd, offset, lastupdate
+        )
+
+        return await self._call(
+            path=self.PATH_V2_SLEEP,
+            params=params,
+            parse=SleepGetSummaryResponse.parse_obj,
+        )
+
+    async def heart_get(self, signalid: int) -> HeartGetResponse:
+        """Get ECG recording."""
+        params: Final = heart_get_params(signalid)
+
+        return await self._call(
+            path=self.PATH_V2_HEART, params=params, parse=HeartGetResponse.parse_obj
+        )
+
+    async def heart_list(
+        self,
+        startdate: Optional[DateType] = NOW,
+        enddate: Optional[DateType] = NOW,
+        offset: Optional[int] = None,
+    ) -> HeartListResponse:
+        """Get heart list."""
+        params: Final = heart_list_params(startdate, enddate, offset)
+
+        return await self._call(
+            path=self.PATH_V2_HEART, params=params, parse=HeartListResponse.parse_obj
+        )
+
+    def iter_activities(
+        self,
+        data_fields: Iterable[GetActivityField] = GetActivityField,
+        startdateymd: Optional[DateType] = NOW,
+        enddateymd: Optional[DateType] = NOW,
+        lastupdate: Optional[DateType] = NOW,
+        prefetch: bool = False,
+    ) -> AsyncGenerator[MeasureGetActivityActivity, None]:
+        """Iterate activities from every page of measure_get_activity."""
+        return aiter_items(
+            lambda offset: self.measure_get_activity(
+                data_fields, startdateymd, enddateymd, offset, lastupdate
+            ),
+            lambda page: page.activities,
+            prefetch,
+        )
+
+    def iter_measure_groups(
+        self,
+        meastype: Optional[MeasureType] = None,
+        category: Optional[MeasureGetMeasGroupCategory] = None,
+        startdate: Optional[DateType] = NOW,
+        enddate: Optional[DateType] = NOW,
+        lastupdate: Optional[DateType] = NOW,
+        prefetch: bool = False,
+    ) -> AsyncGenerator[MeasureGetMeasGroup, None]:
+        """Iterate measure groups from every page of measure_get_meas."""
+        return aiter_items(
+            lambda offset: self.measure_get_meas(
+                meastype, category, startdate, enddate, offset, lastupdate
+            ),
+            lambda page: page.measuregrps,
+            prefetch,
+        )
+
+    async def stream_measure_groups(
+        self,
+        meastype: Optional[MeasureType] = None,
+        category: Optional[MeasureGetMeasGroupCategory] = None,
+        startdate: Optional[DateType] = NOW,
+        enddate: Optional[DateType] = NOW,
+        lastupdate: Optional[DateType] = NOW,
+    ) -> AsyncGenerator[MeasureGetMeasGroup, None]:
+        """
+        Iterate measure groups from every page of measure_get_meas.
+
+        Each response is parsed while it is received, only the group being
+        parsed is held in memory.
+        """
+        offset: Optional[int] = None
+        while True:
+            parser = JsonArrayParser(("body", "measuregrps"))
+            async for group in self._stream_array(
+                self.PATH_MEASURE,
+                measure_get_meas_params(
+                    meastype, category, startdate, enddate, offset, lastupdate
+                ),
+                parser,
+            ):
+                yield MeasureGetMeasGroup.parse_obj(group)
+
+            body = parser.document.get("body") or {}
+            if not body.get("more"):
+                return
+            offset = body.get("offset")
+
+    async def stream_sleep_series(
+        self,
+        data_fields: Iterable[GetSleepField],
+        startdate: Optional[DateType] = NOW,
+        enddate: Optional[DateType] = NOW,
+    ) -> AsyncGenerator[SleepGetSerie, None]:
+        """
+        Iterate the series of sleep_get.
+
+        The response is parsed while it is received, only the serie being
+        parsed is held in memory.
+        """
+        async for serie in self._stream_array(
+            self.PATH_V2_SLEEP,
+            sleep_get_params(data_fields, startdate, enddate),
+            JsonArrayParser(("body", "series")),
+        ):
+            yield SleepGetSerie.parse_obj(serie)
+
+    def iter_sleep_summary_series(
+        self,
+        data_fields: Iterable[GetSleepSummaryField],
+        startdateymd: Optional[DateType] = NOW,
+        enddateymd: Optional[DateType] = NOW,
+        lastupdate: Optional[DateType] = NOW,
+        prefetch: bool = False,
+    ) -> AsyncGenerator[GetSleepSummarySerie, None]:
+        """Iterate series from every page of sleep_get_summary."""
+        return aiter_items(
+            lambda offset: self.sleep_get_summary(
+                data_fields, startdateymd, enddateymd, offset, lastupdate
+            ),
+            lambda page: page.series,
+            prefetch,
+        )
+
+    def iter_heart_series(
+        self,
+        startdate: Optional[DateType] = NOW,
+        enddate: Optional[DateType] = NOW,
+        prefetch: bool = False,
+    ) -> AsyncGenerator[HeartListSerie, None]:
+        """Iterate series from every page of heart_list."""
+        return aiter_items(
+            lambda offset: self.heart_list(startdate, enddate, offset),
+            lambda page: page.series,
+            prefetch,
+        )
+
+    async def iter_heart_signals(
+        self,
+        startdate: Optional[DateType] = NOW,
+        enddate: Optional[DateType] = NOW,
+        store: Optional[SignalStore] = None,
+        max_concurrency: int = 4,
+        include_stored: bool = False,
+    ) -> AsyncGenerator[Tuple[HeartListSerie, HeartGetResponse], None]:
+        """
+        Iterate series of heart_list with their heart_get signals, in order.
+
+        Signals are fetched in up to max_concurrency tasks, no more than
+        max_concurrency ahead of the caller, while the next page of
+        heart_list is prefetched. Signals found in store are not fetched,
+        and only yielded when include_stored is set. Fetched signals are
+        saved to it.
+        """
+        pending: Final[
+            Deque[
+                Tuple[
+                    HeartListSerie,
+                    Union[HeartGetResponse, "asyncio.Future[HeartGetResponse]"],
+                ]
+            ]
+        ] = deque()
+
+        async def next_pair() -> Tuple[HeartListSerie, HeartGetResponse]:
+            serie, fetched = pending.popleft()
+            if isinstance(fetched, HeartGetResponse):
+                return serie, fetched
+
+            response: Final = await fetched
+            if store is not None:
+                store.put(serie.ecg.signalid, response)
+            return serie, response
+
+        series: Final = self.iter_heart_series(startdate, enddate, True)
+        try:
+            async for serie in series:
+                signalid = serie.ecg.signalid
+                stored = store is not None and signalid in store
+                if stored and not include_stored:
+                    continue
+
+                while len(pending) >= max(1, max_concurrency):
+                    yield await next_pair()
+                pending.append(
+                    (serie, cast(HeartGetResponse, store.get(signalid)))
+                    if store is not None and stored
+                    else (serie, asyncio.ensure_future(self.heart_get(signalid)))
+                )
+
+            while pending:
+                yield await next_pair()
+        finally:
+            # The caller may stop early, don't fetch what it won't get.
+            for _, fetched in pending:
+                if not isinstance(fetched, HeartGetResponse):
+                    fetched.cancel()
+            # Nor the heart_list page being prefetched.
+            await series.aclose()
+
+    async def notify_get(
+        self, callbackurl: str, appli: Optional[NotifyAppli] = None
+    ) -> NotifyGetResponse:
+        """
+        Get subscription.
+
+        Return the last notification service that a user was subscribed to,
+        and its expiry date.
+        """
+        params: Final = notify_get_params(callbackurl, appli)
+
+        return await self._call(
+            path=self.PATH_NOTIFY, params=params, parse=NotifyGetResponse.parse_obj
+        )
+
+    async def notify_list(
+        self, appli: Optional[NotifyAppli] = None
+    ) -> NotifyListResponse:
+        """List notification configuration for this user."""
+        params: Final = notify_list_params(appli)
+
+        return await self._call(
+            path=self.PATH_NOTIFY, params=params, parse=NotifyListResponse.parse_obj
+        )
+
+    async def notify_revoke(
+        self, callbackurl: Optional[str] = None, appli: Optional[NotifyAppli] = None
+    ) -> None:
+        """
+        Revoke a subscription.
+
+        This service disables the notification between the API and the
+        specified applications for the user.
+        """
+        params: Final = notify_revoke_params(callbackurl, appli)
+
+        await self.request(path=self.PATH_NOTIFY, params=params)
+
+    async def notify_subscribe(
+        self,
+        callbackurl: str,
+        appli: Optional[NotifyAppli] = None,
+        comment: Optional[str] = None,
+    ) -> None:
+        """Subscribe to receive notifications when new data is available."""
+        params: Final = notify_subscribe_params(callbackurl, appli, comment)
+
+        await self.request(path=self.PATH_NOTIFY, params=params)
+
+    async def notify_update(
+        self,
+        callbackurl: str,
+        appli: NotifyAppli,
+        new_callbackurl: str,
+        new_appli: Optional[NotifyAppli] = None,
+        comment: Optional[str] = None,
+    ) -> None:
+        """Update the callbackurl and or appli of a created notification."""
+        params: Final = notify_update_params(
+            callbackurl, appli, new_callbackurl, new_appli, comment
+        )
+
+        await self.request(path=self.PATH_NOTIFY, params=params)
+
+
+class AsyncWithingsApi(AbstractAsyncWithingsApi):
+    """
+    Provides an asyncio entrypoint for calling the withings api.
+
+    Behaves like WithingsApi, including token refresh and ``refresh_cb``,
+    but every call is awaitable. Pass the same ``httpx.AsyncClient`` to many
+    instances so all users share one connection pool.
+
+    client = httpx.AsyncClient()
+    apis = [AsyncWithingsApi(creds, client=client) for creds in all_creds]
+    results = await asyncio.gather(*(api.measure_get_meas() for api in apis))
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(
+        self,
+        credentials: CredentialsType,
+        refresh_cb: Optional[Callable[[Credentials2], None]] = None,
+        client: Optional["httpx.AsyncClient"] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        cache: Optional[ResponseCache] = None,
+        tracer: Optional[Tracer] = None,
+    ):
+        """Initialize new object."""
+        if httpx is None:  # pragma: no cover
+            raise ImportError("AsyncWithingsApi requires the httpx package.")
+
+        self._credentials = maybe_upgrade_credentials(credentials)
+        self._refresh_cb: Final = refresh_cb or self._blank_refresh_cb
+        self.rate_limiter = rate_limiter
+        self.cache = cache
+        self.tracer = tracer
+        self._owns_client: Final = client is None
+        self._client: Final = client or httpx.AsyncClient()
+        self._refresh_lock: Optional[asyncio.Lock] = None
+
+    async def __aenter__(self) -> "AsyncWithingsApi":
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """Close the http client if it was created by this object."""
+        if self._owns_client:
+            await self._client.aclose()
+
+    def _blank_refresh_cb(self, creds: Credentials2) -> None:
+        """The default callback which does nothing."""
+
+    def get_credentials(self) -> Credentials2:
+        """Get the current oauth credentials."""
+        return self._credentials
+
+    def _rate_limit_scope(self) -> Tuple[str, Optional[int]]:
+        return self._credentials.client_id, self._credentials.userid
+
+    def _get_refresh_lock(self) -> asyncio.Lock:
+        # Created lazily so the lock binds to the running event loop.
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+
+        return self._refresh_lock
+
+    async def refresh_token(self) -> None:
+        """Manually refresh the token."""
+        async with self._get_refresh_lock():
+            await self._refresh_token()
+
+    async def _refresh_token(self) -> None:
+        with trace_refresh(self.tracer, self._credentials.userid):
+            response: Final = await self._client.post(
+                "%s/%s" % (self.URL, WithingsAuth.PATH_V2_OAUTH2),
+                data={
+                    "action": "requesttoken",
+                    "grant_type": "refresh_token",
+                    "client_id": self._credentials.client_id,
+                    "client_secret": self._credentials.consumer_secret,
+                    "refresh_token": self._credentials.refresh_token,
+                },
+            )
+            data: Final = get_codec().loads(response.content)
+            status: Final = data.get("status")
+            token: Final = adjust_withings_token_body(data)
+            if "error" in token or "access_token" not in token:
+                raise AuthFailedException(status=status)
+
+            self._update_token(token=token)
+
+    async def _maybe_refresh_token(self) -> None:
+        if self._credentials.token_expiry >= arrow.utcnow().int_timestamp:
+            return
+
+        access_token: Final = self._credentials.access_token
+        async with self._get_refresh_lock():
+            # Another task may have refreshed while we were waiting.
+            if self._credentials.access_token == access_token:
+                await self._refresh_token()
+
+    def _update_token(self, token: Dict[str, Union[str, int]]) -> None:
+        """Set the oauth token."""
+        self._credentials = refreshed_credentials(self._credentials, token)
+
+        self._refresh_cb(self._credentials)
+
+    async def _send(
+        self, path: str, params: Dict[str, Any], method: str
+    ) -> "httpx.Response":
+        return await self._client.request(
+            method=method,
+            url="%s/%s" % (self.URL.strip("/"), path.strip("/")),
+            params={**params, "access_token": self._credentials.access_token},
+        )
+
+    async def _request(
+        self, path: str, params: Dict[str, Any], method: str = "GET"
+    ) -> Dict[str, Any]:
+        await self._maybe_refresh_token()
+
+        response: Final = await self._send(path, params, method)
+
+        return cast(Dict[str, Any], get_codec().loads(response.content))
+
+    async def _request_stream(
+        self, path: str, params: Dict[str, Any], method: str = "GET"
+    ) -> AsyncGenerator[bytes, None]:
+        await self._maybe_refresh_token()
+
+        async with self._client.stream(
+            method,
+            "%s/%s" % (self.URL.strip("/"), path.strip("/")),
+            params={**params, "access_token": self._credentials.access_token},
+        ) as response:
+            async for chunk in response.aiter_bytes(STREAM_CHUNK_SIZE):
+                yield chunk
+
+    async def _request_traced(
+        self, path: str, params: Dict[str, Any], method: str, trace: CallTrace
+    ) -> Dict[str, Any]:
+        await self._maybe_refresh_token()
+
+        sent: Final = perf_counter()
+        response: Final = await self._send(path, params, method)
+        return trace.decode_response(sent, response.status_code, response.content)
@@ -0,0 +1,181 @@
+"""Fetch data for many users concurrently."""
+import asyncio
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import (
+    AsyncGenerator,
+    Awaitable,
+    Callable,
+    Generator,
+    Generic,
+    Iterable,
+    Optional,
+    Set,
+    TypeVar,
+)
+
+from typing_extensions import Final
+
+from . import WithingsApi
+from .aio import AsyncWithingsApi, httpx
+from .common import Credentials2, CredentialsType
+from .ratelimit import RateLimiter
+
+_ResultType = TypeVar("_ResultType")
+RefreshCbType = Optional[Callable[[Credentials2], None]]
+
+
+@dataclass(frozen=True)
+class BatchResult(Generic[_ResultType]):
+    """
+    The outcome of a fetch for one user.
+
+    credentials are the latest ones of the user, or the ones given when they
+    could not be used.
+    """
+
+    credentials: CredentialsType
+    result: Optional[_ResultType] = None
+    error: Optional[Exception] = None
+
+    @property
+    def userid(self) -> int:
+        """Get the withings user id."""
+        return self.credentials.userid
+
+    @property
+    def ok(self) -> bool:  # pylint: disable=invalid-name
+        """Check if the fetch succeeded."""
+        return self.error is None
+
+
+def _fetch_one(
+    credentials: CredentialsType,
+    fetch: Callable[[WithingsApi], _ResultType],
+    refresh_cb: RefreshCbType,
+    rate_limiter: Optional[RateLimiter],
+) -> BatchResult[_ResultType]:
+    api: Optional[WithingsApi] = None
+    try:
+        api = WithingsApi(credentials, refresh_cb=refresh_cb, rate_limiter=rate_limiter)
+        result: Final = fetch(api)
+        return BatchResult(credentials=api.get_credentials(), result=result)
+    except Exception as error:  # pylint: disable=broad-except
+        # One user failing, even on malformed credentials, must not abort the
+        # batch.
+        return BatchResult(
+            credentials=credentials if api is None else api.get_credentials(),
+            error=error,
+        )
+
+
+def fetch_batch(
+    credentials: Iterable[CredentialsType],
+    fetch: Callable[[WithingsApi], _ResultType],
+    max_workers: int = 8,
+    refresh_cb: RefreshCbType = None,
+    rate_limiter: Optional[RateLimiter] = None,
+) -> Generator[BatchResult[_ResultType], None, None]:
+    """
+    Run fetch for every user on a thread pool.
+
+    At most max_workers users are in flight at any time. Results are yielded
+    as they complete. Exceptions raised for a user, such as
+    AuthFailedException or TooManyRequestsException, are returned in that
+    user's BatchResult instead of being raised. refresh_cb is called with the
+    new credentials whenever a user's token is refreshed. Pass a rate_limiter
+    to keep the whole batch within the client id's quota.
+
+    for item in fetch_batch(all_creds, lambda api: api.measure_get_meas()):
+        if item.ok:
+            save(item.userid, item.result)
+    """
+    pending: Set[Future] = set()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for creds in credentials:
+            pending.add(
+                executor.submit(_fetch_one, creds, fetch, refresh_cb, rate_limiter)
+            )
+            if len(pending) < max_workers:
+                continue
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+        for future in wait(pending).done:
+            yield future.result()
+
+
+async def _afetch_one(
+    credentials: CredentialsType,
+    fetch: Callable[[AsyncWithingsApi], Awaitable[_ResultType]],
+    refresh_cb: RefreshCbType,
+    rate_limiter: Optional[RateLimiter],
+    client: "httpx.AsyncClient",
+) -> BatchResult[_ResultType]:
+    api: Optional[AsyncWithingsApi] = None
+    try:
+        api = AsyncWithingsApi(
+            credentials, refresh_cb=refresh_cb, client=client, rate_limiter=rate_limiter
+        )
+        result: Final = await fetch(api)
+        return BatchResult(credentials=api.get_credentials(), result=result)
+    except Exception as error:  # pylint: disable=broad-except
+        # One user failing, even on malformed credentials, must not abort the
+        # batch.
+        return BatchResult(
+            credentials=credentials if api is None else api.get_credentials(),
+            error=error,
+        )
+
+
+async def afetch_batch(
+    credentials: Iterable[CredentialsType],
+    fetch: Callable[[AsyncWithingsApi], Awaitable[_ResultType]],
+    max_concurrency: int = 100,
+    refresh_cb: RefreshCbType = None,
+    rate_limiter: Optional[RateLimiter] = None,
+    client: Optional["httpx.AsyncClient"] = None,
+) -> AsyncGenerator[BatchResult[_ResultType], None]:
+    """
+    Run fetch for every user on the running event loop.
+
+    Asyncio counterpart of fetch_batch. All users share one http client,
+    which is created and closed here unless one is passed in.
+    """
+    if httpx is None:
+        raise ImportError(
+            "afetch_batch requires the httpx package, "
+            "install withings-api[async] to get it."
+        )
+
+    shared_client: Final = client or httpx.AsyncClient()
+    pending: Set[asyncio.Future] = set()
+
+    try:
+        for creds in credentials:
+            pending.add(
+                asyncio.ensure_future(
+                    _afetch_one(creds, fetch, refresh_cb, rate_limiter, shared_client)
+                )
+            )
+            if len(pending) < max_concurrency:
+                continue
+
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                yield task.result()
+
+        while pending:
+            done, pending = await asyncio.wait(pending)
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+        if client is None:
+            await shared_client.aclose()
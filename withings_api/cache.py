@@ -0,0 +1,221 @@
+"""
+Response caching for the Withings API.
+
+Most Withings data never changes once recorded: an ECG signal fetched by
+signalid stays the same forever, and measures and sleep from last month are
+rarely edited. ResponseCache keeps response bodies keyed by user, path and
+params so asking for them again costs no api call.
+
+Dates near the time of the call, like the defaults of enddate, startdate
+and lastupdate, are keyed as "now" while they are within the ttl of the
+endpoint, so they hit the body of an earlier call too.
+"""
+from abc import abstractmethod
+from collections import OrderedDict
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Mapping, Optional, Tuple
+from urllib.parse import urlencode
+
+from typing_extensions import Final
+
+from .codec import get_codec
+from .ratelimit import ClockType
+
+TtlsType = Mapping[Tuple[str, str], Optional[float]]
+
+# Seconds to keep a body per (path, action), None to keep it forever.
+# Actions that are not listed are never cached.
+DEFAULT_TTLS: Final[TtlsType] = {
+    ("v2/heart", "get"): None,
+    ("v2/heart", "list"): 300,
+    ("measure", "getmeas"): 300,
+    ("v2/measure", "getactivity"): 300,
+    ("v2/sleep", "get"): 3600,
+    ("v2/sleep", "getsummary"): 300,
+}
+
+# Params that default to the time of the call.
+_NOW_PARAMS: Final = ("enddate", "lastupdate", "startdate")
+
+
+class CacheBackend:
+    """Stores response bodies by key."""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get a body, None if missing or expired."""
+
+    @abstractmethod
+    def set(self, key: str, value: Dict[str, Any], ttl: Optional[float]) -> None:
+        """Store a body for ttl seconds, forever if ttl is None."""
+
+
+class MemoryCache(CacheBackend):
+    """
+    Thread safe in memory LRU cache.
+
+    Bodies are kept encoded, each get returns a new dict that callers may
+    change.
+    """
+
+    def __init__(self, maxsize: int = 1024, clock: ClockType = time.monotonic):
+        """Initialize new object."""
+        self._maxsize: Final = maxsize
+        self._clock: Final = clock
+        self._lock: Final = threading.Lock()
+        self._entries: Final[
+            "OrderedDict[str, Tuple[Optional[float], bytes]]"
+        ] = OrderedDict()
+
+    def __len__(self) -> int:
+        """Get the number of entries, expired ones included."""
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get a body, None if missing or expired."""
+        with self._lock:
+            entry: Final = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires, value = entry
+            if expires is not None and expires <= self._clock():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+        return dict(get_codec().loads(value))
+
+    def set(self, key: str, value: Dict[str, Any], ttl: Optional[float]) -> None:
+        """Store a body for ttl seconds, forever if ttl is None."""
+        data: Final = get_codec().dumps(value)
+        with self._lock:
+            self._entries[key] = (None if ttl is None else self._clock() + ttl, data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+
+
+class SQLiteCache(CacheBackend):
+    """
+    Cache stored in a SQLite database, kept across restarts.
+
+    Expired entries are deleted when read, and all of them at most every
+    purge_interval seconds when storing.
+    """
+
+    def __init__(
+        self, path: str, clock: ClockType = time.time, purge_interval: float = 3600
+    ):
+        """Initialize new object."""
+        self._clock: Final = clock
+        self._purge_interval: Final = purge_interval
+        self._next_purge = clock() + purge_interval
+        self._lock: Final = threading.Lock()
+        self._connection: Final = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                "key TEXT PRIMARY KEY, expires REAL, value TEXT)"
+            )
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get a body, None if missing or expired."""
+        with self._lock, self._connection:
+            row: Final = self._connection.execute(
+                "SELECT expires, value FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            if row[0] is not None and row[0] <= self._clock():
+                self._connection.execute(
+                    "DELETE FROM response_cache WHERE key = ?", (key,)
+                )
+                return None
+
+        return dict(get_codec().loads(row[1]))
+
+    def set(self, key: str, value: Dict[str, Any], ttl: Optional[float]) -> None:
+        """Store a body for ttl seconds, forever if ttl is None."""
+        data: Final = get_codec().dumps(value)
+        with self._lock, self._connection:
+            now: Final = self._clock()
+            self._connection.execute(
+                "INSERT OR REPLACE INTO response_cache VALUES (?, ?, ?)",
+                (key, None if ttl is None else now + ttl, data),
+            )
+            if now >= self._next_purge:
+                self._purge(now)
+
+    def purge(self) -> None:
+        """Delete expired entries."""
+        with self._lock, self._connection:
+            self._purge(self._clock())
+
+    def _purge(self, now: float) -> None:
+        self._connection.execute(
+            "DELETE FROM response_cache WHERE expires <= ?", (now,)
+        )
+        self._next_purge = now + self._purge_interval
+
+    def close(self) -> None:
+        """Close the database."""
+        with self._lock:
+            self._connection.close()
+
+
+class ResponseCache:
+    """
+    Decides what to cache and for how long.
+
+    Pass one to WithingsApi or AsyncWithingsApi to have request() answer
+    from the cache when it can. It may be shared by many instances, bodies
+    are keyed by user, so calls without a userid are never cached.
+
+    cache = ResponseCache(SQLiteCache("withings-cache.db"))
+    api = WithingsApi(credentials, cache=cache)
+    """
+
+    def __init__(
+        self,
+        backend: Optional[CacheBackend] = None,
+        ttls: Optional[TtlsType] = None,
+        clock: ClockType = time.time,
+    ):
+        """Initialize new object, ttls default to DEFAULT_TTLS."""
+        self.backend: Final = MemoryCache() if backend is None else backend
+        self._ttls: Final = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self._clock: Final = clock
+
+    def key(
+        self, userid: Optional[int], path: str, params: Dict[str, Any]
+    ) -> Optional[str]:
+        """Get the key of a request, None if it must not be cached."""
+        endpoint: Final[Tuple[str, str]] = (path, params.get("action", ""))
+        if userid is None or endpoint not in self._ttls:
+            return None
+
+        ttl: Final = self._ttls[endpoint]
+        if ttl is not None:
+            recent: Final = self._clock() - ttl
+            params = {
+                name: "now"
+                if name in _NOW_PARAMS and isinstance(value, int) and value >= recent
+                else value
+                for name, value in params.items()
+            }
+
+        return "%s/%s?%s" % (userid, path, urlencode(sorted(params.items())))
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get a cached body."""
+        return self.backend.get(key)
+
+    def set(
+        self, key: str, path: str, params: Dict[str, Any], body: Dict[str, Any]
+    ) -> None:
+        """Cache a body with the ttl of its endpoint."""
+        self.backend.set(key, body, self._ttls[(path, params["action"])])
@@ -0,0 +1,79 @@
+"""
+Json codecs.
+
+Responses, token responses and cached bodies are decoded and encoded with
+the codec set process wide, the stdlib json module by default. orjson,
+ujson and msgspec are used instead when installed and chosen:
+
+set_codec("orjson")
+"""
+import json
+from typing import Any, Callable, Dict, List, NamedTuple, Union
+
+from typing_extensions import Final
+
+
+class JsonCodec(NamedTuple):
+    """Decodes json from bytes or str and encodes values to utf-8 bytes."""
+
+    name: str
+    loads: Callable[[Union[bytes, str]], Any]
+    dumps: Callable[[Any], bytes]
+
+
+def _json_dumps(value: Any) -> bytes:
+    return json.dumps(value).encode("utf-8")
+
+
+CODECS: Final[Dict[str, JsonCodec]] = {
+    "json": JsonCodec("json", json.loads, _json_dumps)
+}
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    pass
+else:  # pragma: no cover
+    CODECS["orjson"] = JsonCodec("orjson", orjson.loads, orjson.dumps)
+
+try:
+    import ujson
+except ImportError:  # pragma: no cover
+    pass
+else:  # pragma: no cover
+    CODECS["ujson"] = JsonCodec(
+        "ujson", ujson.loads, lambda value: ujson.dumps(value).encode("utf-8")
+    )
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover
+    pass
+else:  # pragma: no cover
+    CODECS["msgspec"] = JsonCodec(
+        "msgspec", msgspec.json.Decoder().decode, msgspec.json.Encoder().encode
+    )
+
+_codec = CODECS["json"]
+
+
+def available_codecs() -> List[str]:
+    """Get the names of the codecs that can be used here."""
+    return list(CODECS)
+
+
+def get_codec() -> JsonCodec:
+    """Get the codec in use."""
+    return _codec
+
+
+def set_codec(name: str) -> None:
+    """Use a codec of available_codecs for every json decoding and encoding."""
+    global _codec  # pylint: disable=global-statement
+    if name not in CODECS:
+        raise ValueError(
+            "Unknown or unavailable json codec %s, available: %s"
+            % (name, ", ".join(CODECS))
+        )
+
+    _codec = CODECS[name]
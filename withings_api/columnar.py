@@ -0,0 +1,221 @@
+"""
+Columnar decoding of sleep get time series.
+
+A night of sleep monitor data holds thousands of timestamp/value pairs per
+serie. SleepGetSerie turns each of them into a pydantic object holding an
+Arrow timestamp. The series here keep the pairs in two contiguous arrays
+instead, epoch seconds as int64 and values as int32, and only build
+SleepGetTimestampValue objects when they are read one by one.
+"""
+from array import array
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+    overload,
+)
+
+from arrow import Arrow
+from typing_extensions import Final
+
+from .common import (
+    SleepGetSerie,
+    SleepGetTimestampValue,
+    SleepModel,
+    SleepState,
+    arrow_from_timestamp,
+    to_enum,
+)
+from .fast import to_arrow
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None  # type: ignore
+
+TIMESTAMP_TYPECODE: Final = "q"
+VALUE_TYPECODE: Final = "i"
+
+
+class TimestampValueSeries:
+    """An array backed sequence of SleepGetTimestampValue."""
+
+    __slots__ = ("timestamps", "values")
+
+    def __init__(self, timestamps: Iterable[int] = (), values: Iterable[int] = ()):
+        """Initialize new object."""
+        self.timestamps: Final = array(TIMESTAMP_TYPECODE, timestamps)
+        self.values: Final = array(VALUE_TYPECODE, values)
+
+        if len(self.timestamps) != len(self.values):
+            raise ValueError("timestamps and values must have the same length.")
+
+    @classmethod
+    def from_dict(cls, value: Optional[Dict[str, Any]]) -> "TimestampValueSeries":
+        """Build from the {timestamp: value} dict of a json body."""
+        if not value:
+            return cls()
+
+        return cls(
+            [int(item_key) for item_key in value.keys()],
+            [int(item_value) for item_value in value.values()],
+        )
+
+    @classmethod
+    def from_objects(
+        cls, items: Iterable[SleepGetTimestampValue]
+    ) -> "TimestampValueSeries":
+        """Build from SleepGetTimestampValue objects."""
+        items_list: Final = list(items)
+        return cls(
+            [item.timestamp.int_timestamp for item in items_list],
+            [item.value for item in items_list],
+        )
+
+    def __len__(self) -> int:
+        """Get the number of items."""
+        return len(self.timestamps)
+
+    @overload
+    def __getitem__(self, index: int) -> SleepGetTimestampValue:
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> "TimestampValueSeries":
+        ...
+
+    def __getitem__(
+        self, index: Union[int, slice]
+    ) -> Union[SleepGetTimestampValue, "TimestampValueSeries"]:
+        """Get one item as an object, or a slice as a new series."""
+        if isinstance(index, slice):
+            return TimestampValueSeries(self.timestamps[index], self.values[index])
+
+        return SleepGetTimestampValue(
+            timestamp=arrow_from_timestamp(self.timestamps[index]),
+            value=self.values[index],
+        )
+
+    def __iter__(self) -> Iterator[SleepGetTimestampValue]:
+        """Iterate over the items as objects."""
+        for timestamp, value in zip(self.timestamps, self.values):
+            yield SleepGetTimestampValue(
+                timestamp=arrow_from_timestamp(timestamp), value=value
+            )
+
+    def __eq__(self, other: Any) -> bool:
+        """Compare the arrays of two series."""
+        if not isinstance(other, TimestampValueSeries):
+            return NotImplemented
+
+        return self.timestamps == other.timestamps and self.values == other.values
+
+    def __repr__(self) -> str:
+        """Get the representation of the object."""
+        return "TimestampValueSeries(%s, %s)" % (
+            self.timestamps.tolist(),
+            self.values.tolist(),
+        )
+
+    @property
+    def nbytes(self) -> int:
+        """Get the number of bytes used by both arrays."""
+        return (
+            len(self.timestamps) * self.timestamps.itemsize
+            + len(self.values) * self.values.itemsize
+        )
+
+    def to_objects(self) -> Tuple[SleepGetTimestampValue, ...]:
+        """Materialize all items, like SleepGetSerie holds them."""
+        return tuple(self)
+
+    def mean(self) -> Optional[float]:
+        """Get the mean of the values, or None for an empty series."""
+        if not self.values:
+            return None
+
+        return sum(self.values) / len(self.values)
+
+    def to_numpy(self) -> Tuple[Any, Any]:
+        """Get the timestamps and values as numpy arrays sharing this memory."""
+        if numpy is None:
+            raise ImportError("numpy is required for to_numpy().")
+
+        return (
+            numpy.frombuffer(self.timestamps, dtype=numpy.int64),
+            numpy.frombuffer(self.values, dtype=numpy.int32),
+        )
+
+
+class ColumnarSleepGetSerie(NamedTuple):
+    """Columnar counterpart of SleepGetSerie."""
+
+    enddate: Arrow
+    startdate: Arrow
+    state: SleepState
+    hr: TimestampValueSeries  # pylint: disable=invalid-name
+    rr: TimestampValueSeries  # pylint: disable=invalid-name
+    snoring: TimestampValueSeries
+    sdnn_1: TimestampValueSeries
+    rmssd: TimestampValueSeries
+
+    def to_model(self) -> SleepGetSerie:
+        """Materialize the serie as a pydantic model."""
+        return SleepGetSerie(
+            enddate=self.enddate,
+            startdate=self.startdate,
+            state=self.state,
+            hr=self.hr.to_objects(),
+            rr=self.rr.to_objects(),
+            snoring=self.snoring.to_objects(),
+            sdnn_1=self.sdnn_1.to_objects(),
+            rmssd=self.rmssd.to_objects(),
+        )
+
+
+class ColumnarSleepGetResponse(NamedTuple):
+    """Columnar counterpart of SleepGetResponse."""
+
+    model: SleepModel
+    series: Tuple[ColumnarSleepGetSerie, ...]
+
+
+def to_columnar(serie: SleepGetSerie) -> ColumnarSleepGetSerie:
+    """Convert a SleepGetSerie model to its columnar form."""
+    return ColumnarSleepGetSerie(
+        enddate=serie.enddate,
+        startdate=serie.startdate,
+        state=serie.state,
+        hr=TimestampValueSeries.from_objects(serie.hr),
+        rr=TimestampValueSeries.from_objects(serie.rr),
+        snoring=TimestampValueSeries.from_objects(serie.snoring),
+        sdnn_1=TimestampValueSeries.from_objects(serie.sdnn_1),
+        rmssd=TimestampValueSeries.from_objects(serie.rmssd),
+    )
+
+
+def decode_sleep_get_columnar(body: Dict[str, Any]) -> ColumnarSleepGetResponse:
+    """Decode the body of a sleep get response into columnar series."""
+    return ColumnarSleepGetResponse(
+        model=to_enum(SleepModel, body["model"], SleepModel.UNKNOWN),
+        series=tuple(
+            [
+                ColumnarSleepGetSerie(
+                    enddate=to_arrow(serie["enddate"]),
+                    startdate=to_arrow(serie["startdate"]),
+                    state=to_enum(SleepState, serie["state"], SleepState.UNKNOWN),
+                    hr=TimestampValueSeries.from_dict(serie.get("hr")),
+                    rr=TimestampValueSeries.from_dict(serie.get("rr")),
+                    snoring=TimestampValueSeries.from_dict(serie.get("snoring")),
+                    sdnn_1=TimestampValueSeries.from_dict(serie.get("sdnn_1")),
+                    rmssd=TimestampValueSeries.from_dict(serie.get("rmssd")),
+                )
+                for serie in body["series"]
+            ]
+        ),
+    )
@@ -1,9 +1,24 @@
 """Common classes and functions."""
+from array import array
 from dataclasses import dataclass
-from datetime import tzinfo
+from datetime import datetime, timedelta, timezone as dt_timezone, tzinfo
 from enum import Enum, IntEnum
 import logging
-from typing import Any, Dict, Optional, Tuple, Type, TypeVar, Union, cast
+from typing import (
+    Any,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+    cast,
+    overload,
+)
 
 import arrow
 from arrow import Arrow
@@ -24,6 +39,11 @@ from .const import (
     STATUS_UNAUTHORIZED,
 )
 
+try:
+    import zoneinfo
+except ImportError:  # pragma: no cover
+    zoneinfo = None  # type: ignore
+
 _LOGGER = logging.getLogger(LOG_NAMESPACE)
 _GenericType = TypeVar("_GenericType")
 
@@ -55,6 +75,59 @@ class ConfiguredBaseModel(BaseModel):
         allow_mutation: Final = False
 
 
+TIMEZONE_BACKENDS: Final = ("dateutil", "zoneinfo")
+# Every timezone name is resolved once, the same tzinfo is then shared by
+# all the objects of the process using it.
+_timezones: Final[Dict[str, tzinfo]] = {}
+_timezone_backend = "dateutil"
+
+
+def set_timezone_backend(backend: str) -> None:
+    """Resolve timezone names with dateutil, the default, or stdlib zoneinfo."""
+    global _timezone_backend  # pylint: disable=global-statement
+    if backend not in TIMEZONE_BACKENDS:
+        raise ValueError("Unknown timezone backend %s" % backend)
+    if backend == "zoneinfo" and zoneinfo is None:  # pragma: no cover
+        raise ValueError("zoneinfo is not available, it needs python 3.9")
+
+    _timezone_backend = backend
+    _timezones.clear()
+
+
+def _resolve_timezone(name: str) -> Optional[tzinfo]:
+    if _timezone_backend == "dateutil":
+        return cast(Optional[tzinfo], tz.gettz(name))
+
+    try:
+        return zoneinfo.ZoneInfo(name)
+    except (ValueError, zoneinfo.ZoneInfoNotFoundError):
+        return None
+
+
+def get_timezone(name: str) -> tzinfo:
+    """Get the shared tzinfo of a timezone name."""
+    timezone = _timezones.get(name)
+    if timezone is None:
+        resolved: Final = _resolve_timezone(name)
+        if resolved is None:
+            raise ValueError(f"Invalid timezone provided {name}")
+        timezone = _timezones.setdefault(name, resolved)
+
+    return timezone
+
+
+def timezone_name(value: tzinfo) -> str:
+    """Get the name of a tzinfo, the one get_timezone resolved it from."""
+    for name, timezone in _timezones.items():
+        if timezone is value:
+            return name
+
+    key: Final = getattr(value, "key", None)
+    if key is None:
+        raise ValueError("Unnamed timezone %s" % value)
+    return cast(str, key)
+
+
 class TimeZone(tzlocal):
     """Subclass of tzinfo for parsing timezones."""
 
@@ -71,14 +144,55 @@ class TimeZone(tzlocal):
         if isinstance(value, tzinfo):
             return value
         if isinstance(value, str):
-            timezone: Final = tz.gettz(value)
-            if timezone:
-                return timezone
-            raise ValueError(f"Invalid timezone provided {value}")
+            return get_timezone(value)
 
         raise TypeError("string or tzinfo required")
 
 
+# Epoch seconds are converted by hand, arrow.get would parse them the same
+# way but much slower. Converted timestamps are kept, they are immutable and
+# the same ones come back in every time serie of a night.
+TIMESTAMP_CACHE_SIZE: Final = 65536
+_UTC: Final = dt_timezone.utc
+_EPOCH: Final = datetime(1970, 1, 1, tzinfo=_UTC)
+_timestamps: Final[Dict[int, Arrow]] = {}
+_conversions: Final[Dict[Tuple[Arrow, int], Arrow]] = {}
+
+
+def arrow_from_timestamp(value: int) -> Arrow:
+    """Convert epoch seconds to a UTC Arrow."""
+    cached = _timestamps.get(value)
+    if cached is None:
+        if len(_timestamps) >= TIMESTAMP_CACHE_SIZE:
+            _timestamps.clear()
+        date: Final = _EPOCH + timedelta(seconds=value)
+        cached = _timestamps[value] = Arrow(
+            date.year,
+            date.month,
+            date.day,
+            date.hour,
+            date.minute,
+            date.second,
+            tzinfo=_UTC,
+        )
+
+    return cached
+
+
+def to_timezone(value: Arrow, timezone: tzinfo) -> Arrow:
+    """Convert an Arrow to a timezone, reusing recent conversions."""
+    # The converted Arrow holds the timezone, so its id stays unique while
+    # the conversion is cached.
+    key: Final = (value, id(timezone))
+    cached = _conversions.get(key)
+    if cached is None:
+        if len(_conversions) >= TIMESTAMP_CACHE_SIZE:
+            _conversions.clear()
+        cached = _conversions[key] = value.to(timezone)
+
+    return cached
+
+
 class ArrowType(Arrow):
     """Subclass of Arrow for parsing dates."""
 
@@ -94,10 +208,10 @@ class ArrowType(Arrow):
         """Convert input to the desired object."""
         if isinstance(value, str):
             if value.isdigit():
-                return arrow.get(int(value))
+                return arrow_from_timestamp(int(value))
             return arrow.get(value)
         if isinstance(value, int):
-            return arrow.get(value)
+            return arrow_from_timestamp(value)
         if isinstance(value, (Arrow, ArrowType)):
             return value
 
@@ -398,26 +512,26 @@ class GetSleepSummarySerie(ConfiguredBaseModel):
     def _set_timezone_on_startdate(
         cls, value: ArrowType, values: Dict[str, Any]
     ) -> Arrow:
-        return cast(Arrow, value.to(values["timezone"]))
+        return to_timezone(value, values["timezone"])
 
     @validator("enddate")
     @classmethod
     def _set_timezone_on_enddate(
         cls, value: ArrowType, values: Dict[str, Any]
     ) -> Arrow:
-        return cast(Arrow, value.to(values["timezone"]))
+        return to_timezone(value, values["timezone"])
 
     @validator("date")
     @classmethod
     def _set_timezone_on_date(cls, value: ArrowType, values: Dict[str, Any]) -> Arrow:
-        return cast(Arrow, value.to(values["timezone"]))
+        return to_timezone(value, values["timezone"])
 
     @validator("modified")
     @classmethod
     def _set_timezone_on_modified(
         cls, value: ArrowType, values: Dict[str, Any]
     ) -> Arrow:
-        return cast(Arrow, value.to(values["timezone"]))
+        return to_timezone(value, values["timezone"])
 
     @validator("model", pre=True)
     @classmethod
@@ -486,7 +600,7 @@ class MeasureGetMeasResponse(ConfiguredBaseModel):
     def _set_timezone_on_updatetime(
         cls, value: ArrowType, values: Dict[str, Any]
     ) -> Arrow:
-        return cast(Arrow, value.to(values["timezone"]))
+        return to_timezone(value, values["timezone"])
 
 
 class MeasureGetActivityActivity(
@@ -515,6 +629,7 @@ class MeasureGetActivityActivity(
     hr_zone_1: Optional[int]
     hr_zone_2: Optional[int]
     hr_zone_3: Optional[int]
+    modified: Optional[ArrowType]
 
 
 class MeasureGetActivityResponse(ConfiguredBaseModel):
@@ -555,18 +670,134 @@ class HeartWearPosition(IntEnum):
     LEFT_FOOT = 5
 
 
+# Signed 16 bit samples, 32 bit for the rare signal that doesn't fit.
+ECG_TYPECODES: Final = ("h", "i")
+
+
+def _to_samples(values: Iterable[int]) -> array:
+    try:
+        return array(ECG_TYPECODES[0], values)
+    except OverflowError:
+        pass
+
+    try:
+        return array(ECG_TYPECODES[1], values)
+    except OverflowError as error:
+        raise ValueError("ECG sample out of the 32 bit range: %s" % error) from error
+
+
+class EcgSignal(Sequence[int]):
+    """
+    ECG samples in micro volts, held in one contiguous array.
+
+    The array is built straight from the json list, without validating each
+    sample. Slices share the array instead of copying it. samples exposes it
+    through the buffer protocol, numpy.asarray(signal.samples) wraps it
+    without a copy.
+    """
+
+    __slots__ = ("samples",)
+
+    def __init__(self, values: Union[array, memoryview, Iterable[int]] = ()):
+        """Initialize new object."""
+        if isinstance(values, memoryview) and values.format in ECG_TYPECODES:
+            samples = values
+        elif isinstance(values, array) and values.typecode in ECG_TYPECODES:
+            samples = memoryview(values)
+        else:
+            samples = memoryview(_to_samples(values))
+        self.samples: Final = samples
+
+    @classmethod
+    def __get_validators__(cls) -> Any:
+        yield cls.validate
+
+    @classmethod
+    def validate(cls, value: Any) -> "EcgSignal":
+        """Convert input to the desired object."""
+        if isinstance(value, EcgSignal):
+            return value
+        if isinstance(value, (list, tuple, array, memoryview)):
+            return cls(value)
+
+        raise TypeError("list of ints or EcgSignal required")
+
+    @classmethod
+    def __modify_schema__(cls, field_schema: Dict[str, Any]) -> None:
+        field_schema.update(type="array", items={"type": "integer"})
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    @overload
+    def __getitem__(self, index: int) -> int:
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> "EcgSignal":
+        ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[int, "EcgSignal"]:
+        if isinstance(index, slice):
+            return EcgSignal(self.samples[index])
+        return cast(int, self.samples[index])
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.samples)
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, EcgSignal):
+            return self.samples == other.samples
+        if isinstance(other, (list, tuple)):
+            return cast(bool, self.samples.tolist() == list(other))
+        return NotImplemented
+
+    __hash__ = None  # type: ignore
+
+    def __repr__(self) -> str:
+        return "EcgSignal(%s)" % self.samples.tolist()
+
+    def __reduce__(self) -> Any:
+        return EcgSignal, (array(self.samples.format, self.samples.tobytes()),)
+
+    def duration(self, sampling_frequency: int) -> float:
+        """Get the length of the signal in seconds."""
+        return len(self.samples) / sampling_frequency
+
+    def timestamps(self, sampling_frequency: int, start: float = 0.0) -> array:
+        """Get the time of every sample in seconds, from the start of the signal."""
+        return array(
+            "d",
+            (start + index / sampling_frequency for index in range(len(self.samples))),
+        )
+
+
 class HeartGetResponse(ConfiguredBaseModel):
     """HeartGetResponse."""
 
-    signal: Tuple[int, ...]
+    signal: EcgSignal
     sampling_frequency: int
     wearposition: HeartWearPosition
 
+    class Config:
+        """Config for pydantic model."""
+
+        json_encoders: Final = {EcgSignal: lambda signal: signal.samples.tolist()}
+
     @validator("wearposition", pre=True)
     @classmethod
     def _wearposition_to_enum(cls, value: Any) -> HeartWearPosition:
         return to_enum(HeartWearPosition, value, HeartWearPosition.UNKNOWN)
 
+    @property
+    def duration(self) -> float:
+        """Get the length of the signal in seconds."""
+        return self.signal.duration(self.sampling_frequency)
+
+    def timestamps(self, start: float = 0.0) -> array:
+        """Get the time of every sample in seconds, from start."""
+        return self.signal.timestamps(self.sampling_frequency, start)
+
 
 class HeartListECG(ConfiguredBaseModel):
     """HeartListECG."""
@@ -666,6 +897,50 @@ def maybe_upgrade_credentials(value: CredentialsType) -> Credentials2:
     )
 
 
+def refreshed_credentials(
+    credentials: Credentials2, token: Dict[str, Any]
+) -> Credentials2:
+    """Get the credentials of a refreshed oauth token."""
+    return Credentials2(
+        access_token=token["access_token"],
+        expires_in=token["expires_in"],
+        token_type=credentials.token_type,
+        refresh_token=token["refresh_token"],
+        userid=credentials.userid,
+        client_id=credentials.client_id,
+        consumer_secret=credentials.consumer_secret,
+    )
+
+
+def adjust_withings_token_body(token: Dict[str, Any]) -> Dict[str, Any]:
+    """Move the body of a withings token response to the root level."""
+    status = token.pop("status", 0)
+    if status:
+        # Set the error to the status
+        token["error"] = 0
+    body = token.pop("body", None)
+    if body:
+        # Put body content at root level
+        token.update(body)
+
+    return token
+
+
+ResponseType = TypeVar("ResponseType")
+PageType = TypeVar(
+    "PageType",
+    HeartListResponse,
+    MeasureGetActivityResponse,
+    MeasureGetMeasResponse,
+    SleepGetSummaryResponse,
+)
+
+
+def as_body(body: Dict[str, Any]) -> Dict[str, Any]:
+    """Parse a response body as is."""
+    return body
+
+
 class NotifyListProfile(ConfiguredBaseModel):
     """NotifyListProfile."""
 
@@ -733,6 +1008,24 @@ class MeasureTypes:
     ANY: Final = tuple(enum_val for enum_val in MeasureType)
 
 
+def _measure_groups_of(
+    from_source: Union[
+        MeasureGetMeasGroup, MeasureGetMeasResponse, Tuple[MeasureGetMeasGroup, ...]
+    ],
+) -> Tuple[MeasureGetMeasGroup, ...]:
+    if isinstance(from_source, MeasureGetMeasResponse):
+        return cast(MeasureGetMeasResponse, from_source).measuregrps
+    if isinstance(from_source, MeasureGetMeasGroup):
+        return (cast(MeasureGetMeasGroup, from_source),)
+    return cast(Tuple[MeasureGetMeasGroup], from_source)
+
+
+def _enum_set(value: Any, enum_type: Type[Enum]) -> FrozenSet:
+    if isinstance(value, enum_type):
+        return frozenset((value,))
+    return frozenset(value)
+
+
 def query_measure_groups(
     from_source: Union[
         MeasureGetMeasGroup, MeasureGetMeasResponse, Tuple[MeasureGetMeasGroup, ...]
@@ -743,22 +1036,8 @@ def query_measure_groups(
     ] = MeasureGroupAttribs.ANY,
 ) -> Tuple[MeasureGetMeasGroup, ...]:
     """Return a groups and measurements based on filters."""
-    if isinstance(from_source, MeasureGetMeasResponse):
-        iter_groups = cast(MeasureGetMeasResponse, from_source).measuregrps
-    elif isinstance(from_source, MeasureGetMeasGroup):
-        iter_groups = (cast(MeasureGetMeasGroup, from_source),)
-    else:
-        iter_groups = cast(Tuple[MeasureGetMeasGroup], from_source)
-
-    if isinstance(with_measure_type, MeasureType):
-        iter_measure_type = (cast(MeasureType, with_measure_type),)
-    else:
-        iter_measure_type = cast(Tuple[MeasureType], with_measure_type)
-
-    if isinstance(with_group_attrib, MeasureGetMeasGroupAttrib):
-        iter_group_attrib = (cast(MeasureGetMeasGroupAttrib, with_group_attrib),)
-    else:
-        iter_group_attrib = cast(Tuple[MeasureGetMeasGroupAttrib], with_group_attrib)
+    measure_types: Final = _enum_set(with_measure_type, MeasureType)
+    group_attribs: Final = _enum_set(with_group_attrib, MeasureGetMeasGroupAttrib)
 
     return tuple(
         MeasureGetMeasGroup(
@@ -769,13 +1048,11 @@ def query_measure_groups(
             deviceid=group.deviceid,
             grpid=group.grpid,
             measures=tuple(
-                measure
-                for measure in group.measures
-                if measure.type in iter_measure_type
+                measure for measure in group.measures if measure.type in measure_types
             ),
         )
-        for group in iter_groups
-        if group.attrib in iter_group_attrib
+        for group in _measure_groups_of(from_source)
+        if group.attrib in group_attribs
     )
 
 
@@ -789,28 +1066,42 @@ def get_measure_value(
     ] = MeasureGroupAttribs.ANY,
 ) -> Optional[float]:
     """Get the first value of a measure that meet the query requirements."""
-    groups: Final = query_measure_groups(
-        from_source, with_measure_type, with_group_attrib
-    )
+    measure_types: Final = _enum_set(with_measure_type, MeasureType)
+    group_attribs: Final = _enum_set(with_group_attrib, MeasureGetMeasGroupAttrib)
 
     return next(
-        iter(
-            tuple(
-                float(measure.value * pow(10, measure.unit))
-                for group in groups
-                for measure in group.measures
-            )
+        (
+            float(measure.value * pow(10, measure.unit))
+            for group in _measure_groups_of(from_source)
+            if group.attrib in group_attribs
+            for measure in group.measures
+            if measure.type in measure_types
         ),
         None,
     )
 
 
 class StatusException(Exception):
-    """Status exception."""
+    """
+    Status exception.
+
+    Carries the status, and the path and params of the call when known.
+    retryable tells whether the same call may succeed later.
+    """
+
+    retryable: bool = False
 
-    def __init__(self, status: Any):
+    def __init__(
+        self,
+        status: Any,
+        path: Optional[str] = None,
+        params: Optional[Dict[str, Any]] = None,
+    ):
         """Create instance."""
         super().__init__("Error code %s" % str(status))
+        self.status: Final = status
+        self.path: Final = path
+        self.params: Final = params
 
 
 class AuthFailedException(StatusException):
@@ -828,10 +1119,14 @@ class UnauthorizedException(StatusException):
 class ErrorOccurredException(StatusException):
     """Withings status error code exception."""
 
+    retryable = True
+
 
 class TimeoutException(StatusException):
     """Withings status error code exception."""
 
+    retryable = True
+
 
 class BadStateException(StatusException):
     """Withings status error code exception."""
@@ -840,12 +1135,31 @@ class BadStateException(StatusException):
 class TooManyRequestsException(StatusException):
     """Withings status error code exception."""
 
+    retryable = True
+
 
 class UnknownStatusException(StatusException):
     """Unknown status code but it's still not successful."""
 
 
-def response_body_or_raise(data: Any) -> Dict[str, Any]:
+STATUS_EXCEPTIONS: Final[Dict[Any, Type[StatusException]]] = {
+    status: exception_type
+    for statuses, exception_type in (
+        (STATUS_AUTH_FAILED, AuthFailedException),
+        (STATUS_INVALID_PARAMS, InvalidParamsException),
+        (STATUS_UNAUTHORIZED, UnauthorizedException),
+        (STATUS_ERROR_OCCURRED, ErrorOccurredException),
+        (STATUS_TIMEOUT, TimeoutException),
+        (STATUS_BAD_STATE, BadStateException),
+        (STATUS_TOO_MANY_REQUESTS, TooManyRequestsException),
+    )
+    for status in statuses
+}
+
+
+def response_body_or_raise(
+    data: Any, path: Optional[str] = None, params: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
     """Parse withings response or raise exception."""
     if not isinstance(data, dict):
         raise UnexpectedTypeException(data, dict)
@@ -853,22 +1167,13 @@ def response_body_or_raise(data: Any) -> Dict[str, Any]:
     parsed_response: Final = cast(dict, data)
     status: Final = parsed_response.get("status")
 
-    if status is None:
-        raise UnknownStatusException(status=status)
     if status in STATUS_SUCCESS:
         return cast(Dict[str, Any], parsed_response.get("body"))
-    if status in STATUS_AUTH_FAILED:
-        raise AuthFailedException(status=status)
-    if status in STATUS_INVALID_PARAMS:
-        raise InvalidParamsException(status=status)
-    if status in STATUS_UNAUTHORIZED:
-        raise UnauthorizedException(status=status)
-    if status in STATUS_ERROR_OCCURRED:
-        raise ErrorOccurredException(status=status)
-    if status in STATUS_TIMEOUT:
-        raise TimeoutException(status=status)
-    if status in STATUS_BAD_STATE:
-        raise BadStateException(status=status)
-    if status in STATUS_TOO_MANY_REQUESTS:
-        raise TooManyRequestsException(status=status)
-    raise UnknownStatusException(status=status)
+
+    try:
+        exception_type: Type[StatusException] = STATUS_EXCEPTIONS.get(
+            status, UnknownStatusException
+        )
+    except TypeError:
+        exception_type = UnknownStatusException
+    raise exception_type(status=status, path=path, params=params)
@@ -0,0 +1,217 @@
+"""
+Credential stores and coordinated token refresh.
+
+Withings invalidates a refresh token as soon as it is used. When several
+threads or WithingsApi instances refresh the same user at once, all but one
+end up with a dead token and fail with AuthFailedException. A
+RefreshCoordinator shared by those instances lets only one refresh per user
+run at a time, refreshes ahead of expiry, and keeps the newest credentials
+in a CredentialStore where the other instances pick them up.
+"""
+from abc import abstractmethod
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+
+import arrow
+from typing_extensions import Final
+
+from .common import Credentials2
+from .ratelimit import ClockType
+
+if TYPE_CHECKING:
+    from . import WithingsApi  # pragma: no cover
+
+
+def credentials_to_dict(credentials: Credentials2) -> Dict[str, Any]:
+    """Convert credentials to json compatible values."""
+    return {
+        "access_token": credentials.access_token,
+        "token_type": credentials.token_type,
+        "refresh_token": credentials.refresh_token,
+        "userid": credentials.userid,
+        "client_id": credentials.client_id,
+        "consumer_secret": credentials.consumer_secret,
+        "expires_in": credentials.expires_in,
+        "created": credentials.created.int_timestamp,
+    }
+
+
+def credentials_from_dict(value: Dict[str, Any]) -> Credentials2:
+    """Convert values from credentials_to_dict back to credentials."""
+    return Credentials2(**{**value, "created": arrow.get(value["created"])})
+
+
+class CredentialStore:
+    """
+    Keeps the latest credentials of each user.
+
+    put can be passed as the refresh_cb of WithingsApi.
+    """
+
+    @abstractmethod
+    def get(self, userid: int) -> Optional[Credentials2]:
+        """Get the credentials of a user, None if unknown."""
+
+    @abstractmethod
+    def put(self, credentials: Credentials2) -> None:
+        """Save credentials, replacing those of the same user."""
+
+
+class MemoryCredentialStore(CredentialStore):
+    """Keeps credentials in memory."""
+
+    def __init__(self) -> None:
+        """Initialize new object."""
+        self._lock: Final = threading.Lock()
+        self._credentials: Final[Dict[int, Credentials2]] = {}
+
+    def get(self, userid: int) -> Optional[Credentials2]:
+        """Get the credentials of a user, None if unknown."""
+        with self._lock:
+            return self._credentials.get(userid)
+
+    def put(self, credentials: Credentials2) -> None:
+        """Save credentials, replacing those of the same user."""
+        with self._lock:
+            self._credentials[credentials.userid] = credentials
+
+
+class FileCredentialStore(CredentialStore):
+    """
+    Keeps credentials as one json file per user in a directory.
+
+    Files are replaced atomically, so a reader never sees half written
+    credentials even from another process.
+    """
+
+    def __init__(self, directory: str):
+        """Initialize new object."""
+        self._directory: Final = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, userid: int) -> str:
+        return os.path.join(self._directory, "%s.json" % userid)
+
+    def get(self, userid: int) -> Optional[Credentials2]:
+        """Get the credentials of a user, None if unknown."""
+        try:
+            with open(self._path(userid), encoding="utf-8") as file_handle:
+                return credentials_from_dict(json.load(file_handle))
+        except FileNotFoundError:
+            return None
+
+    def put(self, credentials: Credentials2) -> None:
+        """Save credentials, replacing those of the same user."""
+        handle, temp_path = tempfile.mkstemp(dir=self._directory, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "w", encoding="utf-8") as file_handle:
+                json.dump(credentials_to_dict(credentials), file_handle)
+            os.replace(temp_path, self._path(credentials.userid))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+
+class SQLiteCredentialStore(CredentialStore):
+    """Keeps credentials in a SQLite database."""
+
+    def __init__(self, path: str):
+        """Initialize new object."""
+        self._lock: Final = threading.Lock()
+        self._connection: Final = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS credentials ("
+                "userid INTEGER PRIMARY KEY, data TEXT)"
+            )
+
+    def get(self, userid: int) -> Optional[Credentials2]:
+        """Get the credentials of a user, None if unknown."""
+        with self._lock:
+            row: Final = self._connection.execute(
+                "SELECT data FROM credentials WHERE userid = ?", (userid,)
+            ).fetchone()
+        return None if row is None else credentials_from_dict(json.loads(row[0]))
+
+    def put(self, credentials: Credentials2) -> None:
+        """Save credentials, replacing those of the same user."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO credentials VALUES (?, ?)",
+                (credentials.userid, json.dumps(credentials_to_dict(credentials))),
+            )
+
+    def close(self) -> None:
+        """Close the database."""
+        with self._lock:
+            self._connection.close()
+
+
+class RefreshCoordinator:
+    """
+    Single flight token refresh shared by WithingsApi instances.
+
+    Before each request, an api given this coordinator refreshes its token
+    when it expires within margin seconds. Only one refresh per user runs at
+    a time. Instances that waited on it, or that still hold older
+    credentials than the store, switch to the stored credentials instead of
+    refreshing again.
+
+    coordinator = RefreshCoordinator(SQLiteCredentialStore("tokens.db"))
+    api = WithingsApi(creds, refresh_coordinator=coordinator)
+    """
+
+    def __init__(
+        self,
+        store: Optional[CredentialStore] = None,
+        margin: float = 300.0,
+        clock: ClockType = time.time,
+    ):
+        """Initialize new object."""
+        self.store: Final = MemoryCredentialStore() if store is None else store
+        self._margin: Final = margin
+        self._clock: Final = clock
+        self._lock: Final = threading.Lock()
+        self._user_locks: Final[Dict[Tuple[str, int], threading.Lock]] = {}
+
+    def _user_lock(self, credentials: Credentials2) -> threading.Lock:
+        key: Final = (credentials.client_id, credentials.userid)
+        with self._lock:
+            if key not in self._user_locks:
+                self._user_locks[key] = threading.Lock()
+            return self._user_locks[key]
+
+    def needs_refresh(self, credentials: Credentials2) -> bool:
+        """Check if credentials expire within the margin."""
+        return credentials.token_expiry - self._margin <= self._clock()
+
+    def refresh(self, api: "WithingsApi", force: bool = False) -> None:
+        """Refresh the token of an api if needed, or always when forced."""
+        seen: Final = api.get_credentials()
+        if not force and not self.needs_refresh(seen):
+            return
+
+        with self._user_lock(seen):
+            current: Final = api.get_credentials()
+            if current.access_token != seen.access_token:
+                # Refreshed by another thread while this one waited.
+                return
+
+            stored: Final = self.store.get(current.userid)
+            if (
+                stored is not None
+                and stored.access_token != current.access_token
+                and stored.created >= current.created
+            ):
+                # Whoever stored them used up the current refresh token, only
+                # the stored one can still refresh.
+                api.use_credentials(stored)
+                if not self.needs_refresh(stored):
+                    return
+
+            api._refresh_token()  # pylint: disable=protected-access
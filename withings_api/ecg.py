@@ -0,0 +1,205 @@
+"""
+Analytics of ECG signals.
+
+R peaks are the local maxima of a signal above a threshold halfway between
+its median and its maximum, at least a refractory period apart. RR
+intervals, heart rate, SDNN and RMSSD follow from them. The array work is
+done by numpy when installed, by builtins over the whole signal otherwise:
+
+analyses = analyze_ecgs(
+    (serie, api.heart_get(serie.ecg.signalid)) for serie in api.iter_heart_series()
+)
+"""
+import math
+import statistics
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from typing_extensions import Final
+
+from .common import AfibClassification, EcgSignal, HeartGetResponse, HeartListSerie
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None  # type: ignore
+
+# No R peak follows another within this many seconds, 240 bpm at most.
+REFRACTORY_PERIOD: Final = 0.25
+THRESHOLD_RATIO: Final = 0.5
+
+
+class EcgAnalysis(NamedTuple):
+    """R peaks of a signal and the metrics derived from them, in milliseconds."""
+
+    afib: AfibClassification
+    peaks: Tuple[int, ...]
+    rr_intervals: Tuple[float, ...]
+    heart_rate: Optional[float]
+    sdnn: Optional[float]
+    rmssd: Optional[float]
+
+
+class _Backend(NamedTuple):
+    candidates: Callable[[EcgSignal, float], Tuple[List[int], List[int]]]
+    metrics: Callable[
+        [List[int], int], Tuple[Tuple[float, ...], Optional[float], Optional[float]]
+    ]
+
+
+def _python_candidates(signal: EcgSignal, ratio: float) -> Tuple[List[int], List[int]]:
+    values: Final = signal.samples.tolist()
+    if len(values) < 3:
+        return [], []
+
+    median: Final = statistics.median(values)
+    threshold: Final = median + ratio * (max(values) - median)
+    indexes: Final = [
+        index
+        for index, (before, value, after) in enumerate(
+            zip(values, values[1:], values[2:]), 1
+        )
+        if value >= threshold and before <= value > after
+    ]
+    return indexes, [values[index] for index in indexes]
+
+
+def _python_metrics(
+    peaks: List[int], sampling_frequency: int
+) -> Tuple[Tuple[float, ...], Optional[float], Optional[float]]:
+    rr_intervals: Final = tuple(
+        (end - start) * 1000 / sampling_frequency
+        for start, end in zip(peaks, peaks[1:])
+    )
+    if len(rr_intervals) < 2:
+        return rr_intervals, None, None
+
+    return (
+        rr_intervals,
+        statistics.stdev(rr_intervals),
+        math.sqrt(
+            sum(
+                (end - start) ** 2 for start, end in zip(rr_intervals, rr_intervals[1:])
+            )
+            / (len(rr_intervals) - 1)
+        ),
+    )
+
+
+def _numpy_candidates(signal: EcgSignal, ratio: float) -> Tuple[List[int], List[int]]:
+    values: Final = numpy.asarray(signal.samples)
+    if values.size < 3:
+        return [], []
+
+    median: Final = numpy.median(values)
+    threshold: Final = median + ratio * (values.max() - median)
+    middle: Final = values[1:-1]
+    indexes: Final = (
+        numpy.flatnonzero(
+            (middle >= threshold) & (middle >= values[:-2]) & (middle > values[2:])
+        )
+        + 1
+    )
+    return indexes.tolist(), values[indexes].tolist()
+
+
+def _numpy_metrics(
+    peaks: List[int], sampling_frequency: int
+) -> Tuple[Tuple[float, ...], Optional[float], Optional[float]]:
+    rr_intervals: Final = numpy.diff(peaks) * 1000 / sampling_frequency
+    if rr_intervals.size < 2:
+        return tuple(rr_intervals.tolist()), None, None
+
+    return (
+        tuple(rr_intervals.tolist()),
+        float(rr_intervals.std(ddof=1)),
+        float(numpy.sqrt(numpy.mean(numpy.diff(rr_intervals) ** 2))),
+    )
+
+
+ANALYSIS_BACKENDS: Final[Dict[str, _Backend]] = {
+    "python": _Backend(_python_candidates, _python_metrics)
+}
+if numpy is not None:  # pragma: no branch
+    ANALYSIS_BACKENDS["numpy"] = _Backend(_numpy_candidates, _numpy_metrics)
+
+_backend = ANALYSIS_BACKENDS.get("numpy", ANALYSIS_BACKENDS["python"])
+
+
+def set_analysis_backend(backend: str) -> None:
+    """Do the array work with numpy, the default when installed, or python."""
+    global _backend  # pylint: disable=global-statement
+    if backend not in ANALYSIS_BACKENDS:
+        raise ValueError(
+            "Unknown or unavailable analysis backend %s, available: %s"
+            % (backend, ", ".join(ANALYSIS_BACKENDS))
+        )
+
+    _backend = ANALYSIS_BACKENDS[backend]
+
+
+def _separate(indexes: List[int], heights: List[int], distance: int) -> List[int]:
+    """Keep the highest of the candidates closer than distance to each other."""
+    peaks: Final[List[int]] = []
+    peak_heights: Final[List[int]] = []
+    for index, height in zip(indexes, heights):
+        if peaks and index - peaks[-1] < distance:
+            if height > peak_heights[-1]:
+                peaks[-1] = index
+                peak_heights[-1] = height
+            continue
+
+        peaks.append(index)
+        peak_heights.append(height)
+
+    return peaks
+
+
+def detect_r_peaks(
+    signal: EcgSignal,
+    sampling_frequency: int,
+    threshold_ratio: float = THRESHOLD_RATIO,
+    refractory_period: float = REFRACTORY_PERIOD,
+) -> List[int]:
+    """Get the sample indexes of the R peaks of a signal."""
+    indexes, heights = _backend.candidates(signal, threshold_ratio)
+    return _separate(
+        indexes, heights, max(1, round(refractory_period * sampling_frequency))
+    )
+
+
+def analyze_ecg(
+    response: HeartGetResponse,
+    afib: AfibClassification = AfibClassification.UNKNOWN,
+    **kwargs: Any,
+) -> EcgAnalysis:
+    """
+    Analyze the signal of heart_get.
+
+    afib is the classification of the recording by heart_list, kwargs are
+    passed to detect_r_peaks. Heart rate needs two peaks, SDNN and RMSSD
+    three.
+    """
+    peaks: Final = detect_r_peaks(
+        response.signal, response.sampling_frequency, **kwargs
+    )
+    rr_intervals, sdnn, rmssd = _backend.metrics(peaks, response.sampling_frequency)
+    return EcgAnalysis(
+        afib=afib,
+        peaks=tuple(peaks),
+        rr_intervals=rr_intervals,
+        heart_rate=(
+            60000 * len(rr_intervals) / sum(rr_intervals) if rr_intervals else None
+        ),
+        sdnn=sdnn,
+        rmssd=rmssd,
+    )
+
+
+def analyze_ecgs(
+    recordings: Iterable[Tuple[HeartListSerie, HeartGetResponse]], **kwargs: Any
+) -> List[EcgAnalysis]:
+    """Analyze the signals of heart_list series, in order."""
+    return [
+        analyze_ecg(response, serie.ecg.afib, **kwargs)
+        for serie, response in recordings
+    ]
@@ -0,0 +1,198 @@
+"""
+Fast decoding of large responses without pydantic.
+
+The records here have the same field names and value types as the pydantic
+models in withings_api.common, but are plain NamedTuples built straight from
+the json body. Use them for large payloads where validating every nested
+object costs more than the request itself.
+"""
+from datetime import tzinfo
+from typing import Any, Dict, NamedTuple, Optional, Tuple, Union
+
+from arrow import Arrow
+from typing_extensions import Final
+
+from .common import (
+    ArrowType,
+    MeasureGetMeasGroupAttrib,
+    MeasureGetMeasGroupCategory,
+    MeasureType,
+    SleepModel,
+    SleepState,
+    TimeZone,
+    arrow_from_timestamp,
+    to_enum,
+    to_timezone,
+)
+
+
+class FastSleepGetTimestampValue(NamedTuple):
+    """Record counterpart of SleepGetTimestampValue."""
+
+    timestamp: Arrow
+    value: int
+
+
+class EpochSleepGetTimestampValue(NamedTuple):
+    """Record counterpart of SleepGetTimestampValue keeping epoch seconds."""
+
+    epoch: int
+    value: int
+
+    @property
+    def timestamp(self) -> Arrow:
+        """Get the timestamp, built when read."""
+        return arrow_from_timestamp(self.epoch)
+
+
+TimestampValueType = Union[FastSleepGetTimestampValue, EpochSleepGetTimestampValue]
+
+
+class FastSleepGetSerie(NamedTuple):
+    """Record counterpart of SleepGetSerie."""
+
+    enddate: Arrow
+    startdate: Arrow
+    state: SleepState
+    hr: Tuple[TimestampValueType, ...] = ()  # pylint: disable=invalid-name
+    rr: Tuple[TimestampValueType, ...] = ()  # pylint: disable=invalid-name
+    snoring: Tuple[TimestampValueType, ...] = ()
+    sdnn_1: Tuple[TimestampValueType, ...] = ()
+    rmssd: Tuple[TimestampValueType, ...] = ()
+
+
+class FastSleepGetResponse(NamedTuple):
+    """Record counterpart of SleepGetResponse."""
+
+    model: SleepModel
+    series: Tuple[FastSleepGetSerie, ...]
+
+
+class FastMeasureGetMeasMeasure(NamedTuple):
+    """Record counterpart of MeasureGetMeasMeasure."""
+
+    type: MeasureType
+    unit: int
+    value: int
+
+
+class FastMeasureGetMeasGroup(NamedTuple):
+    """Record counterpart of MeasureGetMeasGroup."""
+
+    attrib: MeasureGetMeasGroupAttrib
+    category: MeasureGetMeasGroupCategory
+    created: Arrow
+    date: Arrow
+    deviceid: Optional[str]
+    grpid: int
+    measures: Tuple[FastMeasureGetMeasMeasure, ...]
+
+
+class FastMeasureGetMeasResponse(NamedTuple):
+    """Record counterpart of MeasureGetMeasResponse."""
+
+    measuregrps: Tuple[FastMeasureGetMeasGroup, ...]
+    more: Optional[bool]
+    offset: Optional[int]
+    timezone: tzinfo
+    updatetime: Arrow
+
+
+def to_arrow(value: Any) -> Arrow:
+    """Convert an epoch or date to arrow, skipping the generic parser for epochs."""
+    if isinstance(value, int) or (isinstance(value, str) and value.isdigit()):
+        return arrow_from_timestamp(int(value))
+
+    return ArrowType.validate(value)
+
+
+def _timestamp_values(value: Any, lazy: bool) -> Tuple[TimestampValueType, ...]:
+    if not value:
+        return ()
+    if lazy:
+        return tuple(
+            [
+                EpochSleepGetTimestampValue(int(item_key), int(item_value))
+                for item_key, item_value in value.items()
+            ]
+        )
+
+    return tuple(
+        [
+            FastSleepGetTimestampValue(to_arrow(item_key), int(item_value))
+            for item_key, item_value in value.items()
+        ]
+    )
+
+
+def decode_sleep_get(
+    body: Dict[str, Any], lazy_timestamps: bool = False
+) -> FastSleepGetResponse:
+    """
+    Decode the body of a sleep get response.
+
+    With lazy_timestamps, the time series keep the epoch seconds of their
+    items and only build an Arrow when the timestamp of an item is read.
+    """
+    return FastSleepGetResponse(
+        model=to_enum(SleepModel, body["model"], SleepModel.UNKNOWN),
+        series=tuple(
+            [
+                FastSleepGetSerie(
+                    enddate=to_arrow(serie["enddate"]),
+                    startdate=to_arrow(serie["startdate"]),
+                    state=to_enum(SleepState, serie["state"], SleepState.UNKNOWN),
+                    hr=_timestamp_values(serie.get("hr"), lazy_timestamps),
+                    rr=_timestamp_values(serie.get("rr"), lazy_timestamps),
+                    snoring=_timestamp_values(serie.get("snoring"), lazy_timestamps),
+                    sdnn_1=_timestamp_values(serie.get("sdnn_1"), lazy_timestamps),
+                    rmssd=_timestamp_values(serie.get("rmssd"), lazy_timestamps),
+                )
+                for serie in body["series"]
+            ]
+        ),
+    )
+
+
+def _measure_group(group: Dict[str, Any]) -> FastMeasureGetMeasGroup:
+    return FastMeasureGetMeasGroup(
+        attrib=to_enum(
+            MeasureGetMeasGroupAttrib,
+            group["attrib"],
+            MeasureGetMeasGroupAttrib.UNKNOWN,
+        ),
+        category=to_enum(
+            MeasureGetMeasGroupCategory,
+            group["category"],
+            MeasureGetMeasGroupCategory.UNKNOWN,
+        ),
+        created=to_arrow(group["created"]),
+        date=to_arrow(group["date"]),
+        deviceid=group.get("deviceid"),
+        grpid=int(group["grpid"]),
+        measures=tuple(
+            [
+                FastMeasureGetMeasMeasure(
+                    type=to_enum(MeasureType, measure["type"], MeasureType.UNKNOWN),
+                    unit=int(measure["unit"]),
+                    value=int(measure["value"]),
+                )
+                for measure in group["measures"]
+            ]
+        ),
+    )
+
+
+def decode_measure_get_meas(body: Dict[str, Any]) -> FastMeasureGetMeasResponse:
+    """Decode the body of a measure getmeas response."""
+    timezone: Final = TimeZone.validate(body["timezone"])
+    more: Final = body.get("more")
+    offset: Final = body.get("offset")
+
+    return FastMeasureGetMeasResponse(
+        measuregrps=tuple([_measure_group(group) for group in body["measuregrps"]]),
+        more=None if more is None else bool(more),
+        offset=None if offset is None else int(offset),
+        timezone=timezone,
+        updatetime=to_timezone(to_arrow(body["updatetime"]), timezone),
+    )
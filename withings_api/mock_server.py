@@ -0,0 +1,648 @@
+"""
+Local stand-in for the Withings API.
+
+MockWithingsServer answers the OAuth2 token endpoint and the measure,
+v2/measure, v2/sleep, v2/heart, v2/user and notify services with
+deterministic synthetic data for users 1 to users. Paged services honour
+offset, more and lastupdate. Statuses can be injected and a rate limit
+enforced to exercise error handling, so syncs can be load tested without
+using any Withings quota. The server speaks plain http, so oauthlib has to
+be told to allow it with OAUTHLIB_INSECURE_TRANSPORT=1.
+
+server = MockWithingsServer(users=1000, days=90)
+server.start()
+api = server.api(userid=42)
+groups = list(api.iter_measure_groups(lastupdate=0))
+server.stop()
+"""
+from collections import Counter, deque
+import itertools
+import json
+import random
+from socketserver import ThreadingMixIn
+import threading
+import time
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Type,
+)
+from urllib.parse import parse_qsl
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+import arrow
+from typing_extensions import Final
+
+from . import WithingsApi, WithingsAuth
+from .common import Credentials2, HeartWearPosition, MeasureGetMeasGroupCategory
+from .ratelimit import ClockType
+from .synthetic import (
+    DAY,
+    START,
+    activity,
+    device,
+    heart_serie,
+    heart_signal,
+    measure_group,
+    sleep_serie,
+    sleep_summary_serie,
+)
+
+STATUS_AUTH_FAILED: Final = 401
+STATUS_INVALID_PARAMS: Final = 503
+STATUS_NOT_FOUND: Final = 343
+STATUS_TOO_MANY_REQUESTS: Final = 601
+ECG_SAMPLING_FREQUENCY: Final = 500
+
+ParamsType = Dict[str, str]
+# Date, modified time and json value of a generated item.
+ItemType = Tuple[int, int, Dict[str, Any]]
+
+
+class _Fault(NamedTuple):
+    status: int
+    path: Optional[str]
+    action: Optional[str]
+    userid: Optional[int]
+
+
+class _NotFoundError(Exception):
+    """No item matches the params."""
+
+
+# Status answered for the errors of a handler, the first matching type wins.
+_ERROR_STATUSES: Final[Dict[Type[Exception], int]] = {
+    _NotFoundError: STATUS_NOT_FOUND,
+    KeyError: STATUS_INVALID_PARAMS,
+    ValueError: STATUS_INVALID_PARAMS,
+}
+
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args: Any) -> None:
+        """Do not log requests."""
+
+
+class MockWithingsServer:  # pylint: disable=too-many-instance-attributes
+    """
+    Serves synthetic Withings data for many users.
+
+    Each of the days of data starting at start holds one to three measure
+    groups, an activity, a night of sleep and, every third day, an ECG
+    recording for every user. Data of the first days counts as modified at
+    the end of its day, add_days makes new days appear at the current time
+    so incremental syncs with lastupdate pick them up.
+
+    Tokens are issued to CLIENT_ID and CONSUMER_SECRET. A refresh token can
+    only be used once, like on Withings.
+    """
+
+    CLIENT_ID: Final = "mock_client_id"
+    CONSUMER_SECRET: Final = "mock_consumer_secret"
+
+    def __init__(
+        self,
+        users: int = 10,
+        days: int = 30,
+        seed: int = 0,
+        start: int = START,
+        page_size: int = 100,
+        token_lifetime: int = 10800,
+        rate_limit: Optional[int] = None,
+        ecg_samples: int = 15000,
+        clock: ClockType = time.time,
+    ):
+        """Initialize new object."""
+        self.users: Final = users
+        self._seed: Final = seed
+        self._start: Final = start
+        self._page_size: Final = page_size
+        self._token_lifetime: Final = token_lifetime
+        self._rate_limit: Final = rate_limit
+        self._ecg_samples: Final = ecg_samples
+        self._clock: Final = clock
+        self._lock: Final = threading.Lock()
+        self._appeared: Final = [start + (day + 1) * DAY for day in range(days)]
+        self._token_numbers: Final = itertools.count(1)
+        self._access_tokens: Final[Dict[str, Tuple[int, float]]] = {}
+        self._refresh_tokens: Final[Dict[str, int]] = {}
+        self._subscriptions: Final[Dict[int, Dict[Tuple[str, int], str]]] = {}
+        self._faults: Final[List[Tuple[_Fault, List[int]]]] = []
+        self._recent_calls: Final[Deque[float]] = deque()
+        self.calls: Final["Counter[Tuple[str, str]]"] = Counter()
+        self.url: Optional[str] = None
+        self._server: Optional[WSGIServer] = None
+        self._handlers: Final[
+            Dict[Tuple[str, str], Callable[[int, ParamsType], Dict[str, Any]]]
+        ] = {
+            ("measure", "getmeas"): self._measure_get_meas,
+            ("v2/measure", "getactivity"): self._measure_get_activity,
+            ("v2/sleep", "get"): self._sleep_get,
+            ("v2/sleep", "getsummary"): self._sleep_get_summary,
+            ("v2/heart", "list"): self._heart_list,
+            ("v2/heart", "get"): self._heart_get,
+            ("v2/user", "getdevice"): lambda userid, _: self._user_get_device(userid),
+            ("notify", "subscribe"): self._notify_subscribe,
+            ("notify", "get"): self._notify_get,
+            ("notify", "list"): self._notify_list,
+            ("notify", "revoke"): self._notify_revoke,
+            ("notify", "update"): self._notify_update,
+        }
+
+    @property
+    def days(self) -> int:
+        """Get the number of days of data."""
+        return len(self._appeared)
+
+    def add_days(self, count: int = 1) -> None:
+        """Add days of data, modified now."""
+        now: Final = int(self._clock())
+        with self._lock:
+            self._appeared.extend([now] * count)
+
+    def inject(
+        self,
+        status: int,
+        count: int = 1,
+        path: Optional[str] = None,
+        action: Optional[str] = None,
+        userid: Optional[int] = None,
+    ) -> None:
+        """Answer the next count matching calls with a status."""
+        with self._lock:
+            self._faults.append((_Fault(status, path, action, userid), [count]))
+
+    def authorization_code(self, userid: int) -> str:
+        """Get the code a user would be redirected with after authorizing."""
+        return "code-%s" % userid
+
+    def credentials(self, userid: int) -> Credentials2:
+        """Issue credentials to a user."""
+        token: Final = self._issue_token(userid)
+        return Credentials2(
+            access_token=token["access_token"],
+            expires_in=token["expires_in"],
+            token_type=token["token_type"],
+            refresh_token=token["refresh_token"],
+            userid=userid,
+            client_id=self.CLIENT_ID,
+            consumer_secret=self.CONSUMER_SECRET,
+        )
+
+    def api_type(self) -> Type[WithingsApi]:
+        """Get a WithingsApi class calling this server, once started."""
+        if self.url is None:
+            raise RuntimeError("The server is not started.")
+
+        return type("MockWithingsApi", (WithingsApi,), {"URL": self.url})
+
+    def api(self, userid: int, **kwargs: Any) -> WithingsApi:
+        """Create a WithingsApi for a user, calling this server once started."""
+        return self.api_type()(self.credentials(userid), **kwargs)
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Serve on a background thread and return the url, port 0 picks one."""
+        server: Final = make_server(
+            host,
+            port,
+            self.wsgi,
+            server_class=_ThreadingWSGIServer,
+            handler_class=_QuietHandler,
+        )
+        self._server = server
+        self.url = "http://%s:%s" % (host, server.server_port)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return self.url
+
+    def stop(self) -> None:
+        """Stop serving."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            self.url = None
+
+    def wsgi(
+        self,
+        environ: Dict[str, Any],
+        start_response: Callable[[str, List[Tuple[str, str]]], Any],
+    ) -> Iterable[bytes]:
+        """WSGI application serving the API."""
+        length: Final = int(environ.get("CONTENT_LENGTH") or 0)
+        body: Final = environ["wsgi.input"].read(length) if length else b""
+        params: Final = {
+            **dict(parse_qsl(environ.get("QUERY_STRING", ""))),
+            **dict(parse_qsl(body.decode("utf-8"))),
+        }
+        content: Final = json.dumps(
+            self.handle(environ.get("PATH_INFO", ""), params)
+        ).encode("utf-8")
+
+        start_response(
+            "200 OK",
+            [
+                ("Content-Type", "application/json"),
+                ("Content-Length", str(len(content))),
+            ],
+        )
+        return [content]
+
+    def handle(self, path: str, params: ParamsType) -> Dict[str, Any]:
+        """Answer a call like Withings does, with a status and a body."""
+        path = path.strip("/")
+        action: Final = params.get("action", "")
+        with self._lock:
+            self.calls[(path, action)] += 1
+
+        if path == WithingsAuth.PATH_V2_OAUTH2:
+            return self._fault(path, action, None) or self._oauth2(params)
+
+        handler: Final = self._handlers.get((path, action))
+        if handler is None:
+            return _status(STATUS_INVALID_PARAMS)
+
+        userid: Final = self._userid(params.get("access_token"))
+        if userid is None:
+            return _status(STATUS_AUTH_FAILED)
+
+        fault: Final = self._fault(path, action, userid) or self._throttle()
+        if fault:
+            return fault
+
+        try:
+            return {"status": 0, "body": handler(userid, params)}
+        except (_NotFoundError, KeyError, ValueError) as error:
+            return _status(
+                next(
+                    status
+                    for error_type, status in _ERROR_STATUSES.items()
+                    if isinstance(error, error_type)
+                )
+            )
+
+    def _fault(
+        self, path: str, action: str, userid: Optional[int]
+    ) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            for fault, remaining in self._faults:
+                if (
+                    remaining[0] > 0
+                    and fault.path in (None, path)
+                    and fault.action in (None, action)
+                    and fault.userid in (None, userid)
+                ):
+                    remaining[0] -= 1
+                    return _status(fault.status)
+
+        return None
+
+    def _throttle(self) -> Optional[Dict[str, Any]]:
+        if self._rate_limit is None:
+            return None
+
+        now: Final = self._clock()
+        with self._lock:
+            while self._recent_calls and self._recent_calls[0] <= now - 60:
+                self._recent_calls.popleft()
+            if len(self._recent_calls) >= self._rate_limit:
+                return _status(STATUS_TOO_MANY_REQUESTS)
+            self._recent_calls.append(now)
+
+        return None
+
+    def _issue_token(self, userid: int) -> Dict[str, Any]:
+        number: Final = next(self._token_numbers)
+        access_token: Final = "access-%s-%s" % (userid, number)
+        refresh_token: Final = "refresh-%s-%s" % (userid, number)
+        with self._lock:
+            self._access_tokens[access_token] = (
+                userid,
+                self._clock() + self._token_lifetime,
+            )
+            self._refresh_tokens[refresh_token] = userid
+
+        return {
+            "userid": userid,
+            "access_token": access_token,
+            "refresh_token": refresh_token,
+            "expires_in": self._token_lifetime,
+            "scope": "user.info,user.metrics,user.activity,user.sleepevents",
+            "token_type": "Bearer",
+        }
+
+    def _oauth2(self, params: ParamsType) -> Dict[str, Any]:
+        if (
+            params.get("action") != "requesttoken"
+            or params.get("client_id") != self.CLIENT_ID
+            or params.get("client_secret") != self.CONSUMER_SECRET
+        ):
+            return _status(STATUS_INVALID_PARAMS)
+
+        userid: Optional[int] = None
+        grant_type: Final = params.get("grant_type")
+        if grant_type == "refresh_token":
+            with self._lock:
+                userid = self._refresh_tokens.pop(params.get("refresh_token", ""), None)
+        elif grant_type == "authorization_code":
+            code: Final = params.get("code", "")
+            if code.startswith("code-") and code[5:].isdigit():
+                userid = int(code[5:])
+
+        if userid is None or not 1 <= userid <= self.users:
+            return _status(STATUS_AUTH_FAILED)
+
+        return {"status": 0, "body": self._issue_token(userid)}
+
+    def _userid(self, access_token: Optional[str]) -> Optional[int]:
+        with self._lock:
+            token: Final = self._access_tokens.get(access_token or "")
+        if token is None or token[1] <= self._clock():
+            return None
+
+        return token[0]
+
+    def _rng(self, userid: int, kind: str, day: int) -> random.Random:
+        return random.Random("%s:%s:%s:%s" % (self._seed, userid, kind, day))
+
+    def _date(self, day: int) -> int:
+        return self._start + day * DAY
+
+    def _select(
+        self,
+        items_of: Callable[[int, int], List[ItemType]],
+        userid: int,
+        params: ParamsType,
+        dates: Tuple[str, str],
+    ) -> List[Dict[str, Any]]:
+        """Get the items in the dates, or modified since lastupdate, by date."""
+        with self._lock:
+            days: Final = self.days
+
+        lastupdate: Final = (
+            int(params["lastupdate"]) if "lastupdate" in params else None
+        )
+        first = last = 0
+        selected_days = range(days)
+        if lastupdate is None:
+            first = _timestamp(params.get(dates[0], self._start))
+            last = _timestamp(params.get(dates[1], self._date(days)))
+            selected_days = range(
+                max(0, (first - self._start) // DAY - 1),
+                min(days, (last - self._start) // DAY + 1),
+            )
+
+        items: Final = [
+            item
+            for day in selected_days
+            for item in items_of(userid, day)
+            if (
+                item[1] >= lastupdate
+                if lastupdate is not None
+                else first <= item[0] <= last
+            )
+        ]
+        return [item[2] for item in sorted(items, key=lambda item: item[0])]
+
+    def _page(
+        self, items: List[Dict[str, Any]], params: ParamsType
+    ) -> Tuple[List[Dict[str, Any]], bool, int]:
+        """Get the page of items at offset, if there are more, and the next offset."""
+        offset: Final = int(params.get("offset", 0))
+        page: Final = items[offset : offset + self._page_size]
+        return page, offset + len(page) < len(items), offset + len(page)
+
+    def _measure_groups(self, userid: int, day: int) -> List[ItemType]:
+        rng: Final = self._rng(userid, "meas", day)
+        groups: Final = [
+            measure_group(
+                rng,
+                userid * 1000000 + day * 10 + index,
+                self._date(day) + rng.randrange(DAY),
+            )
+            for index in range(rng.randint(1, 3))
+        ]
+        return [
+            (group["date"], max(group["created"], self._appeared[day]), group)
+            for group in groups
+        ]
+
+    def _measure_get_meas(self, userid: int, params: ParamsType) -> Dict[str, Any]:
+        groups = self._select(
+            self._measure_groups, userid, params, ("startdate", "enddate")
+        )
+        if "category" in params and int(params["category"]) != (
+            MeasureGetMeasGroupCategory.REAL.real
+        ):
+            groups = []
+        if "meastype" in params:
+            meastype: Final = int(params["meastype"])
+            groups = [
+                {
+                    **group,
+                    "measures": [
+                        measure
+                        for measure in group["measures"]
+                        if measure["type"] == meastype
+                    ],
+                }
+                for group in groups
+                if any(measure["type"] == meastype for measure in group["measures"])
+            ]
+
+        page, more, offset = self._page(groups, params)
+        return {
+            "updatetime": int(self._clock()),
+            "timezone": "Europe/London",
+            "more": more,
+            "offset": offset,
+            "measuregrps": page,
+        }
+
+    def _activities(self, userid: int, day: int) -> List[ItemType]:
+        value: Final = activity(self._rng(userid, "activity", day), self._date(day))
+        value["modified"] = max(value["modified"], self._appeared[day])
+        return [(self._date(day), value["modified"], value)]
+
+    def _measure_get_activity(self, userid: int, params: ParamsType) -> Dict[str, Any]:
+        page, more, offset = self._page(
+            self._select(
+                self._activities, userid, params, ("startdateymd", "enddateymd")
+            ),
+            params,
+        )
+        return {"more": more, "offset": offset, "activities": page}
+
+    def _sleep_summaries(self, userid: int, day: int) -> List[ItemType]:
+        # The night of a day starts around 22:00.
+        serie: Final = sleep_summary_serie(
+            self._rng(userid, "sleep", day),
+            userid * 100000 + day,
+            self._date(day) + 22 * 3600,
+        )
+        serie["modified"] = max(serie["modified"], self._appeared[day])
+        return [(_timestamp(serie["date"]), serie["modified"], serie)]
+
+    def _sleep_get_summary(self, userid: int, params: ParamsType) -> Dict[str, Any]:
+        series = self._select(
+            self._sleep_summaries, userid, params, ("startdateymd", "enddateymd")
+        )
+        if "data_fields" in params:
+            fields: Final = params["data_fields"].split(",")
+            series = [
+                {
+                    **serie,
+                    "data": {
+                        field: value
+                        for field, value in serie["data"].items()
+                        if field in fields
+                    },
+                }
+                for serie in series
+            ]
+
+        page, more, offset = self._page(series, params)
+        return {"more": more, "offset": offset, "series": page}
+
+    def _sleep_get(self, userid: int, params: ParamsType) -> Dict[str, Any]:
+        startdate: Final = int(params["startdate"])
+        enddate: Final = int(params["enddate"])
+        fields: Final = params.get("data_fields", "").split(",")
+        series: Final = []
+        for day in range(
+            max(0, (startdate - self._start) // DAY - 1),
+            min(self.days, (enddate - self._start) // DAY + 1),
+        ):
+            night = self._sleep_summaries(userid, day)[0][2]
+            rng = self._rng(userid, "sleep get", day)
+            # A state every 30 minutes with a value per minute.
+            for state_start in range(night["startdate"], night["enddate"], 1800):
+                serie = sleep_serie(rng, state_start, 30)
+                if serie["enddate"] > startdate and state_start < enddate:
+                    series.append(
+                        {
+                            key: value
+                            for key, value in serie.items()
+                            if key in ("startdate", "enddate", "state") or key in fields
+                        }
+                    )
+
+        return {"model": 32, "series": series}
+
+    def _heart_series(self, userid: int, day: int) -> List[ItemType]:
+        if day % 3:
+            return []
+
+        rng: Final = self._rng(userid, "heart", day)
+        serie: Final = heart_serie(
+            rng, userid * 100000 + day, self._date(day) + rng.randrange(DAY)
+        )
+        return [(serie["timestamp"], self._appeared[day], serie)]
+
+    def _heart_list(self, userid: int, params: ParamsType) -> Dict[str, Any]:
+        page, more, offset = self._page(
+            self._select(self._heart_series, userid, params, ("startdate", "enddate")),
+            params,
+        )
+        return {"more": more, "offset": offset, "series": page}
+
+    def _heart_get(self, userid: int, params: ParamsType) -> Dict[str, Any]:
+        signalid: Final = int(params["signalid"])
+        day: Final = signalid - userid * 100000
+        if not 0 <= day < self.days or not self._heart_series(userid, day):
+            raise KeyError(signalid)
+
+        return {
+            "signal": heart_signal(
+                self._rng(userid, "ecg", day), self._ecg_samples, ECG_SAMPLING_FREQUENCY
+            ),
+            "sampling_frequency": ECG_SAMPLING_FREQUENCY,
+            "wearposition": HeartWearPosition.LEFT_WRIST.real,
+        }
+
+    def _user_get_device(self, userid: int) -> Dict[str, Any]:
+        rng: Final = self._rng(userid, "device", 0)
+        return {
+            "devices": [device(rng, index + 1) for index in range(rng.randint(1, 3))]
+        }
+
+    def _user_subscriptions(self, userid: int) -> Dict[Tuple[str, int], str]:
+        return self._subscriptions.setdefault(userid, {})
+
+    def _find_subscription(self, userid: int, params: ParamsType) -> Tuple[str, int]:
+        callbackurl: Final = params.get("callbackurl")
+        appli: Final = int(params["appli"]) if "appli" in params else None
+        for key in self._user_subscriptions(userid):
+            if callbackurl in (None, key[0]) and appli in (None, key[1]):
+                return key
+
+        raise _NotFoundError()
+
+    def _notify_subscribe(self, userid: int, params: ParamsType) -> Dict[str, Any]:
+        with self._lock:
+            self._user_subscriptions(userid)[
+                (params["callbackurl"], int(params["appli"]))
+            ] = params.get("comment", "")
+        return {}
+
+    def _notify_get(self, userid: int, params: ParamsType) -> Dict[str, Any]:
+        with self._lock:
+            key: Final = self._find_subscription(userid, params)
+            comment: Final = self._user_subscriptions(userid)[key]
+        return {"callbackurl": key[0], "appli": key[1], "comment": comment}
+
+    def _notify_list(self, userid: int, params: ParamsType) -> Dict[str, Any]:
+        appli: Final = int(params["appli"]) if "appli" in params else None
+        with self._lock:
+            subscriptions: Final = list(self._user_subscriptions(userid).items())
+        return {
+            "profiles": [
+                {
+                    "callbackurl": callbackurl,
+                    "appli": subscription_appli,
+                    "expires": 2147483647,
+                    "comment": comment,
+                }
+                for (callbackurl, subscription_appli), comment in subscriptions
+                if appli in (None, subscription_appli)
+            ]
+        }
+
+    def _notify_revoke(self, userid: int, params: ParamsType) -> Dict[str, Any]:
+        with self._lock:
+            del self._user_subscriptions(userid)[
+                self._find_subscription(userid, params)
+            ]
+        return {}
+
+    def _notify_update(self, userid: int, params: ParamsType) -> Dict[str, Any]:
+        with self._lock:
+            subscriptions: Final = self._user_subscriptions(userid)
+            key: Final = self._find_subscription(userid, params)
+            comment: Final = subscriptions.pop(key)
+            subscriptions[
+                (params["new_callbackurl"], int(params.get("new_appli", key[1])),)
+            ] = params.get("comment", comment)
+        return {}
+
+
+def _status(status: int) -> Dict[str, Any]:
+    return {"status": status, "error": "Mock status %s" % status}
+
+
+def _timestamp(value: Any) -> int:
+    """Convert an int or a digit or YYYY-MM-DD string to a timestamp."""
+    if isinstance(value, str) and not value.isdigit():
+        return int(arrow.get(value).int_timestamp)
+
+    return int(value)
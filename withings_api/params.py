@@ -0,0 +1,277 @@
+"""Request parameter builders shared by the sync and async apis."""
+import datetime
+from types import LambdaType
+from typing import Any, Dict, Iterable, Optional, Union
+
+import arrow
+from typing_extensions import Final
+
+from .common import (
+    GetActivityField,
+    GetSleepField,
+    GetSleepSummaryField,
+    MeasureGetMeasGroupCategory,
+    MeasureType,
+    NotifyAppli,
+)
+
+
+class _Now:
+    """Stands for the time a call is made."""
+
+    def __repr__(self) -> str:
+        return "NOW"
+
+
+# Default of the date params of the apis. Unlike arrow.utcnow() as a default,
+# it is read when the params are built, not when the module is imported.
+NOW: Final = _Now()
+
+DateType = Union[arrow.Arrow, datetime.date, datetime.datetime, int, str, _Now]
+ParamsType = Dict[str, Union[str, int, bool]]
+
+
+def resolve_date(value: Any) -> Any:
+    """Replace NOW with the current time, leave other values as they are."""
+    if value is NOW:
+        return arrow.utcnow()
+
+    return value
+
+
+def update_params(
+    params: ParamsType, name: str, current_value: Any, new_value: Any = None
+) -> None:
+    """Add a conditional param to a params dict."""
+    if current_value is None:
+        return
+
+    current_value = resolve_date(current_value)
+    if isinstance(new_value, LambdaType):
+        params[name] = new_value(current_value)
+    else:
+        params[name] = new_value or current_value
+
+
+def user_get_device_params() -> ParamsType:
+    """Build params for the user getdevice action."""
+    return {"action": "getdevice"}
+
+
+def measure_get_activity_params(
+    data_fields: Iterable[GetActivityField],
+    startdateymd: Optional[DateType],
+    enddateymd: Optional[DateType],
+    offset: Optional[int],
+    lastupdate: Optional[DateType],
+) -> ParamsType:
+    """Build params for the measure getactivity action."""
+    params: Final[ParamsType] = {}
+
+    update_params(
+        params,
+        "startdateymd",
+        startdateymd,
+        lambda val: arrow.get(val).format("YYYY-MM-DD"),
+    )
+    update_params(
+        params,
+        "enddateymd",
+        enddateymd,
+        lambda val: arrow.get(val).format("YYYY-MM-DD"),
+    )
+    update_params(params, "offset", offset)
+    update_params(
+        params,
+        "data_fields",
+        data_fields,
+        lambda fields: ",".join([field.value for field in fields]),
+    )
+    update_params(
+        params, "lastupdate", lastupdate, lambda val: arrow.get(val).int_timestamp
+    )
+    update_params(params, "action", "getactivity")
+
+    return params
+
+
+def measure_get_meas_params(
+    meastype: Optional[MeasureType],
+    category: Optional[MeasureGetMeasGroupCategory],
+    startdate: Optional[DateType],
+    enddate: Optional[DateType],
+    offset: Optional[int],
+    lastupdate: Optional[DateType],
+) -> ParamsType:
+    """Build params for the measure getmeas action."""
+    params: Final[ParamsType] = {}
+
+    update_params(params, "meastype", meastype, lambda val: val.value)
+    update_params(params, "category", category, lambda val: val.value)
+    update_params(
+        params, "startdate", startdate, lambda val: arrow.get(val).int_timestamp
+    )
+    update_params(params, "enddate", enddate, lambda val: arrow.get(val).int_timestamp)
+    update_params(params, "offset", offset)
+    update_params(
+        params, "lastupdate", lastupdate, lambda val: arrow.get(val).int_timestamp
+    )
+    update_params(params, "action", "getmeas")
+
+    return params
+
+
+def sleep_get_params(
+    data_fields: Iterable[GetSleepField],
+    startdate: Optional[DateType],
+    enddate: Optional[DateType],
+) -> ParamsType:
+    """Build params for the sleep get action."""
+    params: Final[ParamsType] = {}
+
+    update_params(
+        params, "startdate", startdate, lambda val: arrow.get(val).int_timestamp
+    )
+    update_params(params, "enddate", enddate, lambda val: arrow.get(val).int_timestamp)
+    update_params(
+        params,
+        "data_fields",
+        data_fields,
+        lambda fields: ",".join([field.value for field in fields]),
+    )
+    update_params(params, "action", "get")
+
+    return params
+
+
+def sleep_get_summary_params(
+    data_fields: Iterable[GetSleepSummaryField],
+    startdateymd: Optional[DateType],
+    enddateymd: Optional[DateType],
+    offset: Optional[int],
+    lastupdate: Optional[DateType],
+) -> ParamsType:
+    """Build params for the sleep getsummary action."""
+    params: Final[ParamsType] = {}
+
+    update_params(
+        params,
+        "startdateymd",
+        startdateymd,
+        lambda val: arrow.get(val).format("YYYY-MM-DD"),
+    )
+    update_params(
+        params,
+        "enddateymd",
+        enddateymd,
+        lambda val: arrow.get(val).format("YYYY-MM-DD"),
+    )
+    update_params(
+        params,
+        "data_fields",
+        data_fields,
+        lambda fields: ",".join([field.value for field in fields]),
+    )
+    update_params(params, "offset", offset)
+    update_params(
+        params, "lastupdate", lastupdate, lambda val: arrow.get(val).int_timestamp
+    )
+    update_params(params, "action", "getsummary")
+
+    return params
+
+
+def heart_get_params(signalid: int) -> ParamsType:
+    """Build params for the heart get action."""
+    params: Final[ParamsType] = {}
+
+    update_params(params, "signalid", signalid)
+    update_params(params, "action", "get")
+
+    return params
+
+
+def heart_list_params(
+    startdate: Optional[DateType], enddate: Optional[DateType], offset: Optional[int],
+) -> ParamsType:
+    """Build params for the heart list action."""
+    params: Final[ParamsType] = {}
+
+    update_params(
+        params, "startdate", startdate, lambda val: arrow.get(val).int_timestamp,
+    )
+    update_params(
+        params, "enddate", enddate, lambda val: arrow.get(val).int_timestamp,
+    )
+    update_params(params, "offset", offset)
+    update_params(params, "action", "list")
+
+    return params
+
+
+def notify_get_params(callbackurl: str, appli: Optional[NotifyAppli]) -> ParamsType:
+    """Build params for the notify get action."""
+    params: Final[ParamsType] = {}
+
+    update_params(params, "callbackurl", callbackurl)
+    update_params(params, "appli", appli, lambda appli: appli.value)
+    update_params(params, "action", "get")
+
+    return params
+
+
+def notify_list_params(appli: Optional[NotifyAppli]) -> ParamsType:
+    """Build params for the notify list action."""
+    params: Final[ParamsType] = {}
+
+    update_params(params, "appli", appli, lambda appli: appli.value)
+    update_params(params, "action", "list")
+
+    return params
+
+
+def notify_revoke_params(
+    callbackurl: Optional[str], appli: Optional[NotifyAppli]
+) -> ParamsType:
+    """Build params for the notify revoke action."""
+    params: Final[ParamsType] = {}
+
+    update_params(params, "callbackurl", callbackurl)
+    update_params(params, "appli", appli, lambda appli: appli.value)
+    update_params(params, "action", "revoke")
+
+    return params
+
+
+def notify_subscribe_params(
+    callbackurl: str, appli: Optional[NotifyAppli], comment: Optional[str]
+) -> ParamsType:
+    """Build params for the notify subscribe action."""
+    params: Final[ParamsType] = {}
+
+    update_params(params, "callbackurl", callbackurl)
+    update_params(params, "appli", appli, lambda appli: appli.value)
+    update_params(params, "comment", comment)
+    update_params(params, "action", "subscribe")
+
+    return params
+
+
+def notify_update_params(
+    callbackurl: str,
+    appli: NotifyAppli,
+    new_callbackurl: str,
+    new_appli: Optional[NotifyAppli],
+    comment: Optional[str],
+) -> ParamsType:
+    """Build params for the notify update action."""
+    params: Final[ParamsType] = {}
+
+    update_params(params, "callbackurl", callbackurl)
+    update_params(params, "appli", appli, lambda appli: appli.value)
+    update_params(params, "new_callbackurl", new_callbackurl)
+    update_params(params, "new_appli", new_appli, lambda new_appli: new_appli.value)
+    update_params(params, "comment", comment)
+    update_params(params, "action", "update")
+
+    return params
@@ -0,0 +1,108 @@
+"""Lazily built WithingsApi instances for many users."""
+from collections import OrderedDict
+import threading
+from typing import Optional
+
+from typing_extensions import Final
+
+from . import WithingsApi
+from .cache import ResponseCache
+from .credentials import CredentialStore, RefreshCoordinator
+from .ratelimit import RateLimiter
+from .transport import SharedTransport
+
+
+class WithingsClientPool:  # pylint: disable=too-many-instance-attributes
+    """
+    Registry of WithingsApi instances keyed by userid.
+
+    Credentials are loaded from the store and the api is built the first
+    time a user is asked for. At most maxsize instances are kept, the least
+    recently used ones are dropped and rebuilt from the store when needed
+    again. Refreshed credentials are written back to the store, by the
+    refresh coordinator when it keeps the same store, so a rebuilt instance
+    always starts from the latest token.
+
+    Every instance shares the given rate limiter, cache, transport and
+    refresh coordinator. Passing a transport avoids a connection pool per
+    user.
+
+    pool = WithingsClientPool(SQLiteCredentialStore("tokens.db"), maxsize=500)
+    pool.get(userid).measure_get_meas()
+    """
+
+    def __init__(
+        self,
+        store: CredentialStore,
+        maxsize: int = 1000,
+        rate_limiter: Optional[RateLimiter] = None,
+        cache: Optional[ResponseCache] = None,
+        transport: Optional[SharedTransport] = None,
+        refresh_coordinator: Optional[RefreshCoordinator] = None,
+    ):
+        """Initialize new object."""
+        self.store: Final = store
+        self._maxsize: Final = maxsize
+        self._refresh_cb: Final = (
+            None
+            if refresh_coordinator is not None and refresh_coordinator.store is store
+            else store.put
+        )
+        self._rate_limiter: Final = rate_limiter
+        self._cache: Final = cache
+        self._transport: Final = transport
+        self._refresh_coordinator: Final = refresh_coordinator
+        self._lock: Final = threading.Lock()
+        self._clients: Final["OrderedDict[int, WithingsApi]"] = OrderedDict()
+
+    def __len__(self) -> int:
+        """Get the number of instances currently built."""
+        return len(self._clients)
+
+    def __contains__(self, userid: object) -> bool:
+        """Check if the instance of a user is currently built."""
+        return userid in self._clients
+
+    def get(self, userid: int) -> WithingsApi:
+        """
+        Get or build the instance of a user.
+
+        Raises KeyError when the store has no credentials for the user.
+        """
+        with self._lock:
+            client = self._clients.get(userid)
+            if client is not None:
+                self._clients.move_to_end(userid)
+                return client
+
+        credentials: Final = self.store.get(userid)
+        if credentials is None:
+            raise KeyError(userid)
+
+        new_client: Final = WithingsApi(
+            credentials,
+            refresh_cb=self._refresh_cb,
+            rate_limiter=self._rate_limiter,
+            cache=self._cache,
+            transport=self._transport,
+            refresh_coordinator=self._refresh_coordinator,
+        )
+
+        with self._lock:
+            # Another thread may have built the same user meanwhile.
+            client = self._clients.setdefault(userid, new_client)
+            self._clients.move_to_end(userid)
+            while len(self._clients) > self._maxsize:
+                self._clients.popitem(last=False)
+
+            return client
+
+    def evict(self, userid: int) -> None:
+        """Drop the instance of a user, if built."""
+        with self._lock:
+            self._clients.pop(userid, None)
+
+    def clear(self) -> None:
+        """Drop every instance."""
+        with self._lock:
+            self._clients.clear()
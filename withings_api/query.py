@@ -0,0 +1,271 @@
+"""
+Indexed queries over measure groups.
+
+query_measure_groups and get_measure_value scan every group on every call.
+MeasureIndex scans a response once, then answers repeated queries from per
+type and per attrib indexes without copying or re-validating any group.
+"""
+from bisect import bisect_left, bisect_right
+from typing import (
+    Any,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+
+import arrow
+from arrow import Arrow
+from typing_extensions import Final
+
+from .common import (
+    MeasureGetMeasGroup,
+    MeasureGetMeasGroupAttrib,
+    MeasureGetMeasMeasure,
+    MeasureGetMeasResponse,
+    MeasureGroupAttribs,
+    MeasureType,
+    MeasureTypes,
+)
+from .fast import (
+    FastMeasureGetMeasGroup,
+    FastMeasureGetMeasMeasure,
+    FastMeasureGetMeasResponse,
+)
+from .params import DateType, resolve_date
+
+GroupType = Union[MeasureGetMeasGroup, FastMeasureGetMeasGroup]
+MeasureRecordType = Union[MeasureGetMeasMeasure, FastMeasureGetMeasMeasure]
+SourceType = Union[
+    MeasureGetMeasResponse, FastMeasureGetMeasResponse, GroupType, Iterable[GroupType]
+]
+MeasureTypeFilter = Union[MeasureType, Tuple[MeasureType, ...]]
+GroupAttribFilter = Union[
+    MeasureGetMeasGroupAttrib, Tuple[MeasureGetMeasGroupAttrib, ...]
+]
+
+_ALL_GROUP_ATTRIBS: Final = frozenset(MeasureGroupAttribs.ANY)
+
+
+class MeasureEntry(NamedTuple):
+    """A measure together with the group it belongs to."""
+
+    group: GroupType
+    measure: MeasureRecordType
+
+    @property
+    def type(self) -> MeasureType:
+        """Get the measure type."""
+        return self.measure.type
+
+    @property
+    def date(self) -> Arrow:
+        """Get the date of the group."""
+        return self.group.date
+
+    @property
+    def value(self) -> float:
+        """Get the measure value, scaled by its unit."""
+        return float(self.measure.value * pow(10, self.measure.unit))
+
+
+class _TypeIndex:
+    """Entries of one measure type, in source and in date order."""
+
+    def __init__(self) -> None:
+        self.entries: List[MeasureEntry] = []
+        self.by_date: List[MeasureEntry] = []
+        self.timestamps: List[int] = []
+
+    def sort(self) -> None:
+        """Build the date order of the entries, once they are all added."""
+        self.by_date = sorted(self.entries, key=lambda entry: entry.date)
+        self.timestamps = [entry.date.int_timestamp for entry in self.by_date]
+
+
+def _filter_set(value: Any) -> FrozenSet:
+    if isinstance(value, (MeasureType, MeasureGetMeasGroupAttrib)):
+        return frozenset((value,))
+    return frozenset(value)
+
+
+def _groups_of(source: SourceType) -> Tuple[GroupType, ...]:
+    if isinstance(source, (MeasureGetMeasResponse, FastMeasureGetMeasResponse)):
+        return tuple(source.measuregrps)
+    if isinstance(source, (MeasureGetMeasGroup, FastMeasureGetMeasGroup)):
+        return (source,)
+    return tuple(source)
+
+
+class MeasureIndex:
+    """
+    Measures of a getmeas response, indexed by type and group attrib.
+
+    Works with both MeasureGetMeasResponse and the records of
+    measure_get_meas_fast. Filters take the same values as
+    query_measure_groups.
+
+    index = MeasureIndex(api.measure_get_meas())
+    weight = index.value(MeasureType.WEIGHT)
+    latest_fat = index.latest(MeasureType.FAT_RATIO)
+    last_week = index.between(MeasureType.WEIGHT, arrow.utcnow().shift(days=-7))
+    """
+
+    def __init__(self, source: SourceType):
+        """Initialize new object."""
+        self._groups: Final = _groups_of(source)
+        self._by_attrib: Final[Dict[MeasureGetMeasGroupAttrib, List[GroupType]]] = {}
+        self._by_type: Final[Dict[MeasureType, _TypeIndex]] = {}
+
+        for group in self._groups:
+            self._by_attrib.setdefault(group.attrib, []).append(group)
+            for measure in group.measures:
+                self._by_type.setdefault(measure.type, _TypeIndex()).entries.append(
+                    MeasureEntry(group, measure)
+                )
+
+        for type_index in self._by_type.values():
+            type_index.sort()
+
+    def __len__(self) -> int:
+        """Get the number of groups."""
+        return len(self._groups)
+
+    @property
+    def measure_types(self) -> FrozenSet[MeasureType]:
+        """Get the measure types found in the groups."""
+        return frozenset(self._by_type)
+
+    def groups(
+        self,
+        with_measure_type: MeasureTypeFilter = MeasureTypes.ANY,
+        with_group_attrib: GroupAttribFilter = MeasureGroupAttribs.ANY,
+    ) -> Iterator[GroupType]:
+        """
+        Iterate over the groups matching the filters, in source order.
+
+        Unlike query_measure_groups, groups are returned as they are, with
+        all their measures, and only if they hold a measure of a wanted type.
+        """
+        measure_types: Final = _filter_set(with_measure_type)
+        group_attribs: Final = _filter_set(with_group_attrib)
+
+        if group_attribs == _ALL_GROUP_ATTRIBS:
+            groups: Iterable[GroupType] = self._groups
+        elif len(group_attribs) == 1:
+            groups = self._by_attrib.get(next(iter(group_attribs)), ())
+        else:
+            groups = (group for group in self._groups if group.attrib in group_attribs)
+
+        return (
+            group
+            for group in groups
+            if any(measure.type in measure_types for measure in group.measures)
+        )
+
+    def entries(
+        self,
+        with_measure_type: MeasureTypeFilter = MeasureTypes.ANY,
+        with_group_attrib: GroupAttribFilter = MeasureGroupAttribs.ANY,
+    ) -> Iterator[MeasureEntry]:
+        """Iterate over the measures matching the filters, in source order."""
+        if isinstance(with_measure_type, MeasureType):
+            return self._entries(
+                self._type_entries(with_measure_type), with_group_attrib
+            )
+
+        measure_types: Final = _filter_set(with_measure_type)
+        return self._entries(
+            (
+                MeasureEntry(group, measure)
+                for group in self._groups
+                for measure in group.measures
+                if measure.type in measure_types
+            ),
+            with_group_attrib,
+        )
+
+    def first(
+        self,
+        with_measure_type: MeasureType,
+        with_group_attrib: GroupAttribFilter = MeasureGroupAttribs.ANY,
+    ) -> Optional[MeasureEntry]:
+        """Get the earliest measure of a type."""
+        return next(
+            self._entries(self._dated_entries(with_measure_type), with_group_attrib),
+            None,
+        )
+
+    def latest(
+        self,
+        with_measure_type: MeasureType,
+        with_group_attrib: GroupAttribFilter = MeasureGroupAttribs.ANY,
+    ) -> Optional[MeasureEntry]:
+        """Get the most recent measure of a type."""
+        return next(
+            self._entries(
+                reversed(self._dated_entries(with_measure_type)), with_group_attrib
+            ),
+            None,
+        )
+
+    def between(
+        self,
+        with_measure_type: MeasureType,
+        startdate: Optional[DateType] = None,
+        enddate: Optional[DateType] = None,
+        with_group_attrib: GroupAttribFilter = MeasureGroupAttribs.ANY,
+    ) -> Tuple[MeasureEntry, ...]:
+        """Get the measures of a type dated from startdate to enddate, inclusive."""
+        type_index: Final = self._by_type.get(with_measure_type)
+        if type_index is None:
+            return ()
+
+        start: Final = (
+            0
+            if startdate is None
+            else bisect_left(
+                type_index.timestamps, arrow.get(resolve_date(startdate)).int_timestamp
+            )
+        )
+        end: Final = (
+            len(type_index.timestamps)
+            if enddate is None
+            else bisect_right(
+                type_index.timestamps, arrow.get(resolve_date(enddate)).int_timestamp
+            )
+        )
+
+        return tuple(self._entries(type_index.by_date[start:end], with_group_attrib))
+
+    def value(
+        self,
+        with_measure_type: MeasureTypeFilter,
+        with_group_attrib: GroupAttribFilter = MeasureGroupAttribs.ANY,
+    ) -> Optional[float]:
+        """Get the first value in source order, like get_measure_value."""
+        entry: Final = next(self.entries(with_measure_type, with_group_attrib), None)
+        return None if entry is None else entry.value
+
+    def _type_entries(self, measure_type: MeasureType) -> List[MeasureEntry]:
+        type_index: Final = self._by_type.get(measure_type)
+        return [] if type_index is None else type_index.entries
+
+    def _dated_entries(self, measure_type: MeasureType) -> List[MeasureEntry]:
+        type_index: Final = self._by_type.get(measure_type)
+        return [] if type_index is None else type_index.by_date
+
+    @staticmethod
+    def _entries(
+        entries: Iterable[MeasureEntry], with_group_attrib: GroupAttribFilter
+    ) -> Iterator[MeasureEntry]:
+        group_attribs: Final = _filter_set(with_group_attrib)
+        if group_attribs == _ALL_GROUP_ATTRIBS:
+            return iter(entries)
+
+        return (entry for entry in entries if entry.group.attrib in group_attribs)
@@ -0,0 +1,194 @@
+"""Client side rate limiting for the Withings API."""
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from typing_extensions import Final
+
+from .const import STATUS_SUCCESS, STATUS_TIMEOUT, STATUS_TOO_MANY_REQUESTS
+
+ClockType = Callable[[], float]
+
+
+class TokenBucket:
+    """Thread safe token bucket that hands out reservations."""
+
+    def __init__(self, rate: float, capacity: float, clock: ClockType = time.monotonic):
+        """Initialize new object."""
+        self._clock: Final = clock
+        self._lock: Final = threading.Lock()
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated = clock()
+
+    @property
+    def rate(self) -> float:
+        """Get the number of tokens added per second."""
+        return self._rate
+
+    def _refill(self) -> None:
+        now: Final = self._clock()
+        self._tokens = min(
+            self._capacity, self._tokens + (now - self._updated) * self._rate
+        )
+        self._updated = now
+
+    def set_rate(self, rate: float) -> None:
+        """Change the number of tokens added per second."""
+        with self._lock:
+            self._refill()
+            self._rate = rate
+
+    def reserve(self) -> float:
+        """Take a token and return the seconds to wait before using it."""
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self._rate)
+
+
+class _Buckets:
+    """Token buckets of one rate and capacity, created on first use of a key."""
+
+    def __init__(self, rate: float, capacity: float, clock: ClockType):
+        self.rate: Final = rate
+        self._capacity: Final = capacity
+        self._clock: Final = clock
+        self._lock: Final = threading.Lock()
+        self._buckets: Final[Dict[Any, TokenBucket]] = {}
+
+    def get(self, key: Any) -> TokenBucket:
+        """Get the bucket of a key."""
+        with self._lock:
+            if key not in self._buckets:
+                self._buckets[key] = TokenBucket(self.rate, self._capacity, self._clock)
+            return self._buckets[key]
+
+
+class _Backoff:
+    """Exponential backoff state for one scope."""
+
+    def __init__(self) -> None:
+        self.failures = 0
+        self.until = 0.0
+
+
+class _Backoffs:
+    """Exponential backoff of scopes, by key."""
+
+    def __init__(self, base: float, maximum: float, clock: ClockType):
+        self._base: Final = base
+        self._max: Final = maximum
+        self._clock: Final = clock
+        self._lock: Final = threading.Lock()
+        self._backoffs: Final[Dict[Any, _Backoff]] = {}
+
+    def wait(self, key: Any, now: float) -> float:
+        """Get the seconds a key is still backed off for."""
+        with self._lock:
+            backoff: Final = self._backoffs.get(key)
+            return max(0.0, backoff.until - now) if backoff else 0.0
+
+    def fail(self, key: Any) -> bool:
+        """
+        Back off a key, twice as long as the last time up to the maximum.
+
+        Failures while the key is backed off come from calls made before it
+        was, they are ignored and False is returned.
+        """
+        with self._lock:
+            now: Final = self._clock()
+            backoff: Final = self._backoffs.setdefault(key, _Backoff())
+            if backoff.until > now:
+                return False
+
+            backoff.failures += 1
+            backoff.until = now + min(
+                self._max, self._base * 2 ** (backoff.failures - 1),
+            )
+            return True
+
+    def reset(self, key: Any) -> None:
+        """Stop backing off a key."""
+        with self._lock:
+            self._backoffs.pop(key, None)
+
+
+class RateLimiter:
+    """
+    Rate limits calls per client id and per user, with adaptive backoff.
+
+    One limiter can be shared by any number of WithingsApi and
+    AsyncWithingsApi instances and threads. Withings allows roughly 120 calls
+    per minute per client id, which is the default client rate.
+
+    When Withings answers with a too many requests status, the client id backs
+    off exponentially and its rate is halved, then recovers step by step on
+    successful calls. A timeout status backs off only the affected user.
+    Statuses received while backed off count once, as they answer calls made
+    before the backoff.
+    """
+
+    def __init__(
+        self,
+        client_rate: float = 2.0,
+        client_burst: float = 10.0,
+        user_rate: Optional[float] = None,
+        user_burst: float = 5.0,
+        min_client_rate: float = 0.1,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        clock: ClockType = time.monotonic,
+        sleep: Callable[[float], Any] = time.sleep,
+    ):
+        """Initialize new object."""
+        self._client_buckets: Final = _Buckets(client_rate, client_burst, clock)
+        self._user_buckets: Final = (
+            _Buckets(user_rate, user_burst, clock) if user_rate else None
+        )
+        self._backoffs: Final = _Backoffs(backoff_base, backoff_max, clock)
+        self._min_client_rate: Final = min_client_rate
+        self._clock: Final = clock
+        self._sleep: Final = sleep
+
+    def reserve(self, client_id: str, userid: Optional[int] = None) -> float:
+        """Reserve a call and return the seconds to wait before making it."""
+        now: Final = self._clock()
+        waits = [
+            self._client_buckets.get(client_id).reserve(),
+            self._backoffs.wait(client_id, now),
+        ]
+        if userid is not None:
+            waits.append(self._backoffs.wait((client_id, userid), now))
+            if self._user_buckets is not None:
+                waits.append(self._user_buckets.get((client_id, userid)).reserve())
+
+        return max(waits)
+
+    def acquire(self, client_id: str, userid: Optional[int] = None) -> None:
+        """Block until a call may be made."""
+        wait: Final = self.reserve(client_id, userid)
+        if wait > 0:
+            self._sleep(wait)
+
+    def update(self, client_id: str, userid: Optional[int], status: Any) -> None:
+        """Adapt to the status of a response."""
+        bucket: Final = self._client_buckets.get(client_id)
+        client_rate: Final = self._client_buckets.rate
+
+        if status in STATUS_TOO_MANY_REQUESTS:
+            if self._backoffs.fail(client_id):
+                bucket.set_rate(max(self._min_client_rate, bucket.rate / 2))
+            return
+
+        if status in STATUS_TIMEOUT and userid is not None:
+            self._backoffs.fail((client_id, userid))
+            return
+
+        if status in STATUS_SUCCESS:
+            self._backoffs.reset(client_id)
+            if userid is not None:
+                self._backoffs.reset((client_id, userid))
+            if bucket.rate < client_rate:
+                bucket.set_rate(min(client_rate, bucket.rate + client_rate / 10))
@@ -0,0 +1,125 @@
+"""
+Local stores of ECG signals.
+
+An ECG signal never changes once recorded. A SignalStore keeps the
+heart_get response of every signalid fetched, so iter_heart_signals only
+fetches the recordings of heart_list that are not in it yet:
+
+store = SQLiteSignalStore("signals.db")
+for serie, response in api.iter_heart_signals(store=store):
+    archive(serie, response)
+"""
+from abc import abstractmethod
+from array import array
+import sqlite3
+import threading
+from typing import Dict, Optional
+
+from typing_extensions import Final
+
+from .common import EcgSignal, HeartGetResponse, HeartWearPosition
+
+
+class SignalStore:
+    """Keeps heart_get responses by signalid."""
+
+    @abstractmethod
+    def get(self, signalid: int) -> Optional[HeartGetResponse]:
+        """Get the response of a signal, None if unknown."""
+
+    @abstractmethod
+    def put(self, signalid: int, response: HeartGetResponse) -> None:
+        """Save the response of a signal."""
+
+    def __contains__(self, signalid: object) -> bool:
+        """Check if a signal is stored."""
+        return isinstance(signalid, int) and self.get(signalid) is not None
+
+
+class MemorySignalStore(SignalStore):
+    """Keeps signals in memory."""
+
+    def __init__(self) -> None:
+        """Initialize new object."""
+        self._lock: Final = threading.Lock()
+        self._responses: Final[Dict[int, HeartGetResponse]] = {}
+
+    def __len__(self) -> int:
+        """Get the number of signals."""
+        return len(self._responses)
+
+    def get(self, signalid: int) -> Optional[HeartGetResponse]:
+        """Get the response of a signal, None if unknown."""
+        with self._lock:
+            return self._responses.get(signalid)
+
+    def put(self, signalid: int, response: HeartGetResponse) -> None:
+        """Save the response of a signal."""
+        with self._lock:
+            self._responses[signalid] = response
+
+
+class SQLiteSignalStore(SignalStore):
+    """
+    Keeps signals in a SQLite database.
+
+    Samples are stored as the raw bytes of their array, in the byte order of
+    the machine.
+    """
+
+    def __init__(self, path: str):
+        """Initialize new object."""
+        self._lock: Final = threading.Lock()
+        self._connection: Final = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS signals ("
+                "signalid INTEGER PRIMARY KEY, sampling_frequency INTEGER, "
+                "wearposition INTEGER, typecode TEXT, samples BLOB)"
+            )
+
+    def get(self, signalid: int) -> Optional[HeartGetResponse]:
+        """Get the response of a signal, None if unknown."""
+        with self._lock:
+            row: Final = self._connection.execute(
+                "SELECT sampling_frequency, wearposition, typecode, samples "
+                "FROM signals WHERE signalid = ?",
+                (signalid,),
+            ).fetchone()
+        if row is None:
+            return None
+
+        return HeartGetResponse(
+            signal=EcgSignal(array(row[2], row[3])),
+            sampling_frequency=row[0],
+            wearposition=HeartWearPosition(row[1]),
+        )
+
+    def put(self, signalid: int, response: HeartGetResponse) -> None:
+        """Save the response of a signal."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO signals VALUES (?, ?, ?, ?, ?)",
+                (
+                    signalid,
+                    response.sampling_frequency,
+                    response.wearposition.real,
+                    response.signal.samples.format,
+                    response.signal.samples.tobytes(),
+                ),
+            )
+
+    def __contains__(self, signalid: object) -> bool:
+        """Check if a signal is stored."""
+        with self._lock:
+            return (
+                self._connection.execute(
+                    "SELECT 1 FROM signals WHERE signalid = ?", (signalid,)
+                ).fetchone()
+                is not None
+            )
+
+    def close(self) -> None:
+        """Close the database."""
+        with self._lock:
+            self._connection.close()
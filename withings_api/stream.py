@@ -0,0 +1,167 @@
+"""
+Incremental parsing of large responses.
+
+A multi year page of measure groups, or a night of sleep with every field,
+makes a body of many megabytes. JsonArrayParser reads such a body chunk by
+chunk and hands out the elements of one array of it, like
+body.measuregrps, as soon as each of them is complete. Only the element
+being read is kept in memory, the rest of the document is kept in
+document.
+
+parser = JsonArrayParser(("body", "measuregrps"))
+for chunk in chunks:
+    for group in parser.feed(chunk):
+        handle(group)
+parser.close()
+more = parser.document["body"]["more"]
+"""
+import codecs
+import json
+from typing import Any, Dict, Generator, List, Sequence
+
+from typing_extensions import Final
+
+STREAM_CHUNK_SIZE: Final = 65536
+
+_WHITESPACE: Final = " \t\n\r"
+_DECODER: Final = json.JSONDecoder()
+
+_ParserType = Generator[None, None, Any]
+
+
+class JsonArrayParser:  # pylint: disable=too-many-instance-attributes
+    """
+    Parses a json object fed in chunks, handing out the elements of an array.
+
+    path is the keys leading from the top level object to the array. Other
+    values are parsed whole into document, without the array.
+    """
+
+    def __init__(self, path: Sequence[str]):
+        """Initialize new object."""
+        if not path:
+            raise ValueError("path must name at least one key.")
+
+        self._path: Final = tuple(path)
+        self._text_decoder: Final = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._position = 0
+        self._closed = False
+        self._elements: List[Any] = []
+        self._parser: Final = self._parse()
+        self.document: Final[Dict[str, Any]] = {}
+
+    def feed(self, data: bytes) -> List[Any]:
+        """Parse a chunk and get the elements it completed."""
+        self._buffer = self._buffer[self._position :] + self._text_decoder.decode(data)
+        self._position = 0
+        return self._resume()
+
+    def close(self) -> None:
+        """
+        Parse the end of the document, raising ValueError if it is incomplete.
+
+        Every element is followed by a comma or a bracket, none is left here.
+        """
+        self._buffer = self._buffer[self._position :] + self._text_decoder.decode(
+            b"", final=True
+        )
+        self._position = 0
+        self._closed = True
+        self._resume()
+
+    def _resume(self) -> List[Any]:
+        # A finished parser raises StopIteration again when resumed.
+        try:
+            next(self._parser)
+        except StopIteration:
+            pass
+
+        elements: Final = self._elements
+        self._elements = []
+        return elements
+
+    def _parse(self) -> _ParserType:
+        yield from self._object(0, self.document)
+        if (yield from self._skip_whitespace(required=False)):
+            raise ValueError(
+                "Unexpected data after the document at %s." % self._position
+            )
+
+    def _skip_whitespace(self, required: bool = True) -> _ParserType:
+        """Get the next character that is not whitespace, without consuming it."""
+        while True:
+            while (
+                self._position < len(self._buffer)
+                and self._buffer[self._position] in _WHITESPACE
+            ):
+                self._position += 1
+            if self._position < len(self._buffer):
+                return self._buffer[self._position]
+            if self._closed:
+                if required:
+                    raise ValueError("Unexpected end of the document.")
+                return ""
+            yield
+
+    def _value(self) -> _ParserType:
+        """Parse a whole value."""
+        yield from self._skip_whitespace()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self._buffer, self._position)
+            except json.JSONDecodeError:
+                if self._closed:
+                    raise
+            else:
+                # A number at the end of the buffer may go on in the next chunk.
+                if end < len(self._buffer) or self._closed:
+                    self._position = end
+                    return value
+            yield
+
+    def _expect(self, characters: str) -> _ParserType:
+        """Consume the next character, which must be one of characters."""
+        character = yield from self._skip_whitespace()
+        if character not in characters:
+            raise ValueError(
+                "Expected one of %s at %s, got %s."
+                % (characters, self._position, character)
+            )
+        self._position += 1
+        return character
+
+    def _object(self, depth: int, target: Dict[str, Any]) -> _ParserType:
+        yield from self._expect("{")
+        if (yield from self._skip_whitespace()) == "}":
+            self._position += 1
+            return
+
+        while True:
+            key = yield from self._value()
+            if not isinstance(key, str):
+                raise ValueError("Expected a key at %s." % self._position)
+            yield from self._expect(":")
+
+            if key != self._path[depth]:
+                target[key] = yield from self._value()
+            elif depth == len(self._path) - 1:
+                yield from self._array()
+            else:
+                target[key] = {}
+                yield from self._object(depth + 1, target[key])
+
+            if (yield from self._expect(",}")) == "}":
+                return
+
+    def _array(self) -> _ParserType:
+        yield from self._expect("[")
+        if (yield from self._skip_whitespace()) == "]":
+            self._position += 1
+            return
+
+        while True:
+            element = yield from self._value()
+            self._elements.append(element)
+            if (yield from self._expect(",]")) == "]":
+                return
@@ -0,0 +1,341 @@
+"""
+Incremental sync driven by the lastupdate parameter.
+
+measure_get_meas, measure_get_activity and sleep_get_summary accept a
+lastupdate date and then only return what changed since. SyncEngine keeps
+that date as a cursor per user and per endpoint, fetches the changes, merges
+them into a SyncStore by key and only then moves the cursor forward.
+"""
+from abc import abstractmethod
+from datetime import tzinfo
+from enum import Enum
+import sqlite3
+import threading
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+)
+
+import arrow
+from arrow import Arrow
+from pydantic import BaseModel
+from pydantic.json import pydantic_encoder
+from typing_extensions import Final
+
+from . import WithingsApi, iter_pages
+from .codec import get_codec
+from .common import (
+    GetActivityField,
+    GetSleepSummaryField,
+    GetSleepSummarySerie,
+    MeasureGetActivityActivity,
+    MeasureGetMeasGroup,
+    timezone_name,
+)
+from .params import DateType, resolve_date
+
+
+class SyncStore:
+    """Persists synced items and cursors."""
+
+    @abstractmethod
+    def get_cursor(self, userid: int, endpoint: str) -> Optional[int]:
+        """Get the lastupdate epoch to sync from, None if never synced."""
+
+    @abstractmethod
+    def get_items(self, userid: int, endpoint: str) -> Dict[str, Any]:
+        """Get the synced items by key."""
+
+    @abstractmethod
+    def commit(
+        self,
+        userid: int,
+        endpoint: str,
+        items: Mapping[str, Any],
+        cursor: Optional[int],
+    ) -> None:
+        """
+        Merge items by key, then move the cursor unless it is None.
+
+        Implementations must not move the cursor if storing the items fails.
+        """
+
+
+class MemorySyncStore(SyncStore):
+    """Keeps synced items and cursors in memory."""
+
+    def __init__(self) -> None:
+        """Initialize new object."""
+        self._lock: Final = threading.Lock()
+        self._cursors: Final[Dict[Tuple[int, str], int]] = {}
+        self._items: Final[Dict[Tuple[int, str], Dict[str, Any]]] = {}
+
+    def get_cursor(self, userid: int, endpoint: str) -> Optional[int]:
+        """Get the lastupdate epoch to sync from, None if never synced."""
+        with self._lock:
+            return self._cursors.get((userid, endpoint))
+
+    def get_items(self, userid: int, endpoint: str) -> Dict[str, Any]:
+        """Get the synced items by key."""
+        with self._lock:
+            return dict(self._items.get((userid, endpoint), {}))
+
+    def commit(
+        self,
+        userid: int,
+        endpoint: str,
+        items: Mapping[str, Any],
+        cursor: Optional[int],
+    ) -> None:
+        """Merge items by key, then move the cursor unless it is None."""
+        with self._lock:
+            self._items.setdefault((userid, endpoint), {}).update(items)
+            if cursor is not None:
+                self._cursors[(userid, endpoint)] = cursor
+
+
+def _to_json(value: Any) -> Any:
+    if isinstance(value, Enum):
+        value = value.value
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    if isinstance(value, dict):
+        return {key: _to_json(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_json(item) for item in value]
+    if isinstance(value, Arrow):
+        return value.isoformat()
+    if isinstance(value, tzinfo):
+        return timezone_name(value)
+    return _to_json(pydantic_encoder(value))
+
+
+class SQLiteSyncStore(SyncStore):
+    """
+    Keeps synced items and cursors in a SQLite database.
+
+    Items are stored as json. Items of an endpoint with a model are parsed
+    back into it, other items come back as json values, so tuples as lists.
+    Items and cursor of a commit are written in one transaction.
+    """
+
+    def __init__(self, path: str, endpoints: Optional[Iterable["SyncEndpoint"]] = None):
+        """Initialize new object, endpoints default to SYNC_ENDPOINTS."""
+        self._models: Final[Dict[str, Type[BaseModel]]] = {
+            endpoint.name: endpoint.model
+            for endpoint in (SYNC_ENDPOINTS if endpoints is None else endpoints)
+            if endpoint.model is not None
+        }
+        self._lock: Final = threading.Lock()
+        self._connection: Final = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS sync_cursor ("
+                "userid INTEGER, endpoint TEXT, cursor INTEGER, "
+                "PRIMARY KEY (userid, endpoint))"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS sync_item ("
+                "userid INTEGER, endpoint TEXT, key TEXT, data BLOB, "
+                "PRIMARY KEY (userid, endpoint, key))"
+            )
+
+    def get_cursor(self, userid: int, endpoint: str) -> Optional[int]:
+        """Get the lastupdate epoch to sync from, None if never synced."""
+        with self._lock:
+            row: Final = self._connection.execute(
+                "SELECT cursor FROM sync_cursor WHERE userid = ? AND endpoint = ?",
+                (userid, endpoint),
+            ).fetchone()
+        return None if row is None else int(row[0])
+
+    def get_items(self, userid: int, endpoint: str) -> Dict[str, Any]:
+        """Get the synced items by key."""
+        with self._lock:
+            rows: Final = self._connection.execute(
+                "SELECT key, data FROM sync_item WHERE userid = ? AND endpoint = ?",
+                (userid, endpoint),
+            ).fetchall()
+        loads: Final = get_codec().loads
+        model: Final = self._models.get(endpoint)
+        if model is None:
+            return {key: loads(data) for key, data in rows}
+        return {key: model.parse_obj(loads(data)) for key, data in rows}
+
+    def commit(
+        self,
+        userid: int,
+        endpoint: str,
+        items: Mapping[str, Any],
+        cursor: Optional[int],
+    ) -> None:
+        """Merge items by key, then move the cursor unless it is None."""
+        dumps: Final = get_codec().dumps
+        rows: Final = [
+            (userid, endpoint, key, dumps(_to_json(item)))
+            for key, item in items.items()
+        ]
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO sync_item VALUES (?, ?, ?, ?)", rows
+            )
+            if cursor is not None:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO sync_cursor VALUES (?, ?, ?)",
+                    (userid, endpoint, cursor),
+                )
+
+    def close(self) -> None:
+        """Close the database."""
+        with self._lock:
+            self._connection.close()
+
+
+class SyncEndpoint(NamedTuple):
+    """
+    How to sync one endpoint.
+
+    fetch is called with the api, the lastupdate epoch and the page offset.
+    high_water is called with each page and returns the cursor to resume
+    from after it, or None if the page has none; the engine resumes from the
+    latest of them. model is the pydantic model of the items, to parse them
+    back from a store.
+    """
+
+    name: str
+    fetch: Callable[[WithingsApi, int, Optional[int]], Any]
+    get_items: Callable[[Any], Sequence[Any]]
+    get_key: Callable[[Any], str]
+    high_water: Callable[[Any], Optional[int]]
+    model: Optional[Type[BaseModel]] = None
+
+
+def _sleep_summary_key(serie: GetSleepSummarySerie) -> str:
+    if serie.id is not None:
+        return str(serie.id)
+    return str(serie.startdate.int_timestamp)
+
+
+def _sleep_summary_high_water(page: Any) -> Optional[int]:
+    return max((serie.modified.int_timestamp for serie in page.series), default=None)
+
+
+def _activity_key(activity: MeasureGetActivityActivity) -> str:
+    return "%s:%s" % (activity.date.format("YYYY-MM-DD"), activity.deviceid)
+
+
+def _activity_high_water(page: Any) -> Optional[int]:
+    # Activities without a modified date count as modified on their day.
+    return max(
+        (
+            (activity.modified or activity.date).int_timestamp
+            for activity in page.activities
+        ),
+        default=None,
+    )
+
+
+MEASURE_GET_MEAS: Final = SyncEndpoint(
+    name="measure_get_meas",
+    fetch=lambda api, lastupdate, offset: api.measure_get_meas(
+        startdate=None, enddate=None, offset=offset, lastupdate=lastupdate
+    ),
+    get_items=lambda page: page.measuregrps,
+    get_key=lambda group: str(group.grpid),
+    high_water=lambda page: page.updatetime.int_timestamp,
+    model=MeasureGetMeasGroup,
+)
+MEASURE_GET_ACTIVITY: Final = SyncEndpoint(
+    name="measure_get_activity",
+    fetch=lambda api, lastupdate, offset: api.measure_get_activity(
+        GetActivityField, None, None, offset, lastupdate
+    ),
+    get_items=lambda page: page.activities,
+    get_key=_activity_key,
+    high_water=_activity_high_water,
+    model=MeasureGetActivityActivity,
+)
+SLEEP_GET_SUMMARY: Final = SyncEndpoint(
+    name="sleep_get_summary",
+    fetch=lambda api, lastupdate, offset: api.sleep_get_summary(
+        GetSleepSummaryField, None, None, offset, lastupdate
+    ),
+    get_items=lambda page: page.series,
+    get_key=_sleep_summary_key,
+    high_water=_sleep_summary_high_water,
+    model=GetSleepSummarySerie,
+)
+SYNC_ENDPOINTS: Final = (MEASURE_GET_MEAS, MEASURE_GET_ACTIVITY, SLEEP_GET_SUMMARY)
+
+
+class SyncResult(NamedTuple):
+    """The outcome of syncing one endpoint for one user."""
+
+    userid: int
+    endpoint: str
+    changed: int
+    cursor: int
+
+
+class SyncEngine:
+    """
+    Syncs endpoints of users into a SyncStore.
+
+    Each page is merged into the store as soon as it arrives. The cursor is
+    only committed once every page is stored, so a sync that fails halfway is
+    retried from the previous cursor and merges the same items again.
+
+    engine = SyncEngine(SQLiteSyncStore("withings.db"))
+    for result in fetch_batch(all_creds, engine.sync_all):
+        ...
+    """
+
+    def __init__(
+        self,
+        store: SyncStore,
+        endpoints: Iterable[SyncEndpoint] = SYNC_ENDPOINTS,
+        initial_lastupdate: DateType = 0,
+    ):
+        """Initialize new object."""
+        self.store: Final = store
+        self._endpoints: Final = tuple(endpoints)
+        self._initial_lastupdate: Final = arrow.get(
+            resolve_date(initial_lastupdate)
+        ).int_timestamp
+
+    def sync(self, api: WithingsApi, endpoint: SyncEndpoint) -> SyncResult:
+        """Fetch and store what changed for one endpoint since the last sync."""
+        userid: Final = api.get_credentials().userid
+        cursor: Final = self.store.get_cursor(userid, endpoint.name)
+        lastupdate: Final = self._initial_lastupdate if cursor is None else cursor
+        new_cursor = lastupdate
+        changed = 0
+
+        for page in iter_pages(lambda offset: endpoint.fetch(api, lastupdate, offset)):
+            page_items = endpoint.get_items(page)
+            self.store.commit(
+                userid,
+                endpoint.name,
+                {endpoint.get_key(item): item for item in page_items},
+                None,
+            )
+            changed += len(page_items)
+            high_water = endpoint.high_water(page)
+            if high_water is not None:
+                new_cursor = max(new_cursor, high_water)
+
+        self.store.commit(userid, endpoint.name, {}, new_cursor)
+
+        return SyncResult(userid, endpoint.name, changed, new_cursor)
+
+    def sync_all(self, api: WithingsApi) -> Tuple[SyncResult, ...]:
+        """Sync every endpoint of the engine for one user."""
+        return tuple(self.sync(api, endpoint) for endpoint in self._endpoints)
@@ -0,0 +1,318 @@
+"""
+Deterministic synthetic Withings data.
+
+Every function builds json compatible values shaped like the responses of
+the Withings API, from a random.Random so the same seed always gives the
+same data. Used by the benchmarks and to stand in for the API in tests.
+"""
+import random
+from typing import Any, Dict, List
+
+import arrow
+from typing_extensions import Final
+
+from .common import (
+    GetActivityField,
+    GetSleepField,
+    GetSleepSummaryField,
+    HeartModel,
+    HeartWearPosition,
+    MeasureGetMeasGroupAttrib,
+    MeasureGetMeasGroupCategory,
+    MeasureType,
+    NotifyAppli,
+    SleepModel,
+    SleepState,
+)
+
+START: Final = 1577836800  # 2020-01-01T00:00:00Z
+DAY: Final = 86400
+TIMEZONES: Final = ("Europe/London", "America/Los_Angeles", "Europe/Paris")
+
+_MEASURE_UNITS: Final = {
+    MeasureType.WEIGHT: (-3, 50000, 120000),
+    MeasureType.FAT_RATIO: (-3, 10000, 40000),
+    MeasureType.DIASTOLIC_BLOOD_PRESSURE: (0, 60, 90),
+    MeasureType.SYSTOLIC_BLOOD_PRESSURE: (0, 100, 140),
+    MeasureType.HEART_RATE: (0, 50, 90),
+    MeasureType.SP02: (0, 92, 100),
+    MeasureType.BODY_TEMPERATURE: (-2, 3600, 3800),
+}
+
+
+def response(body: Dict[str, Any], status: int = 0) -> Dict[str, Any]:
+    """Wrap a body the way the API does."""
+    return {"status": status, "body": body}
+
+
+def measure_group(rng: random.Random, grpid: int, date: int) -> Dict[str, Any]:
+    """Create a measure group taken at date."""
+    types: Final = rng.sample(list(_MEASURE_UNITS), rng.randint(1, 4))
+    return {
+        "grpid": grpid,
+        "attrib": rng.choice(
+            (
+                MeasureGetMeasGroupAttrib.DEVICE_ENTRY_FOR_USER,
+                MeasureGetMeasGroupAttrib.MANUAL_USER_ENTRY,
+            )
+        ).real,
+        "date": date,
+        "created": date + rng.randint(0, 600),
+        "category": MeasureGetMeasGroupCategory.REAL.real,
+        "deviceid": "device%s" % rng.randint(1, 3),
+        "measures": [
+            {
+                "type": measure_type.real,
+                "unit": _MEASURE_UNITS[measure_type][0],
+                "value": rng.randint(*_MEASURE_UNITS[measure_type][1:]),
+            }
+            for measure_type in types
+        ],
+    }
+
+
+def activity(rng: random.Random, date: int) -> Dict[str, Any]:
+    """Create the activity of the day of date."""
+    steps: Final = rng.randint(0, 20000)
+    return {
+        "date": arrow.get(date).format("YYYY-MM-DD"),
+        "timezone": rng.choice(TIMEZONES),
+        "deviceid": "device%s" % rng.randint(1, 3),
+        "brand": 18,
+        "is_tracker": True,
+        "modified": date + DAY,
+        GetActivityField.STEPS.value: steps,
+        GetActivityField.DISTANCE.value: round(steps * 0.75, 2),
+        GetActivityField.ELEVATION.value: round(rng.uniform(0, 50), 2),
+        GetActivityField.SOFT.value: rng.randint(0, 20000),
+        GetActivityField.MODERATE.value: rng.randint(0, 5000),
+        GetActivityField.INTENSE.value: rng.randint(0, 3000),
+        GetActivityField.ACTIVE.value: rng.randint(0, 8000),
+        GetActivityField.CALORIES.value: round(rng.uniform(0, 800), 2),
+        GetActivityField.TOTAL_CALORIES.value: round(rng.uniform(1500, 3500), 2),
+        GetActivityField.HR_AVERAGE.value: rng.randint(55, 90),
+        GetActivityField.HR_MIN.value: rng.randint(40, 55),
+        GetActivityField.HR_MAX.value: rng.randint(90, 180),
+        GetActivityField.HR_ZONE_0.value: rng.randint(0, 40000),
+        GetActivityField.HR_ZONE_1.value: rng.randint(0, 5000),
+        GetActivityField.HR_ZONE_2.value: rng.randint(0, 2000),
+        GetActivityField.HR_ZONE_3.value: rng.randint(0, 500),
+    }
+
+
+def sleep_summary_serie(rng: random.Random, serieid: int, date: int) -> Dict[str, Any]:
+    """Create the sleep summary of the night starting at date."""
+    startdate: Final = date + rng.randint(-3600, 3600)
+    enddate: Final = startdate + rng.randint(5 * 3600, 10 * 3600)
+    light: Final = rng.randint(3600, 4 * 3600)
+    deep: Final = rng.randint(1800, 3 * 3600)
+    rem: Final = rng.randint(1800, 2 * 3600)
+    data: Final[Dict[str, Any]] = {
+        field.value: rng.randint(0, 100)
+        for field in GetSleepSummaryField
+        if field != GetSleepSummaryField.APNEA_HYPOPNEA_INDEX
+    }
+    data.update(
+        {
+            GetSleepSummaryField.APNEA_HYPOPNEA_INDEX.value: round(
+                rng.uniform(0, 5), 2
+            ),
+            GetSleepSummaryField.LIGHT_SLEEP_DURATION.value: light,
+            GetSleepSummaryField.DEEP_SLEEP_DURATION.value: deep,
+            GetSleepSummaryField.REM_SLEEP_DURATION.value: rem,
+            GetSleepSummaryField.TOTAL_SLEEP.value: light + deep + rem,
+            GetSleepSummaryField.TOTAL_IN_BED.value: enddate - startdate,
+        }
+    )
+    return {
+        "id": serieid,
+        "timezone": rng.choice(TIMEZONES),
+        "model": SleepModel.SLEEP_MONITOR.real,
+        "startdate": startdate,
+        "enddate": enddate,
+        "date": arrow.get(startdate).format("YYYY-MM-DD"),
+        "modified": enddate + rng.randint(60, 3600),
+        "data": data,
+    }
+
+
+def sleep_serie(
+    rng: random.Random, startdate: int, samples: int = 10, step: int = 60
+) -> Dict[str, Any]:
+    """Create a sleep state lasting samples * step seconds, with a value per step."""
+    timestamps: Final = range(startdate, startdate + samples * step, step)
+    serie: Final[Dict[str, Any]] = {
+        "startdate": startdate,
+        "enddate": startdate + samples * step,
+        "state": rng.choice(list(SleepState)[1:]).real,
+    }
+    for field, low, high in (
+        (GetSleepField.HR, 45, 80),
+        (GetSleepField.RR, 10, 20),
+        (GetSleepField.SNORING, 0, 1),
+        (GetSleepField.SDNN_1, 20, 120),
+        (GetSleepField.RMSSD, 20, 120),
+    ):
+        serie[field.value] = {
+            str(timestamp): rng.randint(low, high) for timestamp in timestamps
+        }
+
+    return serie
+
+
+def heart_serie(rng: random.Random, signalid: int, timestamp: int) -> Dict[str, Any]:
+    """Create an ECG recording entry of heart list."""
+    return {
+        "deviceid": "device%s" % rng.randint(1, 3),
+        "model": HeartModel.SCANWATCH.real,
+        "ecg": {"signalid": signalid, "afib": rng.choice((0, 0, 0, 1, 2))},
+        "bloodpressure": {
+            "diastole": rng.randint(60, 90),
+            "systole": rng.randint(100, 140),
+        },
+        "heart_rate": rng.randint(50, 100),
+        "timestamp": timestamp,
+    }
+
+
+def heart_signal(
+    rng: random.Random, samples: int = 15000, sampling_frequency: int = 500
+) -> List[int]:
+    """
+    Create an ECG signal in micro volts.
+
+    A sharp R peak of about a millivolt is placed every beat, at a heart rate
+    of 50 to 100 bpm, over a noisy baseline.
+    """
+    signal: Final = [rng.randint(-30, 30) for _ in range(samples)]
+    beat: Final = sampling_frequency * 60.0 / rng.randint(50, 100)
+    half_width: Final = max(1, sampling_frequency // 100)
+    peak = rng.uniform(0.2, 1.0) * beat
+    while peak < samples:
+        center = int(peak)
+        amplitude = rng.randint(800, 1200)
+        for index in range(
+            max(0, center - half_width), min(samples, center + half_width + 1)
+        ):
+            signal[index] += (
+                amplitude * (half_width - abs(index - center)) // half_width
+            )
+        peak += beat * rng.uniform(0.95, 1.05)
+
+    return signal
+
+
+def device(rng: random.Random, index: int) -> Dict[str, Any]:
+    """Create a device of user get device."""
+    return {
+        "type": rng.choice(("Scale", "Sleep Monitor", "Activity Tracker")),
+        "model": "Model %s" % rng.randint(1, 9),
+        "battery": rng.choice(("low", "medium", "high")),
+        "deviceid": "device%s" % index,
+        "timezone": rng.choice(TIMEZONES),
+    }
+
+
+def notify_profile(rng: random.Random, index: int) -> Dict[str, Any]:
+    """Create a subscription of notify list."""
+    return {
+        "appli": rng.choice(list(NotifyAppli)[1:]).real,
+        "callbackurl": "https://example.com/withings/%s" % index,
+        "expires": 2147483647,
+        "comment": "subscription %s" % index,
+    }
+
+
+def user_get_device_body(count: int = 3, seed: int = 0) -> Dict[str, Any]:
+    """Create a getdevice body with count devices."""
+    rng: Final = random.Random(seed)
+    return {"devices": [device(rng, index + 1) for index in range(count)]}
+
+
+def notify_list_body(count: int = 3, seed: int = 0) -> Dict[str, Any]:
+    """Create a notify list body with count subscriptions."""
+    rng: Final = random.Random(seed)
+    return {"profiles": [notify_profile(rng, index + 1) for index in range(count)]}
+
+
+def measure_get_meas_body(
+    count: int = 100, seed: int = 0, start: int = START, step: int = 3600
+) -> Dict[str, Any]:
+    """Create a getmeas body with count measure groups."""
+    rng: Final = random.Random(seed)
+    return {
+        "updatetime": start + count * step,
+        "timezone": TIMEZONES[0],
+        "more": False,
+        "offset": 0,
+        "measuregrps": [
+            measure_group(rng, grpid, start + grpid * step) for grpid in range(count)
+        ],
+    }
+
+
+def measure_get_activity_body(
+    count: int = 100, seed: int = 0, start: int = START
+) -> Dict[str, Any]:
+    """Create a getactivity body with count days of activity."""
+    rng: Final = random.Random(seed)
+    return {
+        "more": False,
+        "offset": 0,
+        "activities": [activity(rng, start + day * DAY) for day in range(count)],
+    }
+
+
+def sleep_get_summary_body(
+    count: int = 100, seed: int = 0, start: int = START
+) -> Dict[str, Any]:
+    """Create a getsummary body with count nights."""
+    rng: Final = random.Random(seed)
+    return {
+        "more": False,
+        "offset": 0,
+        "series": [
+            sleep_summary_serie(rng, night + 1, start + night * DAY)
+            for night in range(count)
+        ],
+    }
+
+
+def sleep_get_body(
+    count: int = 100, samples: int = 10, seed: int = 0, start: int = START
+) -> Dict[str, Any]:
+    """Create a sleep get body with count consecutive states."""
+    rng: Final = random.Random(seed)
+    return {
+        "model": SleepModel.SLEEP_MONITOR.real,
+        "series": [
+            sleep_serie(rng, start + index * samples * 60, samples)
+            for index in range(count)
+        ],
+    }
+
+
+def heart_list_body(
+    count: int = 100, seed: int = 0, start: int = START
+) -> Dict[str, Any]:
+    """Create a heart list body with count recordings."""
+    rng: Final = random.Random(seed)
+    return {
+        "more": False,
+        "offset": 0,
+        "series": [
+            heart_serie(rng, index + 1, start + index * DAY) for index in range(count)
+        ],
+    }
+
+
+def heart_get_body(
+    samples: int = 15000, seed: int = 0, sampling_frequency: int = 500
+) -> Dict[str, Any]:
+    """Create a heart get body with an ECG signal of samples values."""
+    rng: Final = random.Random(seed)
+    return {
+        "signal": heart_signal(rng, samples, sampling_frequency),
+        "sampling_frequency": sampling_frequency,
+        "wearposition": HeartWearPosition.LEFT_WRIST.real,
+    }
@@ -0,0 +1,388 @@
+"""
+Instrumentation of api calls.
+
+Give a Tracer to WithingsApi or AsyncWithingsApi to receive an event for
+every call, with its time split into the phases of the call, for every
+token refresh and for every call sent again. LoggingTracer and MetricsTracer are ready made tracers,
+MultiTracer sends events to several of them.
+
+metrics = MetricsTracer()
+api = WithingsApi(creds, tracer=MultiTracer(LoggingTracer(), metrics))
+...
+print(metrics.render())
+"""
+from collections import Counter
+from contextlib import contextmanager
+import logging
+import threading
+from time import perf_counter
+from typing import Any, Dict, Iterator, NamedTuple, Optional, Tuple, cast
+
+from typing_extensions import Final
+
+from .codec import get_codec
+from .common import response_body_or_raise
+
+_LOGGER: Final = logging.getLogger(__name__)
+
+PHASES: Final = ("wait", "network", "decode", "check", "validate")
+
+
+class CallEvent(NamedTuple):
+    """
+    One call of the api.
+
+    Times are in seconds:
+    wait: spent in the rate limiter.
+    network: sending the request and reading the response.
+    decode: parsing the json response. Included in network for api classes
+      that only implement _request.
+    check: checking the status of the response.
+    validate: building the response object.
+    """
+
+    userid: Optional[int]
+    path: str
+    action: Optional[str]
+    method: str
+    status: Optional[int]
+    http_status: Optional[int]
+    size: Optional[int]
+    cached: bool
+    wait: float
+    network: float
+    decode: float
+    check: float
+    validate: float
+    error: Optional[Exception]
+
+    @property
+    def seconds(self) -> float:
+        """Get the total time of the call."""
+        return self.wait + self.network + self.decode + self.check + self.validate
+
+
+class RefreshEvent(NamedTuple):
+    """One token refresh, taking seconds."""
+
+    userid: int
+    seconds: float
+    error: Optional[Exception]
+
+
+class RetryEvent(NamedTuple):
+    """
+    One call sent again after failing with error.
+
+    WithingsApi sends a call again once it refreshed the token the call
+    found expired.
+    """
+
+    userid: Optional[int]
+    path: str
+    action: Optional[str]
+    error: Exception
+
+
+class Tracer:
+    """
+    Receives instrumentation events.
+
+    Methods do nothing unless overridden. They are called on the thread, or
+    in the task, making the call so should return quickly.
+    """
+
+    def on_call(self, event: CallEvent) -> None:
+        """Handle a finished call."""
+
+    def on_refresh(self, event: RefreshEvent) -> None:
+        """Handle a finished token refresh."""
+
+    def on_retry(self, event: RetryEvent) -> None:
+        """Handle a call about to be sent again."""
+
+
+class CallTrace:  # pylint: disable=too-many-instance-attributes
+    """Collects the phases of a call and reports it to a tracer on exit."""
+
+    __slots__ = (
+        "_tracer",
+        "userid",
+        "path",
+        "action",
+        "method",
+        "status",
+        "http_status",
+        "size",
+        "cached",
+        "wait",
+        "network",
+        "decode",
+        "check",
+        "validate",
+        "error",
+    )
+
+    def __init__(
+        self,
+        tracer: Tracer,
+        userid: Optional[int],
+        path: str,
+        params: Dict[str, Any],
+        method: str,
+    ):
+        """Initialize new object."""
+        self._tracer: Final = tracer
+        self.userid: Final = userid
+        self.path: Final = path
+        self.action: Final = params.get("action")
+        self.method: Final = method
+        self.status: Optional[int] = None
+        self.http_status: Optional[int] = None
+        self.size: Optional[int] = None
+        self.cached = False
+        self.wait = 0.0
+        self.network = 0.0
+        self.decode = 0.0
+        self.check = 0.0
+        self.validate = 0.0
+        self.error: Optional[Exception] = None
+
+    def __enter__(self) -> "CallTrace":
+        return self
+
+    def __exit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> None:
+        if isinstance(exc_value, Exception):
+            self.error = exc_value
+        self._tracer.on_call(self.event())
+
+    def decode_response(
+        self, sent: float, http_status: int, content: bytes
+    ) -> Dict[str, Any]:
+        """
+        Decode a response, sent is the perf_counter before sending its request.
+
+        Records the network phase up to now, then the decode phase.
+        """
+        start: Final = perf_counter()
+        self.network = start - sent
+        self.http_status = http_status
+        self.size = len(content)
+        data: Final = get_codec().loads(content)
+        self.decode = perf_counter() - start
+        return cast(Dict[str, Any], data)
+
+    def check_body(
+        self, data: Any, path: str, params: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Get the body of a decoded response, recording the check phase."""
+        self.status = data.get("status") if isinstance(data, dict) else None
+        start: Final = perf_counter()
+        try:
+            return response_body_or_raise(data, path, params)
+        finally:
+            self.check = perf_counter() - start
+
+    def event(self) -> CallEvent:
+        """Get the event collected so far."""
+        return CallEvent(
+            self.userid,
+            self.path,
+            self.action,
+            self.method,
+            self.status,
+            self.http_status,
+            self.size,
+            self.cached,
+            self.wait,
+            self.network,
+            self.decode,
+            self.check,
+            self.validate,
+            self.error,
+        )
+
+
+@contextmanager
+def trace_refresh(tracer: Optional[Tracer], userid: int) -> Iterator[None]:
+    """Report the token refresh run in the block to a tracer, if any."""
+    if tracer is None:
+        yield
+        return
+
+    start: Final = perf_counter()
+    try:
+        yield
+    except Exception as error:
+        tracer.on_refresh(RefreshEvent(userid, perf_counter() - start, error))
+        raise
+
+    tracer.on_refresh(RefreshEvent(userid, perf_counter() - start, None))
+
+
+class MultiTracer(Tracer):
+    """Sends events to several tracers."""
+
+    def __init__(self, *tracers: Tracer):
+        """Initialize new object."""
+        self._tracers: Final = tracers
+
+    def on_call(self, event: CallEvent) -> None:
+        """Handle a finished call."""
+        for tracer in self._tracers:
+            tracer.on_call(event)
+
+    def on_refresh(self, event: RefreshEvent) -> None:
+        """Handle a finished token refresh."""
+        for tracer in self._tracers:
+            tracer.on_refresh(event)
+
+    def on_retry(self, event: RetryEvent) -> None:
+        """Handle a call about to be sent again."""
+        for tracer in self._tracers:
+            tracer.on_retry(event)
+
+
+class LoggingTracer(Tracer):
+    """Logs events, failed ones at warning level."""
+
+    def __init__(self, logger: logging.Logger = _LOGGER, level: int = logging.DEBUG):
+        """Initialize new object."""
+        self._logger: Final = logger
+        self._level: Final = level
+
+    def on_call(self, event: CallEvent) -> None:
+        """Handle a finished call."""
+        self._logger.log(
+            logging.WARNING if event.error else self._level,
+            "%s %s action=%s userid=%s status=%s bytes=%s cached=%s "
+            "seconds=%.4f wait=%.4f network=%.4f decode=%.4f check=%.4f "
+            "validate=%.4f error=%r",
+            event.method,
+            event.path,
+            event.action,
+            event.userid,
+            event.status,
+            event.size,
+            event.cached,
+            event.seconds,
+            event.wait,
+            event.network,
+            event.decode,
+            event.check,
+            event.validate,
+            event.error,
+        )
+
+    def on_refresh(self, event: RefreshEvent) -> None:
+        """Handle a finished token refresh."""
+        self._logger.log(
+            logging.WARNING if event.error else self._level,
+            "token refresh userid=%s seconds=%.4f error=%r",
+            event.userid,
+            event.seconds,
+            event.error,
+        )
+
+    def on_retry(self, event: RetryEvent) -> None:
+        """Handle a call about to be sent again."""
+        self._logger.log(
+            self._level,
+            "retry %s action=%s userid=%s error=%r",
+            event.path,
+            event.action,
+            event.userid,
+            event.error,
+        )
+
+
+LabelsType = Tuple[Tuple[str, str], ...]
+
+
+class MetricsTracer(Tracer):
+    """
+    Counts events as Prometheus style counters.
+
+    render returns the counters in the Prometheus text format, ready to be
+    served on a metrics endpoint. Counters are labelled by endpoint, not by
+    user, to keep their number bounded. users counts the calls of each user
+    to find the busiest ones.
+    """
+
+    def __init__(self, prefix: str = "withings"):
+        """Initialize new object."""
+        self._prefix: Final = prefix
+        self._lock: Final = threading.Lock()
+        self._counters: Final[Dict[str, Dict[LabelsType, float]]] = {}
+        self.users: Final["Counter[Optional[int]]"] = Counter()
+
+    def _inc(self, name: str, labels: LabelsType, amount: float = 1.0) -> None:
+        counter: Final = self._counters.setdefault("%s_%s" % (self._prefix, name), {})
+        counter[labels] = counter.get(labels, 0.0) + amount
+
+    def value(self, name: str, **labels: str) -> float:
+        """Get the value of a counter, without the prefix in its name."""
+        with self._lock:
+            return self._counters.get("%s_%s" % (self._prefix, name), {}).get(
+                tuple(sorted(labels.items())), 0.0
+            )
+
+    def on_call(self, event: CallEvent) -> None:
+        """Handle a finished call."""
+        endpoint: Final = (
+            ("action", str(event.action)),
+            ("path", event.path),
+        )
+        outcome: Final = (
+            type(event.error).__name__ if event.error else str(event.status)
+        )
+        with self._lock:
+            self.users[event.userid] += 1
+            self._inc("calls_total", endpoint + (("status", outcome),))
+            if event.cached:
+                self._inc("cache_hits_total", endpoint)
+            if event.size is not None:
+                self._inc("response_bytes_total", endpoint, event.size)
+            for phase in PHASES:
+                self._inc(
+                    "call_seconds_total",
+                    endpoint + (("phase", phase),),
+                    getattr(event, phase),
+                )
+
+    def on_refresh(self, event: RefreshEvent) -> None:
+        """Handle a finished token refresh."""
+        outcome: Final = (("outcome", "error" if event.error else "ok"),)
+        with self._lock:
+            self._inc("refreshes_total", outcome)
+            self._inc("refresh_seconds_total", outcome, event.seconds)
+
+    def on_retry(self, event: RetryEvent) -> None:
+        """Handle a call about to be sent again."""
+        with self._lock:
+            self._inc(
+                "retries_total",
+                (
+                    ("action", str(event.action)),
+                    ("error", type(event.error).__name__),
+                    ("path", event.path),
+                ),
+            )
+
+    def render(self) -> str:
+        """Get the counters in the Prometheus text format."""
+        lines: Final = []
+        with self._lock:
+            for name, counter in sorted(self._counters.items()):
+                lines.append("# TYPE %s counter" % name)
+                for labels, value in sorted(counter.items()):
+                    lines.append(
+                        "%s{%s} %r"
+                        % (
+                            name,
+                            ",".join('%s="%s"' % (key, label) for key, label in labels),
+                            value,
+                        )
+                    )
+
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,88 @@
+"""Http connection pools shared by many api instances."""
+import importlib.util
+from typing import TYPE_CHECKING, Optional, Tuple, Union
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+from typing_extensions import Final
+
+if TYPE_CHECKING:
+    import httpx  # pragma: no cover
+
+TimeoutType = Union[None, float, Tuple[float, float]]
+
+
+class SharedTransport:
+    """
+    Connection pool settings shared by many WithingsApi instances.
+
+    Every WithingsApi builds its own OAuth2Session to keep the user's token
+    separate. Passing the same transport to each of them mounts one
+    HTTPAdapter on all sessions, so connections and TLS sessions to Withings
+    are reused across users instead of being opened per user.
+
+    transport = SharedTransport(pool_maxsize=32, timeout=10)
+    apis = [WithingsApi(creds, transport=transport) for creds in all_creds]
+
+    For AsyncWithingsApi, pass async_client() as the client of each instance.
+    HTTP/2 is only available there, and only when the h2 package is installed.
+    """
+
+    def __init__(
+        self,
+        pool_connections: int = 1,
+        pool_maxsize: int = 10,
+        max_retries: int = 0,
+        timeout: TimeoutType = None,
+        keepalive_expiry: Optional[float] = 5.0,
+        http2: bool = True,
+    ):
+        """Initialize new object."""
+        self._pool_maxsize: Final = pool_maxsize
+        self._keepalive_expiry: Final = keepalive_expiry
+        self._http2: Final = http2 and importlib.util.find_spec("h2") is not None
+        self._async_client: Optional["httpx.AsyncClient"] = None
+        self.timeout: Final = timeout
+        self.adapter: Final = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=max_retries,
+        )
+
+    def mount(self, session: Session) -> None:
+        """Make a session send its requests through the shared pool."""
+        session.mount("https://", self.adapter)
+        session.mount("http://", self.adapter)
+
+    def async_client(self) -> "httpx.AsyncClient":
+        """Get the httpx client shared by AsyncWithingsApi instances."""
+        if self._async_client is None:
+            # Imported here so httpx stays an optional dependency.
+            import httpx  # pylint: disable=import-outside-toplevel
+
+            timeout: Final = (
+                httpx.Timeout(None, connect=self.timeout[0], read=self.timeout[1])
+                if isinstance(self.timeout, tuple)
+                else self.timeout
+            )
+            self._async_client = httpx.AsyncClient(
+                http2=self._http2,
+                timeout=timeout,
+                limits=httpx.Limits(
+                    max_connections=self._pool_maxsize,
+                    max_keepalive_connections=self._pool_maxsize,
+                    keepalive_expiry=self._keepalive_expiry,
+                ),
+            )
+
+        return self._async_client
+
+    def close(self) -> None:
+        """Close the pooled connections of the sync sessions."""
+        self.adapter.close()
+
+    async def aclose(self) -> None:
+        """Close the shared httpx client."""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
@@ -0,0 +1,272 @@
+"""
+Receive Withings notifications and turn them into fetches.
+
+Withings calls the callback url given to notify_subscribe with a form
+encoded POST holding userid, appli and the dates that changed. The receiver
+here parses those calls, merges bursts for the same user and appli, and
+hands a FetchTask covering just the changed window to a dispatch callable,
+typically the put method of a worker queue.
+
+receiver = WebhookReceiver(work_queue.put, delay=10)
+app = receiver.wsgi        # or receiver.asgi
+
+while True:
+    task = work_queue.get()
+    items = task.run(api_for(task.userid))
+"""
+import threading
+import time
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+from urllib.parse import parse_qsl
+
+import arrow
+from arrow import Arrow
+from typing_extensions import Final
+
+from . import AbstractWithingsApi
+from .common import GetActivityField, GetSleepSummaryField, NotifyAppli, to_enum
+from .ratelimit import ClockType
+
+
+class Notification(NamedTuple):
+    """A notification sent by Withings."""
+
+    userid: int
+    appli: NotifyAppli
+    startdate: Arrow
+    enddate: Arrow
+
+
+class FetchTask(NamedTuple):
+    """The api call needed to get the data a notification is about."""
+
+    userid: int
+    appli: NotifyAppli
+    method: str
+    kwargs: Dict[str, Any]
+
+    def run(self, api: AbstractWithingsApi) -> Tuple[Any, ...]:
+        """Call the api and return the items of every page."""
+        return tuple(getattr(api, self.method)(**self.kwargs))
+
+
+def parse_notification(data: Mapping[str, str]) -> Notification:
+    """
+    Parse the form fields of a notification.
+
+    Activity notifications carry a date instead of a startdate and enddate.
+    Raises ValueError when a field is missing or malformed.
+    """
+    try:
+        userid: Final = int(data["userid"])
+        appli: Final = to_enum(NotifyAppli, int(data["appli"]), NotifyAppli.UNKNOWN)
+        if "startdate" in data:
+            startdate = arrow.get(int(data["startdate"]))
+            enddate = arrow.get(int(data.get("enddate", data["startdate"])))
+        else:
+            startdate = enddate = arrow.get(data["date"], "YYYY-MM-DD")
+    except (KeyError, TypeError, arrow.ParserError) as error:
+        raise ValueError("Invalid notification: %s" % error) from error
+
+    return Notification(
+        userid=userid,
+        appli=appli,
+        startdate=min(startdate, enddate),
+        enddate=max(startdate, enddate),
+    )
+
+
+def parse_notification_body(body: bytes) -> Notification:
+    """Parse the form encoded body of a notification."""
+    return parse_notification(dict(parse_qsl(body.decode("utf-8"))))
+
+
+def fetch_task(notification: Notification) -> Optional[FetchTask]:
+    """
+    Get the smallest fetch covering a notification.
+
+    Sleep and activity are fetched by day in the user's timezone, which is
+    not known here, so their window is widened by a day on each side.
+    Notifications without data to fetch, such as bed in and bed out, give None.
+    """
+    if notification.appli in (NotifyAppli.WEIGHT, NotifyAppli.CIRCULATORY):
+        return FetchTask(
+            notification.userid,
+            notification.appli,
+            "iter_measure_groups",
+            {
+                "startdate": notification.startdate,
+                "enddate": notification.enddate,
+                "lastupdate": None,
+            },
+        )
+
+    if notification.appli == NotifyAppli.ACTIVITY:
+        return FetchTask(
+            notification.userid,
+            notification.appli,
+            "iter_activities",
+            {
+                "data_fields": tuple(GetActivityField),
+                "startdateymd": notification.startdate.shift(days=-1),
+                "enddateymd": notification.enddate.shift(days=1),
+                "lastupdate": None,
+            },
+        )
+
+    if notification.appli == NotifyAppli.SLEEP:
+        return FetchTask(
+            notification.userid,
+            notification.appli,
+            "iter_sleep_summary_series",
+            {
+                "data_fields": tuple(GetSleepSummaryField),
+                "startdateymd": notification.startdate.shift(days=-1),
+                "enddateymd": notification.enddate.shift(days=1),
+                "lastupdate": None,
+            },
+        )
+
+    return None
+
+
+class _Pending:
+    """Notifications merged for one user and appli."""
+
+    def __init__(self, notification: Notification, received: float):
+        self.notification = notification
+        self.received = received
+
+
+class WebhookReceiver:
+    """
+    Coalesces notifications and dispatches fetch tasks.
+
+    Notifications for the same user and appli that arrive within delay
+    seconds of the first one are merged into one window, so a burst of
+    notifications becomes a single fetch. Tasks are dispatched by flush(),
+    which runs on every notification received and should also be called
+    periodically, for example from the worker loop, to send the last ones.
+    """
+
+    def __init__(
+        self,
+        dispatch: Callable[[FetchTask], Any],
+        delay: float = 0.0,
+        clock: ClockType = time.monotonic,
+    ):
+        """Initialize new object."""
+        self._dispatch: Final = dispatch
+        self._delay: Final = delay
+        self._clock: Final = clock
+        self._lock: Final = threading.Lock()
+        self._pending: Final[Dict[Tuple[int, NotifyAppli], _Pending]] = {}
+
+    def add(self, notification: Notification) -> None:
+        """Queue a notification, merging it with a pending one."""
+        key: Final = (notification.userid, notification.appli)
+        with self._lock:
+            pending: Final = self._pending.get(key)
+            if pending is None:
+                self._pending[key] = _Pending(notification, self._clock())
+                return
+
+            pending.notification = pending.notification._replace(
+                startdate=min(pending.notification.startdate, notification.startdate),
+                enddate=max(pending.notification.enddate, notification.enddate),
+            )
+
+    def flush(self, force: bool = False) -> int:
+        """Dispatch the tasks that waited long enough, or all when forced."""
+        now: Final = self._clock()
+        with self._lock:
+            ready: Final[List[Notification]] = [
+                pending.notification
+                for pending in self._pending.values()
+                if force or now - pending.received >= self._delay
+            ]
+            for notification in ready:
+                del self._pending[(notification.userid, notification.appli)]
+
+        tasks: Final = [fetch_task(notification) for notification in ready]
+        for task in tasks:
+            if task is not None:
+                self._dispatch(task)
+
+        return len(ready)
+
+    def receive(self, notification: Notification) -> None:
+        """Queue a notification and dispatch what is ready."""
+        self.add(notification)
+        self.flush()
+
+    def handle(self, data: Mapping[str, str]) -> Notification:
+        """Handle the form fields of a notification."""
+        notification: Final = parse_notification(data)
+        self.receive(notification)
+        return notification
+
+    def _handle_request(self, method: str, body: bytes) -> Tuple[str, bytes]:
+        # Withings checks the callback url with a HEAD request when subscribing.
+        if method in ("HEAD", "GET"):
+            return "200 OK", b""
+        if method != "POST":
+            return "405 Method Not Allowed", b""
+
+        try:
+            self.receive(parse_notification_body(body))
+        except (ValueError, UnicodeDecodeError):
+            return "400 Bad Request", b""
+
+        return "200 OK", b""
+
+    def wsgi(
+        self,
+        environ: Dict[str, Any],
+        start_response: Callable[[str, List[Tuple[str, str]]], Any],
+    ) -> Iterable[bytes]:
+        """WSGI application receiving the notifications."""
+        length: Final = int(environ.get("CONTENT_LENGTH") or 0)
+        body: Final = environ["wsgi.input"].read(length) if length else b""
+        status, content = self._handle_request(environ["REQUEST_METHOD"], body)
+
+        start_response(status, [("Content-Length", str(len(content)))])
+        return [content]
+
+    async def asgi(
+        self,
+        scope: Dict[str, Any],
+        receive: Callable[[], Awaitable[Dict[str, Any]]],
+        send: Callable[[Dict[str, Any]], Awaitable[None]],
+    ) -> None:
+        """ASGI application receiving the notifications."""
+        if scope["type"] != "http":
+            return
+
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body", False):
+                break
+
+        status, content = self._handle_request(scope["method"], body)
+        await send(
+            {
+                "type": "http.response.start",
+                "status": int(status.split(" ", 1)[0]),
+                "headers": [(b"content-length", str(len(content)).encode())],
+            }
+        )
+        await send({"type": "http.response.body", "body": content})
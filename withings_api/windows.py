@@ -0,0 +1,113 @@
+"""
+Splitting of long date ranges into windows an endpoint accepts.
+
+Some endpoints limit the range of a call, sleep get answers at most 24
+hours. plan_windows cuts a range into consecutive windows of at most a
+span, fetch_windows and async_fetch_windows call an endpoint for each of
+them concurrently and return the results in date order.
+
+windows = plan_windows(start, end, SLEEP_GET_MAX_SPAN)
+responses = fetch_windows(
+    lambda startdate, enddate: api.sleep_get(fields, startdate, enddate),
+    start,
+    end,
+    SLEEP_GET_MAX_SPAN,
+)
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, Iterable, List, Tuple, TypeVar
+
+import arrow
+from arrow import Arrow
+from typing_extensions import Final
+
+from .common import SleepGetResponse, SleepGetSerie, SleepModel
+from .params import DateType, resolve_date
+
+SLEEP_GET_MAX_SPAN: Final = 86400
+
+WindowType = Tuple[Arrow, Arrow]
+_ResultType = TypeVar("_ResultType")
+
+
+def plan_windows(startdate: DateType, enddate: DateType, span: int) -> List[WindowType]:
+    """
+    Cut startdate to enddate into consecutive windows of at most span seconds.
+
+    Each window starts where the previous one ends. There are no windows
+    when enddate is before startdate.
+    """
+    if span <= 0:
+        raise ValueError("span must be positive, got %s" % span)
+
+    start: Final = arrow.get(resolve_date(startdate))
+    end: Final = arrow.get(resolve_date(enddate))
+    windows: Final[List[WindowType]] = []
+    window_start = start
+    while True:
+        window_end = min(window_start.shift(seconds=span), end)
+        if window_end < window_start:
+            return windows
+
+        windows.append((window_start, window_end))
+        if window_end >= end:
+            return windows
+        window_start = window_end
+
+
+def fetch_windows(
+    fetch: Callable[[Arrow, Arrow], _ResultType],
+    startdate: DateType,
+    enddate: DateType,
+    span: int,
+    max_workers: int = 4,
+) -> List[_ResultType]:
+    """Call fetch for every window on a thread pool, results in window order."""
+    windows: Final = plan_windows(startdate, enddate, span)
+    if len(windows) <= 1 or max_workers <= 1:
+        return [fetch(*window) for window in windows]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(windows))) as executor:
+        return list(executor.map(lambda window: fetch(*window), windows))
+
+
+async def async_fetch_windows(
+    fetch: Callable[[Arrow, Arrow], Awaitable[_ResultType]],
+    startdate: DateType,
+    enddate: DateType,
+    span: int,
+    max_concurrency: int = 4,
+) -> List[_ResultType]:
+    """Await fetch for every window concurrently, results in window order."""
+    semaphore: Final = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def fetch_one(window: WindowType) -> _ResultType:
+        async with semaphore:
+            return await fetch(*window)
+
+    return list(
+        await asyncio.gather(
+            *(fetch_one(window) for window in plan_windows(startdate, enddate, span))
+        )
+    )
+
+
+def merge_sleep_get(responses: Iterable[SleepGetResponse]) -> SleepGetResponse:
+    """
+    Merge the responses of consecutive windows into one.
+
+    A serie overlapping two windows is returned for both, it is kept once.
+    """
+    responses_list: Final = list(responses)
+    series: Final[Dict[Tuple[int, int], SleepGetSerie]] = {}
+    for response in responses_list:
+        for serie in response.series:
+            series.setdefault(
+                (serie.startdate.int_timestamp, serie.enddate.int_timestamp), serie
+            )
+
+    return SleepGetResponse.construct(
+        model=responses_list[0].model if responses_list else SleepModel.UNKNOWN,
+        series=tuple(series[key] for key in sorted(series)),
+    )